@@ -0,0 +1,119 @@
+# admission.py
+# Controle de admissão para trabalho caro (LLM e Drive): limite global de concorrência,
+# limite por cliente e fila de espera limitada com timeout. Quem não cabe na fila (ou
+# estoura o timeout) recebe Overloaded -> 429 com Retry-After no service.
+# Os handlers do service são síncronos: cada vaga ocupada ou pedido na fila prende uma thread
+# do pool do AnyIO. Por isso concorrência + fila de LLM e Drive somadas (threads_needed())
+# ficam bem abaixo do pool (SERVICE_THREADS), que o service fixa no startup.
+
+from __future__ import annotations
+import os, threading, time
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+
+class Overloaded(Exception):
+    def __init__(self, limiter: str, reason: str, retry_after: int):
+        super().__init__(f"{limiter}: {reason}")
+        self.limiter = limiter
+        self.reason = reason
+        self.retry_after = retry_after
+
+class Limiter:
+    def __init__(self, name: str, max_concurrency: int = 8, per_client: int = 2,
+                 max_queue: int = 32, timeout: float = 30.0):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_client = max(1, per_client)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._running = 0
+        self._by_client: dict[str, int] = {}
+        self._waiting = 0
+        self._rejected = 0
+        self._held = deque(maxlen=256)  # quanto tempo os últimos slots ficaram ocupados
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "Limiter":
+        env = name.upper()
+        return cls(
+            name,
+            max_concurrency=int(os.getenv(f"{env}_MAX_CONCURRENCY", defaults.get("max_concurrency", 8))),
+            per_client=int(os.getenv(f"{env}_MAX_PER_CLIENT", defaults.get("per_client", 2))),
+            max_queue=int(os.getenv(f"{env}_MAX_QUEUE", defaults.get("max_queue", 32))),
+            timeout=float(os.getenv(f"{env}_QUEUE_TIMEOUT", defaults.get("timeout", 30.0))),
+        )
+
+    def _free(self, client: str) -> bool:
+        return self._running < self.max_concurrency and self._by_client.get(client, 0) < self.per_client
+
+    def _retry_after(self) -> int:
+        # estimativa: tempo médio de ocupação x (fila / vagas), no mínimo 1s
+        avg = sum(self._held) / len(self._held) if self._held else 1.0
+        return max(1, int(round(avg * (self._waiting + 1) / self.max_concurrency)))
+
+    def acquire(self, client: str, block: bool = False) -> float:
+        """
+        Ocupa uma vaga para `client`. Com block=True espera sem timeout nem limite de fila
+        (jobs em background). Retorna o instante em que a vaga foi obtida.
+        """
+        t0 = time.perf_counter()
+        with self._cond:
+            if not self._free(client):
+                if not block and self._waiting >= self.max_queue:
+                    self._rejected += 1
+                    raise Overloaded(self.name, "queue full", self._retry_after())
+                deadline = None if block else t0 + self.timeout
+                self._waiting += 1
+                try:
+                    while not self._free(client):
+                        remaining = None if deadline is None else deadline - time.perf_counter()
+                        if remaining is not None and remaining <= 0:
+                            self._rejected += 1
+                            raise Overloaded(self.name, "queue timeout", self._retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._running += 1
+            self._by_client[client] = self._by_client.get(client, 0) + 1
+        started = time.perf_counter()
+        metrics.observe(f"admission_wait_{self.name}", started - t0)
+        return started
+
+    def release(self, client: str, started: float) -> None:
+        with self._cond:
+            self._running -= 1
+            n = self._by_client.get(client, 1) - 1
+            if n:
+                self._by_client[client] = n
+            else:
+                self._by_client.pop(client, None)
+            self._held.append(time.perf_counter() - started)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, client: str, block: bool = False):
+        started = self.acquire(client, block=block)
+        try:
+            yield
+        finally:
+            self.release(client, started)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "running": self._running,
+                "waiting": self._waiting,
+                "rejected": self._rejected,
+                "clients": len(self._by_client),
+                "max_concurrency": self.max_concurrency,
+            }
+
+LLM = Limiter.from_env("llm", max_concurrency=8, per_client=2, max_queue=8, timeout=30.0)
+DRIVE = Limiter.from_env("drive", max_concurrency=4, per_client=1, max_queue=4, timeout=60.0)
+
+def threads_needed() -> int:
+    """Threads que LLM e Drive podem prender ao mesmo tempo (vagas + fila)."""
+    return sum(lim.max_concurrency + lim.max_queue for lim in (LLM, DRIVE))
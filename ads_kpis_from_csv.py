@@ -4,6 +4,9 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 
+import metrics
+from doc_meta import RAW_DIR, write_sidecar
+
 def read_csv_any(path: str) -> pd.DataFrame:
     # tenta , como decimal e ; como separador (Meta às vezes exporta assim)
     try:
@@ -61,8 +64,13 @@ def normalize_ads(df: pd.DataFrame, vendor: str) -> pd.DataFrame:
             raise SystemExit(f"[{vendor}] Nenhuma coluna de data encontrada.")
         month_series = df[c_month].astype(str).str.strip()
     else:
-        # tenta parse de data
-        s = pd.to_datetime(df[c_date], errors="coerce", dayfirst=True, utc=False)
+        # tenta parse de data; AAAA-MM-DD explícito primeiro: com dayfirst o pandas inferia o
+        # formato pela 1ª linha e "2025-01-12" podia virar dezembro (varia de bloco para bloco)
+        raw = df[c_date].astype(str).str.strip()
+        iso = raw.str.match(r"^\d{4}-\d{2}-\d{2}")
+        s = pd.to_datetime(raw.where(iso).str[:10], errors="coerce", format="%Y-%m-%d")
+        if not iso.all():
+            s = s.fillna(pd.to_datetime(df[c_date].where(~iso), errors="coerce", dayfirst=True, utc=False))
         # se falhar, tenta YYYY-MM-DD literal
         bad = s.isna()
         if bad.any():
@@ -116,44 +124,75 @@ def summarize(df_all: pd.DataFrame, client: str) -> tuple[pd.DataFrame, str]:
     txt = "\n".join(lines)
     return grp, txt
 
-def main():
-    ap = argparse.ArgumentParser(description="Gera KPIs de Ads (Google/Meta) a partir de CSV e grava um _kpis.txt para o RAG.")
-    ap.add_argument("--client", required=True, help='Ex.: "Start TI"')
-    ap.add_argument("--google_csv", help="Caminho do CSV exportado do Google Ads")
-    ap.add_argument("--meta_csv", help="Caminho do CSV exportado do Meta Ads (Facebook/Instagram)")
-    ap.add_argument("--out", default=None, help="Caminho de saída do TXT (opcional)")
-    args = ap.parse_args()
-
-    if not args.google_csv and not args.meta_csv:
+def build_kpis(client: str, google_csv: str | None = None, meta_csv: str | None = None,
+               out: str | None = None) -> tuple[str, str]:
+    """Consolida os CSVs de Ads e grava o .csv derivado + o _kpis.txt do RAG. Retorna (csv_out, txt_out)."""
+    if not google_csv and not meta_csv:
         raise SystemExit("Informe ao menos um CSV: --google_csv e/ou --meta_csv")
 
+    with metrics.span("ads_kpis"):
+        return _build_kpis(client, google_csv, meta_csv, out)
+
+def _build_kpis(client: str, google_csv: str | None, meta_csv: str | None, out: str | None) -> tuple[str, str]:
     frames = []
-    if args.google_csv:
-        g = read_csv_any(args.google_csv)
+    if google_csv:
+        g = read_csv_any(google_csv)
         frames.append(normalize_ads(g, "Google Ads"))
-    if args.meta_csv:
-        m = read_csv_any(args.meta_csv)
+    if meta_csv:
+        m = read_csv_any(meta_csv)
         frames.append(normalize_ads(m, "Meta Ads"))
-
+    return write_kpis(client, frames, out)
+
+SUM_COLS = {"impressions":"sum","clicks":"sum","cost":"sum","conversions":"sum"}
+
+def aggregate_chunks(chunks, vendor: str) -> pd.DataFrame:
+    """
+    Normaliza e agrega por (mês, vendor) bloco a bloco (ex.: pd.read_csv(..., chunksize=N)),
+    então a memória depende do nº de meses, não do tamanho do export.
+    """
+    partials = []
+    for df in chunks:
+        norm = normalize_ads(df, vendor)
+        if not norm.empty:
+            partials.append(norm.groupby(["month","vendor"], as_index=False).agg(SUM_COLS))
+    if not partials:
+        return pd.DataFrame(columns=["month","vendor", *SUM_COLS])
+    return pd.concat(partials, ignore_index=True).groupby(["month","vendor"], as_index=False).agg(SUM_COLS)
+
+def write_kpis(client: str, frames: list[pd.DataFrame], out: str | None = None) -> tuple[str, str]:
+    """Consolida frames normalizados (ou já agregados) e grava o .csv derivado + o _kpis.txt."""
     df_all = pd.concat(frames, ignore_index=True).dropna(how="all")
     if df_all.empty:
         raise SystemExit("Nada para consolidar. Verifique os CSVs.")
 
-    grp, txt = summarize(df_all, args.client)
+    grp, txt = summarize(df_all, client)
 
     os.makedirs("data/derived", exist_ok=True)
-    os.makedirs("data/raw", exist_ok=True)
-    csv_out = os.path.join("data","derived", f"ads_kpis_{re.sub(r'\\W+','_',args.client)}.csv")
+    os.makedirs(RAW_DIR, exist_ok=True)
+    client_key = re.sub(r"\W+", "_", client)
+    csv_out = os.path.join("data","derived", f"ads_kpis_{client_key}.csv")
     grp.to_csv(csv_out, index=False)
 
-    out_path = args.out or os.path.join("data","raw", f"ads_kpis_{re.sub(r'\\W+','_',args.client)}.txt")
+    out_path = out or os.path.join(RAW_DIR, f"ads_kpis_{client_key}.txt")
     with open(out_path, "w", encoding="utf-8") as f:
         f.write(txt)
+    write_sidecar(out_path, client, "kpis", datetime.now().date().isoformat())
+    return csv_out, out_path
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera KPIs de Ads (Google/Meta) a partir de CSV e grava um _kpis.txt para o RAG.")
+    ap.add_argument("--client", required=True, help='Ex.: "Start TI"')
+    ap.add_argument("--google_csv", help="Caminho do CSV exportado do Google Ads")
+    ap.add_argument("--meta_csv", help="Caminho do CSV exportado do Meta Ads (Facebook/Instagram)")
+    ap.add_argument("--out", default=None, help="Caminho de saída do TXT (opcional)")
+    args = ap.parse_args()
+
+    csv_out, out_path = build_kpis(args.client, args.google_csv, args.meta_csv, args.out)
 
     print("Gerado:")
     print(" -", csv_out)
     print(" -", out_path)
-    print("Dica: rode  python .\\ingest_txt.py  para o RAG usar estes KPIs.")
+    print("O daemon de ingestão (ingest_watch) indexa estes KPIs; sem ele: python ingest_watch.py --sync")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,111 @@
+# ads_stream.py
+# Busca os CSVs de Ads (Google/Meta) por URL em paralelo, com conexões em pool, timeout
+# e tamanho máximo, e alimenta o normalizador de KPIs direto do stream HTTP em blocos:
+# nada é copiado para arquivo temporário e o export nunca fica inteiro na memória.
+
+from __future__ import annotations
+import contextvars, io, os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import urllib3
+
+import metrics
+from ads_kpis_from_csv import aggregate_chunks, write_kpis
+
+CONNECT_TIMEOUT = float(os.getenv("ADS_CSV_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("ADS_CSV_READ_TIMEOUT", "60"))
+MAX_BYTES = int(os.getenv("ADS_CSV_MAX_MB", "512")) * 1024 * 1024
+CHUNK_ROWS = int(os.getenv("ADS_CSV_CHUNK_ROWS", "50000"))
+SNIFF_BYTES = 64 * 1024
+
+_pool = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=8,
+    timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+    retries=urllib3.Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504)),
+)
+
+class CsvFetchError(Exception):
+    pass
+
+class CsvTooLarge(CsvFetchError):
+    pass
+
+class _LimitedStream(io.RawIOBase):
+    """Stream só-leitura: devolve o prefixo já lido e depois o resto da resposta, até max_bytes."""
+
+    def __init__(self, prefix: bytes, resp, max_bytes: int):
+        self._prefix = memoryview(prefix)
+        self._resp = resp
+        self._max = max_bytes
+        self._read = len(prefix)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._prefix:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._resp.read(len(b))
+        self._read += len(data)
+        if self._read > self._max:
+            raise CsvTooLarge(f"CSV excede o limite de {self._max // (1024 * 1024)} MB")
+        b[:len(data)] = data
+        return len(data)
+
+def sniff(prefix: bytes) -> tuple[str, str]:
+    """Detecta (separador, encoding) pelo começo do arquivo (Meta às vezes exporta com ';' e latin-1)."""
+    try:
+        text = prefix.decode("utf-8")
+        enc = "utf-8"
+    except UnicodeDecodeError as e:
+        # corte no meio de um caractere multibyte no fim do prefixo ainda é utf-8
+        if e.start >= len(prefix) - 3:
+            text, enc = prefix[: e.start].decode("utf-8"), "utf-8"
+        else:
+            text, enc = prefix.decode("latin-1"), "latin-1"
+    if enc == "utf-8" and text.startswith("\ufeff"):
+        enc = "utf-8-sig"  # BOM do Excel: sem isso a 1ª coluna vira "\ufeffDate"
+    header = text.lstrip("\ufeff").splitlines()[0] if text.strip() else ""
+    sep = ";" if header.count(";") > header.count(",") else ","
+    return sep, enc
+
+def fetch_and_aggregate(url: str, vendor: str, max_bytes: int = MAX_BYTES) -> pd.DataFrame:
+    """Baixa o CSV em stream e devolve os KPIs agregados por (mês, vendor)."""
+    with metrics.span("csv_download"):
+        try:
+            resp = _pool.request("GET", url, preload_content=False)
+        except urllib3.exceptions.HTTPError as e:
+            raise CsvFetchError(f"{vendor}: {e}") from e
+        try:
+            if resp.status >= 400:
+                raise CsvFetchError(f"{vendor}: HTTP {resp.status} ao baixar o CSV")
+            length = resp.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise CsvTooLarge(f"{vendor}: CSV de {int(length)} bytes excede o limite")
+            prefix = resp.read(SNIFF_BYTES)
+            sep, enc = sniff(prefix)
+            stream = io.BufferedReader(_LimitedStream(prefix, resp, max_bytes), buffer_size=1024 * 1024)
+            chunks = pd.read_csv(stream, sep=sep, encoding=enc, chunksize=CHUNK_ROWS)
+            return aggregate_chunks(chunks, vendor)
+        except urllib3.exceptions.HTTPError as e:  # timeout/queda no meio do download
+            raise CsvFetchError(f"{vendor}: {e}") from e
+        finally:
+            resp.release_conn()
+
+def build_kpis_from_urls(client: str, google_url: str | None = None, meta_url: str | None = None,
+                         out: str | None = None) -> tuple[str, str]:
+    """Baixa e agrega Google e Meta em paralelo e grava os KPIs (mesma saída do ads_kpis_from_csv)."""
+    jobs = [(u, v) for u, v in ((google_url, "Google Ads"), (meta_url, "Meta Ads")) if u]
+    if not jobs:
+        raise SystemExit("Informe ao menos uma URL de CSV (Google e/ou Meta)")
+    with ThreadPoolExecutor(max_workers=len(jobs)) as ex:
+        # copia o contexto para os spans saírem com o endpoint/cliente da requisição
+        futs = [ex.submit(contextvars.copy_context().run, fetch_and_aggregate, u, v) for u, v in jobs]
+        frames = [f.result() for f in futs]
+    with metrics.span("ads_kpis"):
+        return write_kpis(client, frames, out)
@@ -108,7 +108,7 @@ def analyze_matrix(path: str, sheet: str):
         print(pivot.head(8))
 
     print(f"\nArquivos gerados:\n- {out_csv}\n- {rag_txt}")
-    print("Dica: para o RAG considerar estes KPIs, rode depois:  python .\\ingest_txt.py")
+    print("O daemon de ingestão (ingest_watch) indexa estes KPIs; sem ele:  python ingest_watch.py --sync")
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
@@ -101,7 +101,7 @@ def main(path: str):
             ftxt.write("POR MÊS\n")
             monthly.to_csv(ftxt, index=False)
     print(f"\nArquivos gerados:\n- {out_csv}\n- {rag_txt}")
-    print("\nDica: para o RAG ver essas métricas, rode depois:  python .\\ingest_txt.py")
+    print("\nO daemon de ingestão (ingest_watch) indexa essas métricas; sem ele:  python ingest_watch.py --sync")
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
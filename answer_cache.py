@@ -0,0 +1,134 @@
+# answer_cache.py
+# Cache de respostas do /chat na frente do ask(): chave = pergunta normalizada + cliente
+# resolvido + take + versão do corpus (um ingest muda a versão e invalida tudo sozinho).
+# Despejo LRU + TTL, limite de memória em bytes, persistência opcional em disco e contadores.
+
+from __future__ import annotations
+import hashlib, json, os, re, threading, time, unicodedata
+from collections import OrderedDict
+
+def normalize_question(q: str) -> str:
+    """Minúsculas, sem acentos, sem pontuação nas pontas e com espaços colapsados."""
+    s = unicodedata.normalize("NFKD", q or "")
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    s = re.sub(r"\s+", " ", s).strip()
+    return s.strip(" ?!.,;:")
+
+def cache_key(q: str, client: str, version: int, k: int | None = None) -> str:
+    raw = f"{client}\x1f{version}\x1f{k or ''}\x1f{normalize_question(q)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 6 * 3600,
+        path: str | None = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, tuple[dict, int, float]]" = OrderedDict()  # key -> (valor, bytes, expira_em)
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = self.expired = 0
+        if path:
+            self.load()
+
+    @classmethod
+    def from_env(cls) -> "AnswerCache":
+        return cls(
+            max_entries=int(os.getenv("ANSWER_CACHE_ENTRIES", "1000")),
+            max_bytes=int(os.getenv("ANSWER_CACHE_MB", "16")) * 1024 * 1024,
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", str(6 * 3600))),
+            path=os.getenv("ANSWER_CACHE_PATH") or None,
+        )
+
+    @staticmethod
+    def _size(key: str, value: dict) -> int:
+        return len(key) + len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, size, exp = item
+            if exp < now:
+                self._drop(key)
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: dict) -> None:
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, size, time.time() + self.ttl)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+    # -------- persistência opcional (JSON; entradas expiradas são descartadas ao carregar) --------
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            rows = [[k, v, exp] for k, (v, _, exp) in self._data.items()]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self._lock:
+            for k, v, exp in rows:
+                if exp < now:
+                    continue
+                size = self._size(k, v)
+                self._data[k] = (v, size, exp)
+                self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._data)))
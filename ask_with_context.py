@@ -1,45 +1,130 @@
 from __future__ import annotations
-import argparse, os
-
-# Chroma compat
-try:
-    from chromadb import PersistentClient
-    client = PersistentClient(path=".chromadb")
-except Exception:
-    from chromadb import Client
-    from chromadb.config import Settings
-    client = Client(Settings(persist_directory=".chromadb"))
-
-import google.generativeai as genai
+import argparse, contextvars, json, os, sqlite3, sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from dotenv import load_dotenv
 
+import metrics
+import prompt_cache
+from bm25_index import get_index
+from client_matcher import slugify
+from context_packer import assemble, budget_for, label, record
+from doc_meta import where_for
+from llm_client import MODEL_NAME, get_client
+from near_dup import dedupe, estimate_tokens
+from vectorstore import get_store
+
 load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise SystemExit("Defina GOOGLE_API_KEY no .env")
-genai.configure(api_key=api_key)
 
-col = client.get_or_create_collection("workspace_knowledge")
+DEDUP = os.getenv("RETRIEVE_DEDUP", "1") == "1"
+OVERFETCH = int(os.getenv("RETRIEVE_OVERFETCH", "2"))  # busca k*N e preenche as k vagas sem repetição
+HYBRID = os.getenv("RETRIEVE_HYBRID", "1") == "1"      # BM25 + vetorial fundidos por RRF
+RRF_K = 60
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # chamadas ao LLM em paralelo no modo lote
+
+_lex_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+
+def rrf(rankings: list[list[str]], k: int = RRF_K) -> list[str]:
+    """Reciprocal rank fusion: cada lista soma 1/(k + posição) ao id; empate fica com a 1ª lista."""
+    score: dict[str, float] = {}
+    for ranking in rankings:
+        for pos, cid in enumerate(ranking, 1):
+            score[cid] = score.get(cid, 0.0) + 1.0 / (k + pos)
+    return sorted(score, key=score.get, reverse=True)
 
-def ask(q: str, k: int = 4) -> str:
-    hits = col.query(query_texts=[q], n_results=k)
+def _lexical(store, q: str, n: int, where: dict | None) -> list[str]:
+    idx = get_index(store)
+    if idx is None:
+        return []
+    try:
+        with metrics.span("bm25_query"):
+            return [cid for cid, _ in idx.search(q, n, where)]
+    except sqlite3.Error:
+        return []  # índice lexical indisponível (ex.: sendo recriado): fica só a busca vetorial
+
+def _fuse(store, ids: list[str], docs: list[str], metas: list[dict], lex_ids: list[str], n: int):
+    """Ordem do RRF; chunks que só o BM25 achou vêm do Chroma por id."""
+    order = rrf([ids, lex_ids])[:n]
+    found = {c: (d, m) for c, d, m in zip(ids, docs, metas)}
+    missing = [c for c in order if c not in found]
+    if missing:
+        with store.read() as col:
+            got = col.get(ids=missing, include=["documents", "metadatas"])
+        found.update({c: (d, m) for c, d, m in zip(got["ids"], got["documents"], got["metadatas"])})
+    order = [c for c in order if c in found]  # id no BM25 que já saiu do Chroma: ignora
+    return order, [found[c][0] for c in order], [found[c][1] for c in order]
+
+def _finish(store, ids: list[str], docs: list[str], metas: list[dict], lex_ids: list[str], n: int, k: int):
+    """Fusão com o BM25 (se houver) + dedupe dos candidatos de uma pergunta."""
+    if lex_ids:
+        ids, docs, metas = _fuse(store, ids, docs, metas, lex_ids, n)
+    if DEDUP:
+        with metrics.span("dedup"):
+            docs, metas = dedupe(docs, metas, k)
+    return docs, metas
+
+def retrieve(q: str, k: int = 4, client: str | None = None, doc_type: str | None = None,
+             since: str | None = None) -> tuple[list[str], list[dict]]:
+    """
+    Busca os k chunks mais próximos entre os do cliente (slug) + os compartilhados da org,
+    opcionalmente só de um tipo/a partir de uma data. Com RETRIEVE_HYBRID=1 o índice BM25
+    roda em paralelo com a busca vetorial e as duas listas são fundidas por RRF. Com
+    RETRIEVE_DEDUP=1, trechos quase iguais a um mais relevante saem e as vagas vão para
+    os próximos. Retorna (docs, metas).
+    """
+    where = where_for(client, doc_type, since)
+    n = k * max(1, OVERFETCH) if DEDUP else k
+    store = get_store()
+    lex = _lex_pool.submit(contextvars.copy_context().run, _lexical, store, q, n, where) if HYBRID else None
+    with metrics.span("chroma_query"):
+        if where is None:
+            hits = store.query(query_texts=[q], n_results=n)
+        else:
+            hits = store.query(query_texts=[q], n_results=n, where=where)
+    ids = hits.get("ids", [[]])[0]
     docs = hits.get("documents", [[]])[0]
     metas = hits.get("metadatas", [[]])[0]
+    return _finish(store, ids, docs, metas, lex.result() if lex is not None else [], n, k)
 
-    contexto = []
-    cites = []
-    for d, m in zip(docs, metas):
-        src = os.path.basename(m.get("source",""))
-        ch = m.get("chunk","?")
-        contexto.append(f"[{src} | chunk {ch}]\n{d}\n")
-        cites.append(f"[{src} | chunk {ch}]")
-    ctx = "\n\n".join(contexto) if contexto else "[sem contexto]"
+def retrieve_many(items: list[dict], k: int = 4) -> list[tuple[list[str], list[dict]]]:
+    """
+    retrieve() de um lote de perguntas ({"q", "client", "doc_type", "since"}): todas embedadas
+    num lote só e uma consulta vetorizada ao Chroma por filtro distinto (o `where` vale para a
+    chamada inteira: N perguntas de um cliente = 1 consulta). Mesma ordem da entrada.
+    """
+    if not items:
+        return []
+    n = k * max(1, OVERFETCH) if DEDUP else k
+    store = get_store()
+    texts = [it["q"] for it in items]
+    wheres = [where_for(it.get("client"), it.get("doc_type"), it.get("since")) for it in items]
+    lex = [_lex_pool.submit(contextvars.copy_context().run, _lexical, store, q, n, w)
+           for q, w in zip(texts, wheres)] if HYBRID else None
 
-    prompt = f"""Responda de forma objetiva usando apenas o contexto abaixo. 
-Se a resposta não estiver no contexto, diga que não há informação suficiente.
-Mostre no final as fontes entre colchetes.
+    with store.read() as col:
+        embed = store.embedder(col)
+    vecs = None
+    if embed is not None:
+        with metrics.span("embed_query"):
+            vecs = list(embed(texts))
+    groups: dict[str, list[int]] = {}
+    for i, w in enumerate(wheres):
+        groups.setdefault(json.dumps(w, sort_keys=True), []).append(i)
+    hits: list = [None] * len(items)
+    for idx in groups.values():
+        kw = ({"query_embeddings": [vecs[i] for i in idx]} if vecs is not None
+              else {"query_texts": [texts[i] for i in idx]})
+        if wheres[idx[0]] is not None:
+            kw["where"] = wheres[idx[0]]
+        with metrics.span("chroma_query"):
+            got = store.query(n_results=n, **kw)
+        for j, i in enumerate(idx):
+            hits[i] = (got["ids"][j], got["documents"][j], got["metadatas"][j])
+    return [_finish(store, *hits[i], lex[i].result() if lex else [], n, k) for i in range(len(items))]
 
-Contexto:
+# parte variável do prompt; a parte fixa do cliente (instruções, regras, KPIs) vem de prompt_cache
+SUFFIX = """Contexto:
 {ctx}
 
 Pergunta:
@@ -47,15 +132,173 @@ Pergunta:
 
 Responda:"""
 
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    resp = model.generate_content(prompt)
-    ans = resp.text.strip()
+def build_prompt(q: str, docs: list[str], metas: list[dict], model: str = MODEL_NAME,
+                 usage: dict | None = None, prefix: str | None = None,
+                 exclude: str | None = None) -> tuple[str, list[str]]:
+    """
+    Monta o prompt: prefixo estático (prompt_cache.static_prefix; padrão: o sem cliente) +
+    contexto recuperado (context_packer: chunks vizinhos do mesmo arquivo fundidos sem o
+    overlap, passagens por relevância até o orçamento do modelo, que vale para contexto e
+    pergunta; o prefixo tem o seu, PROMPT_PREFIX_BUDGET) + pergunta. Chunks do arquivo
+    `exclude` (os KPIs que já estão no prefixo) ficam fora do contexto.
+    Retorna (prompt, citações); `usage`, se passado, recebe os tokens do prompt e os
+    contadores do empacotamento.
+    """
+    if prefix is None:
+        prefix, _ = prompt_cache.static_prefix(None)
+    if exclude:
+        name = os.path.basename(exclude)
+        kept = [(d, m) for d, m in zip(docs, metas) if os.path.basename(m.get("source", "")) != name]
+        docs, metas = [d for d, _ in kept], [m for _, m in kept]
+    reserved = estimate_tokens(SUFFIX.format(ctx="", q=q))  # o prefixo tem orçamento próprio (prompt_cache)
+    chosen, info = assemble(docs, metas, budget_for(model), reserved)
+    ctx = "\n\n".join(text + "\n" for _, text in chosen) if chosen else "[sem contexto]"
+    prompt = prefix + SUFFIX.format(ctx=ctx, q=q)
+    if usage is not None:
+        # referência: os chunks colados na íntegra, um a um, como antes do empacotamento
+        verbatim = "\n\n".join(f"[{os.path.basename(m.get('source', ''))} | chunk {m.get('chunk', '?')}]\n{d}\n"
+                               for d, m in zip(docs, metas))
+        usage.update(info, model=model, prompt_tokens=estimate_tokens(prompt), prefix_tokens=estimate_tokens(prefix),
+                     verbatim_tokens=estimate_tokens(prefix + SUFFIX.format(ctx=verbatim or "[sem contexto]", q=q)))
+    return prompt, [label(p) for p, _ in chosen]
+
+def _prompt(q: str, docs: list[str], metas: list[dict], client: str | None, usage: dict) -> tuple[str, list[str], str]:
+    """
+    Prompt com o prefixo do cliente; contabiliza os tokens e guarda as citações em
+    usage["sources"]. Retorna (prompt, citações, prefixo).
+    """
+    prefix, kpis = prompt_cache.static_prefix(client)
+    prompt, cites = build_prompt(q, docs, metas, usage=usage, prefix=prefix, exclude=kpis)
+    usage["sources"] = cites
+    record(usage)
+    return prompt, cites, prefix
+
+def ask(q: str, k: int = 4, client: str | None = None, doc_type: str | None = None,
+        since: str | None = None, usage: dict | None = None) -> str:
+    """
+    Responde via RAG; `usage` (opcional) recebe os tokens do prompt (ver build_prompt) e as
+    citações usadas em "sources".
+    """
+    docs, metas = retrieve(q, k, client, doc_type, since)
+    usage = {} if usage is None else usage
+    prompt, cites, prefix = _prompt(q, docs, metas, client, usage)
+    return _answer(prompt, cites, prefix, client)
+
+def _answer(prompt: str, cites: list[str], prefix: str = "", client: str | None = None) -> str:
+    ans = prompt_cache.generate(get_client(), prompt, prefix, client)["text"].strip()
     if cites:
         ans += "\n\nFontes: " + " | ".join(cites)
     return ans
 
+def ask_many(items: list[dict], k: int = 4, concurrency: int = BATCH_CONCURRENCY):
+    """
+    Lote de perguntas ({"q", "client", "doc_type", "since"}): uma busca vetorizada para todas
+    (retrieve_many) e as chamadas ao LLM em paralelo, no máximo `concurrency` ao mesmo tempo.
+    Gera (índice, resposta, usage) na ordem em que terminam; se a chamada falhou, a resposta
+    é a exceção (as outras seguem).
+    """
+    get_client()  # sem GOOGLE_API_KEY falha aqui, antes de buscar o lote
+    prompts = []
+    for it, (docs, metas) in zip(items, retrieve_many(items, k)):
+        usage: dict = {}
+        prompt, cites, prefix = _prompt(it["q"], docs, metas, it.get("client"), usage)
+        prompts.append((prompt, cites, usage, prefix, it.get("client")))
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="llm") as pool:
+        futures = {pool.submit(contextvars.copy_context().run, _answer, p, c, pre, cl): i
+                   for i, (p, c, _, pre, cl) in enumerate(prompts)}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                ans = fut.result()
+            except Exception as e:
+                ans = e
+            yield i, ans, prompts[i][2]
+
+def read_batch(path: str) -> list[dict]:
+    """JSONL de perguntas: {"question" (ou "q"), "client"?, "out"?, "type"?, "since"?} por linha (cliente vira slug)."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                q = (row.get("question") or row.get("q") or "").strip()
+            except (ValueError, AttributeError):
+                raise SystemExit(f"{path}:{n}: linha não é um objeto JSON")
+            if not q:
+                raise SystemExit(f"{path}:{n}: pergunta vazia")
+            client = row.get("client")
+            items.append({**row, "q": q, "client": slugify(client) if client else None,
+                          "doc_type": row.get("doc_type") or row.get("type")})
+    return items
+
+def ask_stream(q: str, k: int = 4, client: str | None = None, usage: dict | None = None):
+    """
+    Versão em streaming de ask(): gera ("sources", [citações]) logo após a busca,
+    depois ("token", texto) conforme o Gemini produz e, no fim, ("done", resposta completa).
+    """
+    docs, metas = retrieve(q, k, client)
+    usage = {} if usage is None else usage
+    prompt, cites, prefix = _prompt(q, docs, metas, client, usage)
+    yield "sources", cites
+
+    parts = []
+    for text in prompt_cache.stream(get_client(), prompt, prefix, client):
+        parts.append(text)
+        yield "token", text
+
+    ans = "".join(parts).strip()
+    if cites:
+        ans += "\n\nFontes: " + " | ".join(cites)
+    yield "done", ans
+
+def _save(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def run_batch(path: str, k: int = 4, concurrency: int = BATCH_CONCURRENCY) -> int:
+    """
+    Responde o JSONL de perguntas (read_batch). Cada resposta vai para o "out" da linha assim
+    que fica pronta; sem "out", sai no stdout como uma linha JSON. Retorna o nº de falhas.
+    """
+    items = read_batch(path)
+    failed = 0
+    for i, ans, usage in ask_many(items, k, concurrency):
+        it = items[i]
+        if isinstance(ans, Exception):
+            failed += 1
+            print(f"[ERRO] linha {i + 1} ({it.get('client') or '-'}): {ans}", file=sys.stderr)
+            continue
+        if it.get("out"):
+            _save(it["out"], ans)
+            print(f"linha {i + 1}: {it['out']} ({usage['prompt_tokens']} tokens de prompt)", file=sys.stderr)
+        else:
+            print(json.dumps({"line": i + 1, "client": it.get("client"), "question": it["q"], "reply": ans,
+                              "prompt_tokens": usage["prompt_tokens"]}, ensure_ascii=False), flush=True)
+    return failed
+
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
-    ap.add_argument("--q", required=True, help="Pergunta")
+    mode = ap.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--q", help="Pergunta")
+    mode.add_argument("--batch", help="JSONL com {question, client?, out?} por linha: busca em lote + LLM em paralelo")
+    ap.add_argument("--take", type=int, default=4, help="Quantidade de chunks de contexto")
+    ap.add_argument("--client", help="Cliente (slug) para filtrar o contexto")
+    ap.add_argument("--type", dest="doc_type", help="Só chunks deste tipo (daily, weekly, checkin, kpis...)")
+    ap.add_argument("--since", help="Só documentos a partir desta data (AAAA-MM-DD)")
+    ap.add_argument("--out", help="Se informado, salva a resposta neste arquivo")
+    ap.add_argument("--usage", action="store_true", help="Mostra os tokens do prompt no stderr")
+    ap.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Chamadas ao LLM em paralelo (--batch)")
     args = ap.parse_args()
-    print(ask(args.q))
+    if args.batch:
+        sys.exit(1 if run_batch(args.batch, k=args.take, concurrency=args.concurrency) else 0)
+    usage: dict = {}
+    ans = ask(args.q, k=args.take, client=args.client, doc_type=args.doc_type, since=args.since, usage=usage)
+    if args.usage:
+        print(f"prompt: {usage['prompt_tokens']} tokens (verbatim {usage['verbatim_tokens']}), "
+              f"{usage['chunks']} chunk(s) -> {usage['passages']} passagem(ns)", file=sys.stderr)
+    if args.out:
+        _save(args.out, ans)
+    print(ans)
@@ -1,9 +1,17 @@
 # assistant_cli.py
 from __future__ import annotations
-import argparse, os, re, subprocess, sys, glob, shutil
+import argparse, os, re, glob, shutil, time
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 
-PY   = sys.executable
+from ads_kpis_from_csv import build_kpis
+from ask_with_context import ask
+from doc_meta import RAW_DIR
+from ingest_watch import ensure_ingested
+from report_exec import write_report
+from report_registry import get_registry, new_run_id
+from smart_search_sa import search_and_export
+
 ROOT = os.getenv("APP_ROOT", os.getcwd())
 
 TYPES = {
@@ -29,119 +37,140 @@ def wants_ads(q: str) -> bool:
     ql = q.lower()
     return any(k in ql for k in ADS_HINTS)
 
-def run(cmd: list[str], allow_fail: bool = False) -> int:
-    print(">>", " ".join(cmd), flush=True)
-    p = subprocess.run(cmd, cwd=ROOT)
-    if p.returncode != 0 and not allow_fail:
-        raise subprocess.CalledProcessError(p.returncode, cmd)
-    return p.returncode
-
 def slugify(name: str) -> str:
     slug = re.sub(r"\W+", "_", name, flags=re.UNICODE).strip("_").lower()
     return slug or "cliente"
 
-def paths_for(client_slug: str) -> tuple[str, str]:
+def paths_for(client_slug: str, run_id: str | None = None) -> tuple[str, str]:
     rep_dir = os.path.join(ROOT, "reports", client_slug)
     os.makedirs(rep_dir, exist_ok=True)
     ts = datetime.now().strftime("%Y%m%d-%H%M")
-    ts_path = os.path.join(rep_dir, f"relatorio-{ts}.md")
+    # o run_id no nome evita que dois runs no mesmo minuto sobrescrevam o mesmo arquivo
+    suffix = f"-{run_id}" if run_id else ""
+    ts_path = os.path.join(rep_dir, f"relatorio-{ts}{suffix}.md")
     latest_path = os.path.join(rep_dir, "relatorio.md")
     return ts_path, latest_path
 
-def main():
-    ap = argparse.ArgumentParser(description="Agente de Dados (router)")
-    ap.add_argument("--client", required=True, help='Ex.: "Start TI"')
-    ap.add_argument("--rules", default="company_rules.json")
-    ap.add_argument("--q", required=True, help="Pergunta em linguagem natural")
-    ap.add_argument("--take", default="1")
-    ap.add_argument("--type", dest="type", help="Força o tipo: chat, weekly, replanejamento, etc.")
-    # opcionais de Ads
-    ap.add_argument("--google_csv")
-    ap.add_argument("--meta_csv")
-    args = ap.parse_args()
+def write_answer(prompt: str, out_path: str, client: str | None = None) -> str:
+    """Gera o relatório; se o report_exec falhar, salva a resposta crua do RAG."""
+    try:
+        return write_report(prompt, out_path, client=client)
+    except Exception:
+        # fallback alternativo caso report_exec exija contexto
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(ask(prompt, client=client))
+        return out_path
+
+@contextmanager
+def timed(timings: dict, name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - t0, 3)
 
-    client_slug = slugify(args.client)
-    ts_path, latest_path = paths_for(client_slug)
+def copy_latest(ts_path: str, latest_path: str, log=print) -> None:
+    try:
+        shutil.copyfile(ts_path, latest_path)
+    except Exception as e:
+        log(f"[warn] não consegui copiar para {latest_path}: {e}")
+
+def run_pipeline(
+    client: str,
+    q: str,
+    take: int | str = 1,
+    doc_type: str | None = None,
+    google_csv: str | None = None,
+    meta_csv: str | None = None,
+    rules: str = "company_rules.json",
+    run_id: str | None = None,
+    log=print,
+    gate=None,
+) -> dict:
+    """
+    Executa o roteador inteiro no processo atual (KPIs -> busca -> ingest -> relatório)
+    e registra o relatório no manifest. Retorna {"id", "type", "report_path", "latest_path", "timings"}.
+    `gate(fase)` (service: vagas de admission) envolve a busca+ingest ("drive") e a geração
+    do relatório ("llm"), uma de cada vez; a recusa de uma vaga sobe sem fallback.
+    """
+    gate = gate or (lambda phase: nullcontext())
+    run_id = run_id or new_run_id()
+    client_slug = slugify(client)
+    ts_path, latest_path = paths_for(client_slug, run_id)
+    timings: dict[str, float] = {}
+    t_start = time.perf_counter()
 
     # 0) Se vierem CSVs de Ads, gera o _kpis.txt antes de tudo
-    if args.google_csv or args.meta_csv:
-        cmd = [PY, "ads_kpis_from_csv.py", "--client", args.client]
-        if args.google_csv: cmd += ["--google_csv", args.google_csv]
-        if args.meta_csv:   cmd += ["--meta_csv", args.meta_csv]
-        run(cmd)
+    if google_csv or meta_csv:
+        with timed(timings, "ads_kpis"):
+            build_kpis(client, google_csv, meta_csv)
 
     # 1) Define tipo (preferir o que veio via --type)
-    doc_type = (args.type or "").strip().lower() or detect_type(args.q)
-    print(f"[router] tipo selecionado: {doc_type}")
+    doc_type = (doc_type or "").strip().lower() or detect_type(q)
+    log(f"[router] tipo selecionado: {doc_type}")
+
+    def finish(prompt: str, label: str) -> dict:
+        # gera relatório, copia para última versão e registra no manifest
+        with gate("llm"), timed(timings, "report"):
+            write_answer(prompt, ts_path, client=client_slug)
+        copy_latest(ts_path, latest_path, log)
+        timings["total"] = round(time.perf_counter() - t_start, 3)
+        entry = get_registry().record(client_slug, ts_path, q, run_id=run_id, timings=timings,
+                                      type=doc_type, latest_path=latest_path)
+        log(f"\nOK! Relatório{label} em:\n- {ts_path}\n- {latest_path} (última versão)")
+        return {"id": run_id, "type": doc_type, "report_path": ts_path,
+                "latest_path": latest_path, "timings": timings, "size": entry["size"]}
 
     # 2) Se for chat, pular busca/ingestão e ir direto ao relatório simples
     if doc_type == "chat":
-        prompt = args.q.strip()
-        try:
-            run([PY, "report_exec.py", "--q", prompt, "--out", ts_path])
-        except subprocess.CalledProcessError:
-            # fallback alternativo caso report_exec exija contexto
-            run([PY, "ask_with_context.py", "--q", prompt, "--out", ts_path], allow_fail=False)
-
-        # copiar para última versão
-        try:
-            shutil.copyfile(ts_path, latest_path)
-        except Exception as e:
-            print(f"[warn] não consegui copiar para {latest_path}: {e}")
-        print(f"\nOK! Relatório (chat) em:\n- {ts_path}\n- {latest_path} (última versão)")
-        return
+        return finish(q.strip(), " (chat)")
 
     # 3) Fluxos não-chat: busca inteligente + ingest
     #    Se falhar, fazemos fallback para chat com o prompt original
-    try:
-        run([PY, "smart_search_sa.py",
-             "--client", args.client,
-             "--type", doc_type,
-             "--export", "txt",
-             "--take", args.take,
-             "--rules", args.rules])
-
-        run([PY, "ingest_txt.py"])
-    except subprocess.CalledProcessError as e:
-        print(f"[warn] busca/ingestão falhou (code {e.returncode}). Fallback para chat puro.")
-        # Fallback para chat
-        prompt_fb = args.q.strip()
+    failed = None
+    with gate("drive"):
         try:
-            run([PY, "report_exec.py", "--q", prompt_fb, "--out", ts_path])
-        except subprocess.CalledProcessError:
-            run([PY, "ask_with_context.py", "--q", prompt_fb, "--out", ts_path], allow_fail=False)
-        try:
-            shutil.copyfile(ts_path, latest_path)
-        except Exception as ee:
-            print(f"[warn] não consegui copiar para {latest_path}: {ee}")
-        print(f"\nOK! Relatório (fallback chat) em:\n- {ts_path}\n- {latest_path}")
-        return
+            with timed(timings, "search"):
+                search_and_export(client, doc_type, take=int(take), export="txt", rules_path=rules, log=log)
+            with timed(timings, "ingest"):
+                ensure_ingested(log=log)
+        except (Exception, SystemExit) as e:
+            failed = e
+    if failed is not None:
+        log(f"[warn] busca/ingestão falhou ({failed}). Fallback para chat puro.")
+        return finish(q.strip(), " (fallback chat)")
 
     # 4) Monta pergunta final considerando possível presença de KPIs de mídia
-    ads_txt = glob.glob(os.path.join(ROOT, "data","raw", f"ads_kpis_{client_slug}.txt"))
-    combine_ads = bool(ads_txt) or wants_ads(args.q)
+    ads_txt = glob.glob(os.path.join(ROOT, RAW_DIR, f"ads_kpis_{client_slug}.txt"))
+    combine_ads = bool(ads_txt) or wants_ads(q)
 
     if combine_ads:
-        prompt = (args.q.strip() +
+        prompt = (q.strip() +
                   " | Se houver KPIs de mídia (Google/Meta) no contexto, combine e destaque: "
                   "gasto, impressões, cliques, conversões, CTR, CPC, CPA; "
                   "traga 6 bullets e próximos passos. Cite fontes.")
     else:
-        prompt = args.q.strip() + " | Traga 6 bullets executivos e próximos passos. Cite fontes."
+        prompt = q.strip() + " | Traga 6 bullets executivos e próximos passos. Cite fontes."
 
     # 5) Gera relatório e copia para última versão
-    try:
-        run([PY, "report_exec.py", "--q", prompt, "--out", ts_path])
-    except subprocess.CalledProcessError:
-        # fallback alternativo
-        run([PY, "ask_with_context.py", "--q", prompt, "--out", ts_path], allow_fail=False)
+    return finish(prompt, "")
 
-    try:
-        shutil.copyfile(ts_path, latest_path)
-    except Exception as e:
-        print(f"[warn] não consegui copiar para {latest_path}: {e}")
+def main():
+    ap = argparse.ArgumentParser(description="Agente de Dados (router)")
+    ap.add_argument("--client", required=True, help='Ex.: "Start TI"')
+    ap.add_argument("--rules", default="company_rules.json")
+    ap.add_argument("--q", required=True, help="Pergunta em linguagem natural")
+    ap.add_argument("--take", default="1")
+    ap.add_argument("--type", dest="type", help="Força o tipo: chat, weekly, replanejamento, etc.")
+    # opcionais de Ads
+    ap.add_argument("--google_csv")
+    ap.add_argument("--meta_csv")
+    ap.add_argument("--run-id", dest="run_id", help="ID do run (o service usa para achar o relatório no manifest)")
+    args = ap.parse_args()
 
-    print(f"\nOK! Relatório em:\n- {ts_path}\n- {latest_path} (última versão)")
+    run_pipeline(args.client, args.q, take=args.take, doc_type=args.type,
+                 google_csv=args.google_csv, meta_csv=args.meta_csv, rules=args.rules,
+                 run_id=args.run_id)
 
 if __name__ == "__main__":
     main()
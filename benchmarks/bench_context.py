@@ -0,0 +1,77 @@
+# benchmarks/bench_context.py
+# Tokens do prompt com os chunks colados na íntegra x com o context_packer (vizinhos do mesmo
+# arquivo fundidos sem overlap, orçamento por modelo), no corpus sintético e para vários k.
+# Só a montagem do prompt: nenhuma chamada ao LLM.
+#   python benchmarks/bench_context.py [--docs 200] [--queries 100] [--ks 4,8,16] [--budget 4000] [--json out.json]
+
+from __future__ import annotations
+import argparse, json, os, statistics, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench_hybrid import make_queries, pct
+from bench_ingest import git_rev, make_embedder
+from synth_corpus import make_corpus
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de tokens do prompt: verbatim x context_packer.")
+    ap.add_argument("--docs", type=int, default=200)
+    ap.add_argument("--csv", type=int, default=10)
+    ap.add_argument("--rows", type=int, default=300)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--ks", default="4,8,16", help="Valores de k (separados por vírgula)")
+    ap.add_argument("--budget", type=int, help="CONTEXT_TOKEN_BUDGET (padrão: o do modelo)")
+    ap.add_argument("--embedder", default="stub", help="stub, default ou st:<modelo> (ver bench_ingest)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", help="Salva os resultados neste arquivo")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["TABLES_DB"] = os.path.join(tmp, "tables.sqlite")
+        os.environ["EMBED_CACHE_DIR"] = ""
+        if args.budget:
+            os.environ["CONTEXT_TOKEN_BUDGET"] = str(args.budget)
+        import ask_with_context as awc
+        import vectorstore
+        from ingest_txt import ingest
+
+        raw = os.path.join(tmp, "raw")
+        corpus = make_corpus(raw, args.docs, args.csv, args.rows, args.seed)
+        store = vectorstore.VectorStore(os.path.join(tmp, "chroma"), embedding_function=make_embedder(args.embedder))
+        vectorstore._store = store  # retrieve() usa get_store()
+        ingest(store, raw_dir=raw, log=lambda *a: None)
+        queries = [qd["q"] for qd in make_queries(store.collection(), args.queries, args.seed)]
+
+        rows = []
+        for k in (int(x) for x in args.ks.split(",") if x):
+            usages, lat = [], []
+            for q in queries:
+                docs, metas = awc.retrieve(q, k)
+                usage: dict = {}
+                t0 = time.perf_counter()
+                awc.build_prompt(q, docs, metas, usage=usage)
+                lat.append((time.perf_counter() - t0) * 1000)
+                usages.append(usage)
+            total = {key: sum(u[key] for u in usages) for key in
+                     ("verbatim_tokens", "prompt_tokens", "chunks", "passages", "truncated", "dropped")}
+            row = {"k": k,
+                   "verbatim_tokens_avg": round(total["verbatim_tokens"] / len(usages), 1),
+                   "prompt_tokens_avg": round(total["prompt_tokens"] / len(usages), 1),
+                   "prompt_tokens_max": max(u["prompt_tokens"] for u in usages),
+                   "saved_pct": round(100 * (1 - total["prompt_tokens"] / total["verbatim_tokens"]), 1),
+                   "chunks_per_passage": round(total["chunks"] / max(1, total["passages"]), 2),
+                   "truncated": total["truncated"], "dropped": total["dropped"],
+                   "pack_p50_ms": round(statistics.median(lat), 3), "pack_p95_ms": round(pct(lat, 0.95), 3)}
+            rows.append(row)
+            print(" | ".join(f"{key}={v}" for key, v in row.items()))
+        from context_packer import budget_for
+        budget = budget_for(awc.MODEL_NAME)
+
+    report = {"rev": git_rev(), "embedder": args.embedder, "model": awc.MODEL_NAME, "budget": budget,
+              "corpus": corpus, "queries": len(queries), "results": rows}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
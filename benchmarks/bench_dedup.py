@@ -0,0 +1,86 @@
+# benchmarks/bench_dedup.py
+# Quase-duplicatas antes/depois (near_dup) num corpus sintético de dailies com boilerplate:
+# tamanho do índice (chunks/vetores), tokens do contexto e latência de assinatura, LSH e dedupe.
+# Sem embedder: a "busca" ordena por Jaccard estimado contra a pergunta, só para montar o top-k.
+#   python benchmarks/bench_dedup.py [--docs 200] [--k 6] [--json out.json]
+
+from __future__ import annotations
+import argparse, json, os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingest_txt import chunk
+from near_dup import DedupIndex, dedupe, estimate_tokens, numbers, query_stats, signature, similarity
+
+WORDS = ("campanha lead custo verba criativo público conversão semana relatório cliente ajuste "
+         "google meta orçamento cpl ctr alcance frequência teste landing página formulário").split()
+DIM = 768  # dimensão típica de embedding, para estimar bytes do índice
+
+def para(rnd: random.Random, n: int, tag: str = "") -> str:
+    return " ".join(rnd.choice(WORDS) + (str(rnd.randint(0, 999)) if tag else "") for _ in range(n))
+
+def corpus(n_docs: int, seed: int = 7) -> list[str]:
+    """Dailies: cabeçalho + 3 blocos fixos (com 1 palavra trocada por doc) + 2 parágrafos próprios."""
+    rnd = random.Random(seed)
+    boiler = [para(rnd, 160) for _ in range(3)]
+    docs = []
+    for i in range(n_docs):
+        fixed = []
+        for b in boiler:
+            w = b.split()
+            w[rnd.randrange(len(w))] = f"dia{i}"
+            fixed.append(" ".join(w))
+        docs.append("\n\n".join([f"Daily {i}"] + fixed + [para(rnd, 160, "u"), para(rnd, 160, "u")]))
+    return docs
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de quase-duplicatas (índice e contexto, antes/depois).")
+    ap.add_argument("--docs", type=int, default=200)
+    ap.add_argument("--k", type=int, default=6)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--json", help="Salva os resultados neste arquivo")
+    args = ap.parse_args()
+
+    chunks = [c for d in corpus(args.docs) for c in chunk(d)]
+    t0 = time.perf_counter()
+    sigs = [signature(c) for c in chunks]
+    sig_us = (time.perf_counter() - t0) / len(chunks) * 1e6
+
+    with tempfile.TemporaryDirectory() as tmp:
+        idx = DedupIndex(os.path.join(tmp, "dedup.npz"))
+        t0 = time.perf_counter()
+        canon = [i for i, s in enumerate(sigs) if idx.add(f"c{i}", s, "|daily", "bench", 0, numbers(chunks[i]))[0] is None]
+        lsh_us = (time.perf_counter() - t0) / len(chunks) * 1e6
+
+    # "busca": top k*2 por similaridade com a pergunta (um trecho do corpus), com e sem dedupe
+    rnd = random.Random(1)
+    cold = time.perf_counter()
+    for _ in range(args.queries):
+        qs = signature(rnd.choice(chunks)[:400])
+        order = sorted(range(len(chunks)), key=lambda i: -similarity(qs, sigs[i]))[: args.k * 2]
+        dedupe([chunks[i] for i in order], [{}] * len(order), args.k)
+    dedupe_ms = (time.perf_counter() - cold) / args.queries * 1000
+    q = query_stats()
+
+    row = {
+        "docs": args.docs,
+        "chunks_before": len(chunks),
+        "chunks_after": len(canon),
+        "index_mb_before": round(len(chunks) * DIM * 4 / 1048576, 2),
+        "index_mb_after": round(len(canon) * DIM * 4 / 1048576, 2),
+        "index_saved_pct": round(100 * (1 - len(canon) / len(chunks)), 1),
+        "corpus_tokens": sum(estimate_tokens(c) for c in chunks),
+        "prompt_tokens_before": round(q["tokens_before"] / args.queries, 1),
+        "prompt_tokens_after": round(q["tokens_after"] / args.queries, 1),
+        "redundant_pct_before": q["redundant_pct"],
+        "signature_us": round(sig_us, 1),
+        "lsh_add_us": round(lsh_us, 1),
+        "query_ms_incl_rank": round(dedupe_ms, 2),
+    }
+    for key, v in row.items():
+        print(f"{key:>22}: {v}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(row, f, indent=2)
+
+if __name__ == "__main__":
+    main()
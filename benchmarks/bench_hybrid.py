@@ -0,0 +1,116 @@
+# benchmarks/bench_hybrid.py
+# Recall@k e latência: busca só vetorial x só BM25 x híbrida (RRF) no corpus sintético.
+# Dois tipos de pergunta com gabarito: "termos" (tipo + cliente + data do arquivo, o que o
+# usuário digita quando sabe o documento; acerta se algum chunk do arquivo vem no top-k) e
+# "trecho" (uma frase do chunk; acerta se o próprio chunk vem no top-k).
+#   python benchmarks/bench_hybrid.py [--docs 200] [--queries 100] [--k 4] [--embedder stub] [--json out.json]
+
+from __future__ import annotations
+import argparse, json, os, random, re, statistics, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench_ingest import git_rev, make_embedder
+from synth_corpus import make_corpus
+
+def pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+def make_queries(col, n: int, seed: int) -> list[dict]:
+    got = col.get(include=["documents", "metadatas"])
+    rnd = random.Random(seed)
+    picks = rnd.sample(range(len(got["ids"])), min(n, len(got["ids"])))
+    out = []
+    for i in picks:
+        doc, meta = got["documents"][i], got["metadatas"][i]
+        name = os.path.splitext(os.path.basename(meta["source"]))[0]
+        client, _, rest = name.partition(" - ")
+        out.append({"kind": "termos", "q": f"{rest} {client}", "source": meta["source"]})
+        sentences = [s for s in re.split(r"(?<=[.;])\s+|\n", doc) if len(s) > 40]
+        if sentences:
+            out.append({"kind": "trecho", "q": rnd.choice(sentences),
+                        "chunk": (meta["source"], meta["chunk"])})
+    return out
+
+def hit(query: dict, metas: list[dict]) -> bool:
+    if query["kind"] == "termos":
+        return any(m["source"] == query["source"] for m in metas)
+    return any((m["source"], m["chunk"]) == query["chunk"] for m in metas)
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de recall@k e latência: vetorial x BM25 x híbrida.")
+    ap.add_argument("--docs", type=int, default=200)
+    ap.add_argument("--csv", type=int, default=10)
+    ap.add_argument("--rows", type=int, default=300)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--embedder", default="stub", help="stub, default ou st:<modelo> (ver bench_ingest)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", help="Salva os resultados neste arquivo")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # tudo isolado no diretório temporário (tabela lateral e cache de embeddings inclusive)
+        os.environ["TABLES_DB"] = os.path.join(tmp, "tables.sqlite")
+        os.environ["EMBED_CACHE_DIR"] = ""
+        import ask_with_context as awc
+        import vectorstore
+        from bm25_index import get_index
+        from ingest_txt import ingest
+
+        raw = os.path.join(tmp, "raw")
+        corpus = make_corpus(raw, args.docs, args.csv, args.rows, args.seed)
+        store = vectorstore.VectorStore(os.path.join(tmp, "chroma"), embedding_function=make_embedder(args.embedder))
+        vectorstore._store = store  # retrieve() usa get_store()
+        ingest(store, raw_dir=raw, log=lambda *a: None)
+        col = store.collection()
+        queries = make_queries(col, args.queries, args.seed)
+        awc.DEDUP = False  # mede só a fusão
+        idx = get_index(store)
+
+        def bm25_only(q):
+            ids = [c for c, _ in idx.search(q, args.k)]
+            return col.get(ids=ids, include=["metadatas"])["metadatas"] if ids else []
+
+        def run(hybrid: bool):
+            def fn(q):
+                awc.HYBRID = hybrid
+                return awc.retrieve(q, args.k)[1]
+            return fn
+
+        methods = {"vetorial": run(False), "bm25": bm25_only, "hibrida": run(True)}
+        rows = []
+        for name, fn in methods.items():
+            fn(queries[0]["q"])  # aquece (modelo, caches do SQLite)
+            lat, hits = [], {"termos": [], "trecho": []}
+            for qd in queries:
+                t0 = time.perf_counter()
+                metas = fn(qd["q"])
+                lat.append((time.perf_counter() - t0) * 1000)
+                hits[qd["kind"]].append(hit(qd, metas))
+            row = {"method": name,
+                   **{f"recall@{args.k}_{kind}": round(sum(h) / len(h), 3) for kind, h in hits.items() if h},
+                   "p50_ms": round(statistics.median(lat), 3), "p95_ms": round(pct(lat, 0.95), 3)}
+            rows.append(row)
+            print(" | ".join(f"{k}={v}" for k, v in row.items()))
+
+        lex_us = []
+        for qd in queries:
+            t0 = time.perf_counter()
+            idx.search(qd["q"], args.k * 2)
+            lex_us.append((time.perf_counter() - t0) * 1e6)
+        lookup = {"p50_us": round(statistics.median(lex_us), 1), "p95_us": round(pct(lex_us, 0.95), 1),
+                  "index_bytes": os.path.getsize(idx.path)}
+        print(f"BM25 lookup: p50 {lookup['p50_us']} µs, p95 {lookup['p95_us']} µs, "
+              f"{lookup['index_bytes'] / 1048576:.1f} MB")
+        idx.close()
+
+    report = {"rev": git_rev(), "embedder": args.embedder, "k": args.k, "corpus": corpus,
+              "chunks": len(queries), "methods": rows, "bm25_lookup": lookup}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
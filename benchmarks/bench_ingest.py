@@ -0,0 +1,213 @@
+# benchmarks/bench_ingest.py
+# Custo da ingestão num corpus sintético (synth_corpus): chunk() sozinho e o ingest completo
+# (hash, chunking, embedding, Chroma, tabela lateral) com um embedder stub e com modelos
+# locais de verdade. Cada caso roda num subprocesso próprio para o pico de RSS ser só dele.
+# Saída em JSON (revisão do git + parâmetros + resultados) para comparar entre versões.
+#   python benchmarks/bench_ingest.py [--docs 200] [--csv 20] [--rows 500]
+#       [--embedders stub,default,st:all-MiniLM-L6-v2] [--json out.json]
+
+from __future__ import annotations
+import argparse, hashlib, json, os, platform, re, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from synth_corpus import make_corpus
+
+STUB_DIM = 384
+
+def make_embedder(name: str):
+    """stub | default (ONNX MiniLM do Chroma) | st:<modelo> (sentence-transformers)."""
+    from chromadb.api.types import EmbeddingFunction
+
+    if name == "stub":
+        class StubEmbedding(EmbeddingFunction):
+            """Bag-of-words com hashing em STUB_DIM posições: determinístico e quase sem custo."""
+
+            def __init__(self):
+                pass
+
+            def __call__(self, input):
+                import numpy as np
+                out = []
+                for text in input:
+                    v = np.zeros(STUB_DIM, dtype=np.float32)
+                    for w in re.findall(r"\w+", text.lower()):
+                        v[int.from_bytes(hashlib.blake2b(w.encode(), digest_size=4).digest(), "little") % STUB_DIM] += 1
+                    out.append(v / (np.linalg.norm(v) or 1.0))
+                return out
+
+            @staticmethod
+            def name() -> str:
+                return "bench-stub"
+
+            def get_config(self) -> dict:
+                return {}
+
+            @staticmethod
+            def build_from_config(config):
+                return StubEmbedding()
+
+        return StubEmbedding()
+    from chromadb.utils import embedding_functions as efs
+    if name == "default":
+        return efs.DefaultEmbeddingFunction()
+    if name.startswith("st:"):
+        return efs.SentenceTransformerEmbeddingFunction(model_name=name[3:])
+    raise SystemExit(f"Embedder desconhecido: {name}")
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1048576 if sys.platform == "darwin" else 1024), 1)
+
+def disk_bytes(path: str, skip: str | None = None) -> int:
+    """Bytes ocupados em disco (blocos alocados: a matriz do cache de embeddings é esparsa)."""
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        if skip:
+            dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != skip]
+        for n in filenames:
+            st = os.stat(os.path.join(dirpath, n))
+            total += st.st_blocks * 512 if hasattr(st, "st_blocks") else st.st_size
+    return total
+
+# -------- casos (rodam no subprocesso) --------
+def case_chunk(raw: str) -> dict:
+    from csv_ingest import iter_row_blocks
+    from ingest_txt import chunk
+
+    paths = sorted(os.path.join(raw, n) for n in os.listdir(raw))
+    t0 = time.perf_counter()
+    n = 0
+    for p in paths:
+        if p.endswith(".csv"):
+            n += sum(1 for _ in iter_row_blocks(p))
+        else:
+            with open(p, "r", encoding="utf-8") as f:
+                n += len(chunk(f.read()))
+    wall = time.perf_counter() - t0
+    size = sum(os.path.getsize(p) for p in paths)
+    return {"wall_s": round(wall, 3), "chunks": n, "chunks_per_s": round(n / wall, 1),
+            "mb_per_s": round(size / 1048576 / wall, 2)}
+
+def case_ingest(raw: str, work: str, embedder: str, procs: int | None, batch: int | None) -> dict:
+    from ingest_txt import ingest
+    from vectorstore import VectorStore
+
+    t0 = time.perf_counter()
+    ef = make_embedder(embedder)
+    ef(["aquecimento do modelo"])  # download/carga do modelo fora da medição
+    load = time.perf_counter() - t0
+    chroma = os.path.join(work, "chroma")
+    store = VectorStore(chroma, embedding_function=ef)
+    opts = {k: v for k, v in (("procs", procs), ("batch_size", batch)) if v}
+    quiet = lambda *a: None
+
+    t0 = time.perf_counter()
+    st = ingest(store, raw_dir=raw, log=quiet, **opts)
+    wall = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    ingest(store, raw_dir=raw, log=quiet, **opts)  # nada mudou: custo fixo do incremental
+    noop = time.perf_counter() - t0
+    size = sum(os.path.getsize(os.path.join(raw, n)) for n in os.listdir(raw))
+    cache = os.path.join(chroma, "embed_cache")
+    return {
+        "model_load_s": round(load, 3),
+        "wall_s": round(wall, 3),
+        "noop_s": round(noop, 3),
+        "chunks": st["upserted"],
+        "chunks_per_s": round(st["upserted"] / wall, 1),
+        "mb_per_s": round(size / 1048576 / wall, 2),
+        "index_bytes": disk_bytes(chroma, skip=cache),
+        "cache_bytes": disk_bytes(cache) if os.path.isdir(cache) else 0,
+        "tables_bytes": disk_bytes(os.path.dirname(os.environ["TABLES_DB"])),
+        "dedup": st.get("dedup"),
+    }
+
+def run_child(args) -> None:
+    try:
+        if args.case == "chunk":
+            res = case_chunk(args.raw)
+        else:
+            res = case_ingest(args.raw, args.work, args.case.split(":", 1)[1], args.procs, args.batch)
+    except Exception as e:
+        res = {"error": f"{type(e).__name__}: {e}"}
+    res["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(res))
+
+# -------- orquestração --------
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def run_case(case: str, raw: str, tmp: str, args) -> dict:
+    work = tempfile.mkdtemp(dir=tmp)
+    env = dict(os.environ, TABLES_DB=os.path.join(work, "tables", "tables.sqlite"), EMBED_CACHE_DIR="")
+    cmd = [sys.executable, os.path.abspath(__file__), "--case", case, "--raw", raw, "--work", work]
+    if args.procs:
+        cmd += ["--procs", str(args.procs)]
+    if args.batch:
+        cmd += ["--batch", str(args.batch)]
+    p = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    lines = [ln for ln in p.stdout.splitlines() if ln.startswith("{")]
+    res = json.loads(lines[-1]) if lines else {"error": (p.stderr.strip().splitlines() or ["sem saída"])[-1]}
+    return {"case": case, **res}
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de ingestão (corpus sintético, JSON para comparar versões).")
+    ap.add_argument("--docs", type=int, default=200, help="Atas/weeklies do corpus")
+    ap.add_argument("--csv", type=int, default=20, help="Tabelas de KPIs do corpus")
+    ap.add_argument("--rows", type=int, default=500, help="Linhas por CSV")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--raw", help="Usa este diretório em vez de gerar o corpus")
+    ap.add_argument("--embedders", default="stub,default", help="stub, default, st:<modelo> (separados por vírgula)")
+    ap.add_argument("--procs", type=int, help="Processos de hash/chunking (padrão do ingest_txt)")
+    ap.add_argument("--batch", type=int, help="Chunks por lote (padrão do ingest_txt)")
+    ap.add_argument("--json", help="Salva o relatório neste arquivo")
+    ap.add_argument("--case", help=argparse.SUPPRESS)
+    ap.add_argument("--work", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.case:
+        return run_child(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.raw:
+            raw = os.path.abspath(args.raw)
+            names = os.listdir(raw)
+            corpus = {"files": len(names), "bytes": sum(os.path.getsize(os.path.join(raw, n)) for n in names)}
+        else:
+            raw = os.path.join(tmp, "raw")
+            corpus = make_corpus(raw, args.docs, args.csv, args.rows, args.seed)
+        print(f"Corpus: {corpus['files']} arquivo(s), {corpus['bytes'] / 1048576:.1f} MB")
+        results = []
+        for case in ["chunk"] + [f"ingest:{e}" for e in args.embedders.split(",") if e]:
+            res = run_case(case, raw, tmp, args)
+            results.append(res)
+            if "error" in res:
+                print(f"{case:>28} | erro: {res['error']}")
+            else:
+                print(f"{case:>28} | {res['wall_s']:>8.2f} s | {res['chunks_per_s']:>9.1f} chunks/s | "
+                      f"RSS {res['peak_rss_mb']} MB" + (f" | índice {res['index_bytes'] / 1048576:.1f} MB"
+                                                         if "index_bytes" in res else ""))
+
+    report = {
+        "rev": git_rev(),
+        "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {k: getattr(args, k) for k in ("docs", "csv", "rows", "seed", "procs", "batch")},
+        "corpus": corpus,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
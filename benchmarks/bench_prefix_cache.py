@@ -0,0 +1,100 @@
+# benchmarks/bench_prefix_cache.py
+# Prefixo fixo por cliente (instruções + regras + KPIs de Ads) com e sem cache (prompt_cache):
+# tokens de entrada cobrados fora do cache e latência do LLM por modo (off, local, auto).
+# Com o backend stub a latência é modelada (base + --prefill-ms por 1000 tokens fora do cache)
+# e não há mínimo de tokens para cachear; com --backend gemini mede de verdade (GOOGLE_API_KEY;
+# o prefixo precisa passar do mínimo do modelo, ver "mínimo do provedor" na saída: suba
+# --prefix-budget e --kpi-lines para o gemini-1.5, ou use LLM_MODEL=gemini-2.5-flash).
+#   python benchmarks/bench_prefix_cache.py [--clients 3] [--questions 10] [--kpi-lines 400]
+#       [--prefix-budget 4000] [--backend stub] [--prefill-ms 100] [--json out.json]
+
+from __future__ import annotations
+import argparse, json, os, re, statistics, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench_hybrid import pct
+from bench_ingest import git_rev, make_embedder
+from synth_corpus import CLIENTS, TOPICS, make_corpus
+
+def write_kpis(raw: str, client: str, lines: int) -> None:
+    key = re.sub(r"\W+", "_", client)  # mesmo nome que o ads_kpis_from_csv grava
+    with open(os.path.join(raw, f"ads_kpis_{key}.txt"), "w", encoding="utf-8") as f:
+        f.write(f"KPIs de Ads {client}\n")
+        for i in range(lines):
+            f.write(f"{2024 + i // 365}-{i % 12 + 1:02d} campanha {TOPICS[i % len(TOPICS)]}: gasto R$ {1000 + 37 * i:,}, "
+                    f"impressões {20000 + 311 * i}, cliques {300 + 7 * i}, conversões {10 + i % 40}\n")
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do cache de prefixo por cliente (tokens e latência).")
+    ap.add_argument("--clients", type=int, default=3)
+    ap.add_argument("--questions", type=int, default=10, help="Perguntas por cliente")
+    ap.add_argument("--kpi-lines", type=int, default=400, help="Linhas do ads_kpis_<cliente>.txt")
+    ap.add_argument("--prefix-budget", type=int, help="PROMPT_PREFIX_BUDGET (padrão: o do prompt_cache)")
+    ap.add_argument("--backend", default="stub", help="stub ou gemini")
+    ap.add_argument("--latency-ms", type=float, default=50, help="Stub: latência base")
+    ap.add_argument("--prefill-ms", type=float, default=100, help="Stub: ms por 1000 tokens fora do cache")
+    ap.add_argument("--json", help="Salva os resultados neste arquivo")
+    args = ap.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # prompt_cache lê os KPIs de RAW_DIR, relativo ao cwd
+        raw = os.path.join(tmp, "data", "raw")
+        os.environ.update(TABLES_DB=os.path.join(tmp, "tables.sqlite"), EMBED_CACHE_DIR="", APP_ROOT=tmp)
+        if args.prefix_budget:
+            os.environ["PROMPT_PREFIX_BUDGET"] = str(args.prefix_budget)
+        corpus = make_corpus(raw, 50, 0, 0)
+        clients = CLIENTS[:args.clients]
+        for c in clients:
+            write_kpis(raw, c, args.kpi_lines)
+        import ask_with_context as awc
+        import llm_client, prompt_cache, vectorstore
+        from client_matcher import slugify
+        from ingest_txt import ingest
+        from near_dup import estimate_tokens
+
+        store = vectorstore.VectorStore(os.path.join(tmp, "chroma"), embedding_function=make_embedder("stub"))
+        vectorstore._store = store
+        ingest(store, raw_dir=raw, log=lambda *a: None)
+        if args.backend == "stub":
+            backend = llm_client.StubBackend(latency=args.latency_ms / 1000, ms_per_1k=args.prefill_ms)
+        else:
+            backend = llm_client.make_backend(args.backend)
+        llm = llm_client.LLMClient(backend)
+        llm_client.set_client(llm)
+        prefix_tokens = {c: estimate_tokens(prompt_cache.static_prefix(slugify(c))[0]) for c in clients}
+        print(f"Prefixo: {statistics.mean(prefix_tokens.values()):.0f} tokens (média por cliente); mínimo do "
+              f"provedor para {llm.model}: {llm_client.min_cache_tokens(llm.model)} (o stub cacheia qualquer tamanho)")
+
+        rows = []
+        for mode in ("off", "local", "auto"):
+            prompt_cache.CACHE = prompt_cache.PrefixCache(mode=mode)
+            lat, billed = [], 0
+            for i in range(args.questions):
+                for c in clients:
+                    q = f"{TOPICS[i % len(TOPICS)]}: como evoluíram gasto e cliques? ({i})"
+                    docs, metas = awc.retrieve(q, 4, slugify(c))
+                    prompt, cites, prefix = awc._prompt(q, docs, metas, slugify(c), {})
+                    res = prompt_cache.generate(llm, prompt, prefix, slugify(c))
+                    lat.append(res["seconds"] * 1000)
+                    billed += res["prompt_tokens"] - res["cached_tokens"]
+            st = prompt_cache.stats()
+            row = {"mode": mode, "calls": len(lat),
+                   "input_tokens_uncached_avg": round(billed / len(lat), 1),
+                   "cached_tokens_pct": st["cached_tokens_pct"],
+                   "local_tokens_saved": st["local_tokens_saved"],
+                   "provider_caches": st["provider_created"],
+                   "llm_p50_ms": round(statistics.median(lat), 1), "llm_p95_ms": round(pct(lat, 0.95), 1)}
+            rows.append(row)
+            print(" | ".join(f"{k}={v}" for k, v in row.items()))
+        os.chdir(cwd)
+
+    report = {"rev": git_rev(), "backend": args.backend, "model": llm.model, "corpus": corpus,
+              "prefix_tokens": prefix_tokens, "params": vars(args), "results": rows}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
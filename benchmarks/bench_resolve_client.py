@@ -0,0 +1,73 @@
+# benchmarks/bench_resolve_client.py
+# Micro-benchmark do resolvedor de cliente: regex por alias (implementação antiga)
+# vs. ClientMatcher (trie compilada) de 10 a 10.000 aliases.
+#   python benchmarks/bench_resolve_client.py [--sizes 10,100,1000,10000] [--json out.json]
+
+from __future__ import annotations
+import argparse, json, os, random, re, string, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from client_matcher import ClientMatcher
+
+QUERIES = [
+    "resumo do replanejamento mais recente da start ti",
+    "qual foi o cpl da campanha de setembro? compare com agosto e traga próximos passos",
+    "weekly de alta performance: o que mudou desde o último check-in do cliente",
+]
+
+def fake_rules(n_aliases: int, seed: int = 42) -> dict:
+    rnd = random.Random(seed)
+    clients: dict[str, list[str]] = {"Start TI": ["StartTI", "Start Tecnologia"]}
+    n = 3
+    while n < n_aliases:
+        name = " ".join("".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(4, 9)))
+                        for _ in range(rnd.randint(1, 3)))
+        clients[name] = [name.replace(" ", ""), name.split()[0] + " co"]
+        n += 3
+    return {"org_name": "Start TI", "clients": clients}
+
+def old_resolve(flat: dict[str, str], q: str) -> str | None:
+    for alias, canonical in flat.items():
+        if re.search(rf"\b{re.escape(alias)}\b", q):
+            return canonical
+    return None
+
+def bench(fn, reps: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(reps):
+        fn(QUERIES[i % len(QUERIES)])
+    return (time.perf_counter() - t0) / reps * 1e6  # µs por chamada
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do resolve_client (aliases x latência).")
+    ap.add_argument("--sizes", default="10,100,1000,10000")
+    ap.add_argument("--reps", type=int, default=300)
+    ap.add_argument("--json", help="Salva os resultados neste arquivo")
+    args = ap.parse_args()
+
+    rows = []
+    for n in [int(x) for x in args.sizes.split(",")]:
+        rules = fake_rules(n)
+        m = ClientMatcher(path=os.devnull, check_every=1e9)
+        t0 = time.perf_counter()
+        m.build(rules)
+        build_ms = (time.perf_counter() - t0) * 1000
+        flat = {a.lower(): k for k, arr in rules["clients"].items() for a in [k] + arr}
+        # a versão antiga é O(aliases): limita as repetições para não demorar demais
+        old_reps = max(3, min(args.reps, 30000 // max(1, len(flat))))
+        row = {
+            "aliases": len(flat),
+            "matcher_build_ms": round(build_ms, 2),
+            "matcher_us": round(bench(m.search, args.reps), 2),
+            "per_alias_regex_us": round(bench(lambda q: old_resolve(flat, q), old_reps), 2),
+        }
+        rows.append(row)
+        print(f"{row['aliases']:>6} aliases | matcher {row['matcher_us']:>8.2f} µs | "
+              f"regex por alias {row['per_alias_regex_us']:>10.2f} µs | build {row['matcher_build_ms']:.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
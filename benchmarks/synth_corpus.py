@@ -0,0 +1,108 @@
+# benchmarks/synth_corpus.py
+# Gerador de corpus sintético com a cara dos exports do Drive em data/raw: atas de reunião
+# (daily/check-in), weeklies com KPIs em texto e tabelas CSV de KPIs de Ads (formatos
+# pt-BR e en-US, ',' e ';'). Determinístico pela semente, para comparar versões.
+#   python benchmarks/synth_corpus.py --out /tmp/corpus [--docs 200] [--csv 20] [--rows 500]
+
+from __future__ import annotations
+import argparse, csv, os, random
+from datetime import date, timedelta
+
+CLIENTS = ["Aurora Saúde", "Casa Nobre Imóveis", "Pontal Educação", "Vértice Energia", "Lume Cosméticos"]
+PEOPLE = ["Ana", "Bruno", "Carla", "Diego", "Elisa", "Fábio", "Gabi", "Heitor"]
+TOPICS = ["verba de mídia", "criativos de vídeo", "landing page", "formulário de leads", "públicos semelhantes",
+          "remarketing", "palavras-chave negativas", "CPL da semana", "qualidade dos leads", "integração com o CRM"]
+VERBS = ["revisar", "ajustar", "pausar", "escalar", "testar", "reprocessar", "validar", "documentar"]
+# blocos que se repetem em todo documento do mesmo tipo (como nos templates reais)
+BOILER = {
+    "daily": "Pauta padrão: status das campanhas, bloqueios, próximos passos. Registrar decisões "
+             "com responsável e prazo. Dúvidas de acesso vão para o canal do time.",
+    "weekly": "Resumo executivo da semana. Os números abaixo consideram Google Ads e Meta Ads, "
+              "consolidados por campanha; variações comparam com a semana anterior.",
+}
+
+def _sentence(rnd: random.Random) -> str:
+    return (f"{rnd.choice(PEOPLE)} vai {rnd.choice(VERBS)} {rnd.choice(TOPICS)} "
+            f"até {rnd.choice(['amanhã', 'sexta', 'o fim do mês', 'a próxima daily'])}; "
+            f"impacto esperado em {rnd.choice(TOPICS)}.")
+
+def _paragraph(rnd: random.Random, n: int) -> str:
+    return " ".join(_sentence(rnd) for _ in range(n))
+
+def meeting_notes(rnd: random.Random, client: str, day: date, kind: str) -> str:
+    parts = [f"{kind.title()} {client} {day.isoformat()}",
+             "Participantes: " + ", ".join(rnd.sample(PEOPLE, 4)),
+             BOILER["daily"]]
+    for i in range(rnd.randint(3, 8)):
+        lines = [f"{i + 1}. {rnd.choice(TOPICS).capitalize()}"]
+        lines += [f"- {_sentence(rnd)}" for _ in range(rnd.randint(2, 6))]
+        parts.append("\n".join(lines))
+    parts.append("Próximos passos:\n" + "\n".join(f"- {_sentence(rnd)}" for _ in range(rnd.randint(2, 5))))
+    return "\n\n".join(parts)
+
+def weekly(rnd: random.Random, client: str, day: date) -> str:
+    parts = [f"Weekly {client} semana {day.isocalendar()[1]:02d}/{day.year}", BOILER["weekly"]]
+    for vendor in ("Google Ads", "Meta Ads"):
+        cost = rnd.uniform(2_000, 40_000)
+        leads = rnd.randint(20, 900)
+        parts.append(f"{vendor}: investimento R$ {cost:,.2f}, {leads} leads, CPL R$ {cost / leads:,.2f}, "
+                     f"CTR {rnd.uniform(0.4, 4):.2f}%.".replace(",", "X").replace(".", ",").replace("X", "."))
+    parts += [_paragraph(rnd, rnd.randint(3, 7)) for _ in range(rnd.randint(3, 9))]
+    return "\n\n".join(parts)
+
+def kpi_rows(rnd: random.Random, start: date, n: int, br: bool):
+    camps = [f"{rnd.choice(['Search', 'PMax', 'Leads', 'Remarketing'])} {rnd.choice(TOPICS)}" for _ in range(6)]
+    for i in range(n):
+        imp = rnd.randint(500, 120_000)
+        clk = int(imp * rnd.uniform(0.004, 0.05))
+        cost = clk * rnd.uniform(0.8, 9)
+        conv = int(clk * rnd.uniform(0.01, 0.15))
+        day = start + timedelta(days=i // len(camps))
+        if br:
+            yield [day.strftime("%d/%m/%Y"), camps[i % len(camps)], f"{imp:,}".replace(",", "."),
+                   str(clk), f"R$ {cost:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."), str(conv)]
+        else:
+            yield [day.isoformat(), camps[i % len(camps)], str(imp), str(clk), f"{cost:.2f}", str(conv)]
+
+def make_corpus(out: str, docs: int = 200, csvs: int = 20, rows: int = 500, seed: int = 42) -> dict:
+    """Grava o corpus em `out`. Retorna {"files", "txt", "csv", "bytes"}."""
+    rnd = random.Random(seed)
+    os.makedirs(out, exist_ok=True)
+    start = date(2025, 1, 6)
+    n_txt = 0
+    for i in range(docs):
+        client = CLIENTS[i % len(CLIENTS)]
+        day = start + timedelta(days=i // len(CLIENTS))
+        kind = rnd.choice(["daily", "daily", "checkin", "weekly"])
+        text = weekly(rnd, client, day) if kind == "weekly" else meeting_notes(rnd, client, day, kind)
+        name = f"{client} - {kind.title()} {day.isoformat()}.txt"
+        with open(os.path.join(out, name), "w", encoding="utf-8") as f:
+            f.write(text)
+        n_txt += 1
+    for i in range(csvs):
+        client = CLIENTS[i % len(CLIENTS)]
+        br = i % 2 == 0
+        month = start + timedelta(days=30 * (i // len(CLIENTS)))
+        header = (["Data", "Campanha", "Impressões", "Cliques", "Custo", "Conversões"] if br
+                  else ["Date", "Campaign", "Impressions", "Clicks", "Cost", "Conversions"])
+        name = f"{client} - KPIs Ads {month:%Y-%m}.csv"
+        with open(os.path.join(out, name), "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f, delimiter=";" if br else ",")
+            w.writerow(header)
+            w.writerows(kpi_rows(rnd, month, rows, br))
+    files = [os.path.join(out, n) for n in os.listdir(out)]
+    return {"files": len(files), "txt": n_txt, "csv": csvs, "bytes": sum(os.path.getsize(p) for p in files)}
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera um corpus sintético no formato de data/raw.")
+    ap.add_argument("--out", required=True, help="Diretório de saída")
+    ap.add_argument("--docs", type=int, default=200, help="Atas/weeklies (.txt)")
+    ap.add_argument("--csv", type=int, default=20, help="Tabelas de KPIs (.csv)")
+    ap.add_argument("--rows", type=int, default=500, help="Linhas por CSV")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+    info = make_corpus(args.out, args.docs, args.csv, args.rows, args.seed)
+    print(f"{info['files']} arquivo(s), {info['bytes'] / 1048576:.1f} MB em {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# bm25_index.py
+# Índice lexical (BM25) ao lado de cada coleção do Chroma, em SQLite: termos exatos ("CPL",
+# "Replanejamento 2025 09 11", nome de campanha) que a busca vetorial costuma perder.
+# Postings (termo, chunk, tf) agrupados por termo (WITHOUT ROWID): uma consulta lê só as
+# listas dos termos da pergunta. O ingest mantém o índice junto com os upserts/deletes; quem
+# consulta guarda em memória comprimentos/filtros dos chunks e as listas já lidas (numpy),
+# descartados quando outra conexão grava (PRAGMA data_version).
+
+from __future__ import annotations
+import math, os, re, sqlite3, threading, unicodedata
+from array import array
+from collections import Counter
+
+import numpy as np
+
+K1, B = 1.2, 0.75
+MAX_DF_RATIO = 0.5  # termo em mais da metade dos chunks quase não pontua: nem lê a lista
+MAX_CACHED_POSTINGS = 5_000_000  # entradas de postings em memória por índice (~40 MB)
+_WORD = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a ao aos as à às com como da das de dela dele deles do dos e ela elas ele eles em entre era essa esse
+esta este eu foi for há isso já lhe mais mas me mesmo meu minha muito na nas nem no nos nós num numa
+o os ou para pela pelas pelo pelos por qual quando que quem se sem ser seu sua são só também te tem
+um uma umas uns você é está the of and to in on for
+""".split())
+
+def tokenize(text: str) -> list[str]:
+    """Minúsculas, sem acento, sem stopwords; números sem zero à esquerda ("09" == "9")."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    out = []
+    for w in _WORD.findall(text):
+        if w.isdigit():
+            w = w.lstrip("0") or "0"
+        elif w in STOPWORDS:
+            continue
+        out.append(w)
+    return out
+
+def index_path(store, name: str | None = None) -> str:
+    """Arquivo do índice de uma coleção (padrão: a ativa); a base mantém o nome curto."""
+    name = name or store.open().name
+    return os.path.join(store.path, "bm25.sqlite" if name == store.base else f"bm25.{name}.sqlite")
+
+def _doc_text(doc: str, meta: dict) -> str:
+    # o nome do arquivo também é buscável (datas e tipo costumam estar só nele)
+    return f"{os.path.basename(meta.get('source', ''))} {doc}"
+
+class BM25Index:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snap = None  # cache de leitura (ver _snapshot)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE, df INTEGER);
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY, cid TEXT UNIQUE, len INTEGER, terms BLOB,
+                client TEXT, doc_type TEXT, date_int INTEGER);
+            CREATE TABLE IF NOT EXISTS postings (
+                term INTEGER, doc INTEGER, tf INTEGER, PRIMARY KEY (term, doc)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), n INTEGER, total INTEGER);
+            INSERT OR IGNORE INTO stats VALUES (0, 0, 0);
+        """)
+
+    # -------- escrita (ingest) --------
+    def upsert(self, ids: list[str], docs: list[str], metas: list[dict]) -> None:
+        with self._lock, self._db:
+            self._snap = None
+            self._delete(ids)
+            tfs = [Counter(tokenize(_doc_text(d, m))) for d, m in zip(docs, metas)]
+            vocab = sorted({t for tf in tfs for t in tf})
+            self._db.executemany("INSERT OR IGNORE INTO terms (term, df) VALUES (?, 0)", ((t,) for t in vocab))
+            tid = self._term_ids(vocab)
+            total = 0
+            df: Counter = Counter()
+            for cid, tf, m in zip(ids, tfs, metas):
+                n = sum(tf.values())
+                total += n
+                df.update(tf.keys())
+                terms = array("I", sorted(tid[t] for t in tf))
+                cur = self._db.execute(
+                    "INSERT INTO docs (cid, len, terms, client, doc_type, date_int) VALUES (?, ?, ?, ?, ?, ?)",
+                    (cid, n, terms.tobytes(), m.get("client", ""), m.get("doc_type", ""), m.get("date_int", 0)))
+                self._db.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                     ((tid[t], cur.lastrowid, c) for t, c in tf.items()))
+            self._db.executemany("UPDATE terms SET df = df + ? WHERE id = ?", ((c, tid[t]) for t, c in df.items()))
+            self._db.execute("UPDATE stats SET n = n + ?, total = total + ?", (len(ids), total))
+
+    def delete(self, ids: list[str]) -> None:
+        with self._lock, self._db:
+            self._snap = None
+            self._delete(ids)
+
+    def retag(self, ids: list[str], metas: list[dict]) -> None:
+        with self._lock, self._db:
+            self._snap = None
+            self._db.executemany(
+                "UPDATE docs SET client = ?, doc_type = ?, date_int = ? WHERE cid = ?",
+                ((m.get("client", ""), m.get("doc_type", ""), m.get("date_int", 0), c) for c, m in zip(ids, metas)))
+
+    def _delete(self, ids) -> None:
+        for cid in ids:
+            row = self._db.execute("SELECT id, len, terms FROM docs WHERE cid = ?", (cid,)).fetchone()
+            if row is None:
+                continue
+            doc, n, blob = row
+            terms = array("I")
+            terms.frombytes(blob)
+            self._db.executemany("DELETE FROM postings WHERE term = ? AND doc = ?", ((t, doc) for t in terms))
+            self._db.executemany("UPDATE terms SET df = df - 1 WHERE id = ?", ((t,) for t in terms))
+            self._db.execute("DELETE FROM docs WHERE id = ?", (doc,))
+            self._db.execute("UPDATE stats SET n = n - 1, total = total - ?", (n,))
+
+    def _term_ids(self, terms: list[str]) -> dict[str, int]:
+        out = {}
+        for i in range(0, len(terms), 500):  # limite de parâmetros do SQLite
+            part = terms[i:i + 500]
+            q = f"SELECT term, id FROM terms WHERE term IN ({','.join('?' * len(part))})"
+            out.update(self._db.execute(q, part).fetchall())
+        return out
+
+    # -------- consulta --------
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT n FROM stats").fetchone()[0]
+
+    def search(self, q: str, n: int = 10, where: dict | None = None) -> list[tuple[str, float]]:
+        """Top-n (id do chunk, score BM25) da pergunta; `where` é o filtro de doc_meta.where_for."""
+        terms = sorted(set(tokenize(q)))
+        if not terms:
+            return []
+        with self._lock:
+            snap = self._snapshot()
+            n_docs = len(snap["cids"])
+            if not n_docs:
+                return []
+            scores = np.zeros(n_docs, dtype=np.float32)
+            for t in terms:
+                hit = self._term(snap, t)
+                if hit is None:
+                    continue
+                tid, df = hit
+                if df > max(1, n_docs * MAX_DF_RATIO):
+                    continue
+                rows, tf = self._postings(snap, tid)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                scores[rows] += idf * tf * (K1 + 1) / (tf + snap["norm"][rows])
+            if where:
+                scores[~_mask(snap, where)] = 0
+        hits = np.flatnonzero(scores)
+        if len(hits) > n:
+            hits = hits[np.argpartition(-scores[hits], n)[:n]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(snap["cids"][i], float(scores[i])) for i in hits]
+
+    def _snapshot(self) -> dict:
+        """Comprimentos normalizados e colunas de filtro de todos os chunks (com o lock)."""
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if self._snap is not None and self._snap["version"] == version:
+            return self._snap
+        rows = self._db.execute("SELECT id, cid, len, client, doc_type, date_int FROM docs").fetchall()
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        lens = np.array([r[2] for r in rows], dtype=np.float32)
+        row_of = np.full(int(ids.max()) + 1 if len(ids) else 1, -1, dtype=np.int64)
+        row_of[ids] = np.arange(len(ids))
+        snap = {"version": version, "cids": [r[1] for r in rows], "row_of": row_of,
+                "norm": K1 * (1 - B + B * lens / (lens.mean() if len(lens) else 1.0)),
+                "date_int": np.array([r[5] or 0 for r in rows], dtype=np.int64),
+                "terms": {}, "postings": {}, "cached": 0}
+        for i, field in ((3, "client"), (4, "doc_type")):
+            codes: dict[str, int] = {}
+            snap[field] = np.array([codes.setdefault(r[i] or "", len(codes)) for r in rows], dtype=np.int32)
+            snap[f"{field}_codes"] = codes
+        self._snap = snap
+        return snap
+
+    def _term(self, snap: dict, term: str):
+        if term not in snap["terms"]:
+            snap["terms"][term] = self._db.execute(
+                "SELECT id, df FROM terms WHERE term = ? AND df > 0", (term,)).fetchone()
+        return snap["terms"][term]
+
+    def _postings(self, snap: dict, tid: int):
+        got = snap["postings"].get(tid)
+        if got is None:
+            pairs = np.array(self._db.execute("SELECT doc, tf FROM postings WHERE term = ?", (tid,)).fetchall(),
+                             dtype=np.int64).reshape(-1, 2)
+            got = (snap["row_of"][pairs[:, 0]], pairs[:, 1].astype(np.float32))
+            if snap["cached"] + len(pairs) > MAX_CACHED_POSTINGS:
+                snap["postings"].clear()
+                snap["cached"] = 0
+            snap["postings"][tid] = got
+            snap["cached"] += len(pairs)
+        return got
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+def _mask(snap: dict, where: dict) -> np.ndarray:
+    """Filtro do Chroma gerado por where_for ($and, $in, $gte, igualdade) sobre o snapshot."""
+    if "$and" in where:
+        out = np.ones(len(snap["cids"]), dtype=bool)
+        for w in where["$and"]:
+            out &= _mask(snap, w)
+        return out
+    (field, cond), = where.items()
+    if field not in ("client", "doc_type", "date_int"):
+        raise ValueError(f"filtro sem suporte no índice lexical: {field}")
+    op, val = next(iter(cond.items())) if isinstance(cond, dict) else ("$eq", cond)
+    col = snap[field]
+    if field != "date_int":
+        codes = snap[f"{field}_codes"]
+        wanted = [codes[v] for v in (val if op == "$in" else [val]) if v in codes]
+        return np.isin(col, wanted)
+    if op == "$gte":
+        return col >= val
+    if op == "$eq":
+        return col == val
+    raise ValueError(f"operador sem suporte no índice lexical: {op}")
+
+_open: dict[str, BM25Index] = {}
+_open_lock = threading.Lock()
+
+def get_index(store) -> BM25Index | None:
+    """Índice da coleção ativa, aberto uma vez por processo; None se ainda não existe (sem ingest)."""
+    path = index_path(store)
+    with _open_lock:
+        idx = _open.get(path)
+        if idx is None:
+            if not os.path.exists(path):
+                return None
+            idx = _open[path] = BM25Index(path)
+    return idx
+
+def forget(path: str) -> None:
+    """Fecha o handle de um índice que vai ser apagado (coleção descartada no blue/green)."""
+    with _open_lock:
+        idx = _open.pop(path, None)
+    if idx is not None:
+        idx.close()
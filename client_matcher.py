@@ -0,0 +1,115 @@
+# client_matcher.py
+# Resolve o cliente citado numa pergunta com UMA regex pré-compilada para todos os aliases.
+# Os aliases viram uma trie e a trie vira uma alternação fatorada por prefixo
+# ("start (?:ti|tecnologia)"), então o custo por posição da pergunta depende do tamanho
+# do alias, não da quantidade de clientes. Recarrega sozinho quando company_rules.json muda.
+
+from __future__ import annotations
+import json, os, re, threading, time
+
+def slugify(s: str) -> str:
+    """Nome do cliente -> slug usado em rótulos, pastas de relatório e metadados do Chroma."""
+    return re.sub(r"\W+", "_", s, flags=re.UNICODE).strip("_").lower() or "cliente"
+
+def _trie_regex(words: list[str]) -> str:
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True  # fim de palavra
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        # terminal: o resto é opcional; o "?" guloso tenta primeiro o alias mais longo
+        return f"(?:{body})?" if terminal else body
+
+    return build(trie)
+
+class ClientMatcher:
+    def __init__(self, path: str = "company_rules.json", check_every: float = 2.0):
+        self.path = path
+        self.check_every = check_every
+        self._lock = threading.Lock()
+        self._mtime: float | None = None
+        self._checked = 0.0
+        # snapshot imutável: (aliases->canônico, regex, clientes, org_name)
+        self._snap: tuple[dict, re.Pattern | None, list[str], str] = ({}, None, [], "Start TI")
+        self.reload()
+
+    @staticmethod
+    def _load_rules(path: str) -> dict:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {"org_name": "Start TI", "clients": {}}
+
+    def build(self, rules: dict) -> None:
+        clients = {k: [k] + list(v) for k, v in rules.get("clients", {}).items()}
+        flat = {alias.lower(): k for k, arr in clients.items() for alias in arr if alias}
+        # lookahead de largura zero: o finditer testa cada início de palavra, inclusive dentro de
+        # um alias já casado ("alfa beta" não esconde "beta gama delta" em "alfa beta gama delta")
+        rx = re.compile(rf"(?<!\w)(?=({_trie_regex(list(flat))})(?!\w))") if flat else None
+        self._snap = (flat, rx, list(clients), rules.get("org_name", "Start TI"))
+
+    def reload(self) -> None:
+        with self._lock:
+            try:
+                self._mtime = os.path.getmtime(self.path)
+            except OSError:
+                self._mtime = None
+            self.build(self._load_rules(self.path))
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked < self.check_every:
+            return
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def lookup(self, alias: str) -> str | None:
+        """Alias exato (case-insensitive) -> nome canônico."""
+        self._maybe_reload()
+        return self._snap[0].get(alias.strip().lower())
+
+    def search(self, text: str) -> str | None:
+        """
+        Cliente do alias mais longo (mais específico) citado no texto, mesmo que ele se sobreponha
+        a um alias mais curto; empate no tamanho: vence o que aparece primeiro.
+        """
+        self._maybe_reload()
+        flat, rx, _, _ = self._snap
+        if rx is None or not text:
+            return None
+        best = max(rx.finditer(text.lower()), key=lambda m: len(m.group(1)), default=None)
+        return flat[best.group(1)] if best else None
+
+    def default(self) -> str:
+        _, _, clients, org = self._snap
+        return clients[0] if clients else org
+
+# um matcher por arquivo de regras no processo (service, busca/export): o mesmo hot-reload
+# serve todo mundo, sem reler e recompilar o company_rules.json a cada chamada
+_shared: dict[str, ClientMatcher] = {}
+_shared_lock = threading.Lock()
+
+def get_matcher(path: str = "company_rules.json") -> ClientMatcher:
+    """ClientMatcher compartilhado (com hot-reload) do arquivo de regras `path`."""
+    key = os.path.abspath(path)
+    m = _shared.get(key)
+    if m is None:
+        with _shared_lock:
+            m = _shared.get(key)
+            if m is None:
+                m = _shared[key] = ClientMatcher(path)
+    return m
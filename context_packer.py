@@ -0,0 +1,163 @@
+# context_packer.py
+# Montagem do contexto do prompt a partir dos chunks recuperados: chunks vizinhos do mesmo
+# arquivo viram uma passagem só (sem o overlap do chunking, que repetia até CHUNK_OVERLAP
+# chars a cada emenda; em CSV, sem o rótulo/cabeçalho repetido), e as passagens entram por
+# relevância até o orçamento de tokens do modelo. Tokens do prompt contabilizados por
+# requisição (histograma em metrics) e no agregado (stats(): economia contra o verbatim).
+
+from __future__ import annotations
+import os, re, threading
+
+import metrics
+from near_dup import estimate_tokens
+
+# orçamento do contexto recuperado + pergunta, em tokens estimados (o prefixo fixo do cliente,
+# instruções/regras/KPIs, tem orçamento próprio em prompt_cache.PREFIX_BUDGET)
+BUDGETS = {
+    "gemini-1.5-flash": 4000,
+    "gemini-1.5-pro": 8000,
+}
+DEFAULT_BUDGET = 3000
+MIN_PART_TOKENS = 100  # passagem que não cabe inteira só entra cortada se sobrar pelo menos isto
+MAX_OVERLAP = 400      # maior emenda procurada entre dois chunks (CHUNK_OVERLAP + folga)
+_CSV_LABEL = re.compile(r"^\[(?P<name>[^\]\n]+)\] linhas (?P<a>\d+)-(?P<b>\d+)\n(?P<head>[^\n]*)\n")
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "prompt_tokens": 0, "verbatim_tokens": 0, "chunks": 0, "passages": 0,
+          "merged": 0, "overlap_chars": 0, "truncated": 0, "dropped": 0}
+
+def budget_for(model: str) -> int:
+    """Orçamento do modelo; CONTEXT_TOKEN_BUDGET (número ou "modelo=n,modelo=n") sobrepõe."""
+    raw = os.getenv("CONTEXT_TOKEN_BUDGET", "").strip()
+    if raw:
+        if "=" not in raw:
+            return int(raw)
+        over = dict(p.split("=", 1) for p in raw.split(",") if "=" in p)
+        if model in over:
+            return int(over[model])
+    return BUDGETS.get(model, DEFAULT_BUDGET)
+
+def strip_overlap(prev: str, text: str) -> str:
+    """
+    Tira do começo de `text` o que repete o fim de `prev`. O chunking emenda o fim do chunk
+    anterior + "\\n" no começo do seguinte: procura primeiro nessas quebras de linha; senão,
+    o maior prefixo (>= 20 chars) que seja sufixo de `prev`.
+    """
+    limit = min(len(text), len(prev), MAX_OVERLAP)
+    i = text.rfind("\n", 0, limit + 1)
+    while i > 0:
+        if prev.endswith(text[:i]):
+            return text[i + 1:]
+        i = text.rfind("\n", 0, i)
+    for n in range(limit, 19, -1):
+        if prev.endswith(text[:n]):
+            return text[n:].lstrip("\n")
+    return text
+
+def _join(prev: str, text: str) -> str:
+    """Junta dois chunks vizinhos do mesmo arquivo."""
+    a, b = _CSV_LABEL.match(prev), _CSV_LABEL.match(text)
+    if a and b and a["name"] == b["name"] and a["head"] == b["head"]:
+        # blocos de linhas do CSV: um rótulo/cabeçalho para o intervalo todo
+        top = f"[{a['name']}] linhas {a['a']}-{b['b']}\n{a['head']}\n"
+        return top + prev[a.end():] + "\n" + text[b.end():]
+    return prev + "\n\n" + strip_overlap(prev, text)  # o chunking quebra entre parágrafos
+
+def merge(docs: list[str], metas: list[dict]) -> list[dict]:
+    """
+    Agrupa os chunks de cada fonte em passagens de índices consecutivos. Cada passagem:
+    {"text", "meta" (do 1º chunk), "source", "chunks": [índices], "rank" (melhor posição
+    na busca), "dups"}. Saem ordenadas pelo rank.
+    """
+    by_source: dict[str, list[tuple[int, int, str, dict]]] = {}
+    for rank, (d, m) in enumerate(zip(docs, metas)):
+        idx = m.get("chunk")
+        by_source.setdefault(m.get("source", ""), []).append(
+            (idx if isinstance(idx, int) else -1, rank, d, m))
+    out = []
+    for source, items in by_source.items():
+        items.sort(key=lambda t: (t[0], t[1]))
+        cur = None
+        for idx, rank, d, m in items:
+            if cur is not None and idx >= 0 and idx == cur["chunks"][-1] + 1:
+                cur["text"] = _join(cur["text"], d)
+                cur["chunks"].append(idx)
+                cur["rank"] = min(cur["rank"], rank)
+                cur["dups"] = max(cur["dups"], m.get("dups") or 0)
+                continue
+            if cur is not None and idx >= 0 and idx == cur["chunks"][-1]:
+                continue  # o mesmo chunk duas vezes
+            cur = {"text": d, "meta": m, "source": source, "chunks": [idx], "rank": rank, "dups": m.get("dups") or 0}
+            out.append(cur)
+    out.sort(key=lambda p: p["rank"])
+    return out
+
+def label(p: dict) -> str:
+    """Citação da passagem: [arquivo | chunk n] ou [arquivo | chunks a-b]."""
+    src = os.path.basename(p["source"])
+    a, b = p["chunks"][0], p["chunks"][-1]
+    if a < 0:
+        return f"[{src} | chunk ?]"
+    return f"[{src} | chunk {a}]" if a == b else f"[{src} | chunks {a}-{b}]"
+
+def _cut(text: str, tokens: int) -> str:
+    """Corta o texto para caber em ~tokens, na última quebra de linha (ou espaço) antes do limite."""
+    limit = max(0, tokens * 4 - 4)
+    if len(text) <= limit:
+        return text
+    head = text[:limit]
+    for sep in ("\n", " "):
+        i = head.rfind(sep)
+        if i > limit // 2:
+            return head[:i].rstrip() + " […]"
+    return head + " […]"
+
+def pack(passages: list[dict], budget: int, reserved: int = 0) -> tuple[list[tuple[dict, str]], dict]:
+    """
+    Escolhe as passagens em ordem de rank até o orçamento (menos `reserved`: instruções e
+    pergunta). A que não cabe entra cortada se sobrarem MIN_PART_TOKENS; senão é pulada e as
+    seguintes (menores) ainda podem entrar. Retorna ([(passagem, texto)], {"truncated", "dropped"}).
+    """
+    left = budget - reserved
+    chosen, truncated, dropped = [], 0, 0
+    for p in passages:
+        head = label(p)
+        if p["dups"]:
+            # canônico de um trecho repetido: o modelo sabe que o conteúdo aparece em outros documentos
+            head = head[:-1] + f" | +{p['dups']} doc(s) com o mesmo trecho]"
+        cost = estimate_tokens(head) + estimate_tokens(p["text"]) + 1
+        if cost <= left:
+            chosen.append((p, head + "\n" + p["text"]))
+            left -= cost
+        elif left - estimate_tokens(head) >= MIN_PART_TOKENS:
+            body = _cut(p["text"], left - estimate_tokens(head) - 1)
+            chosen.append((p, head + "\n" + body))
+            left -= estimate_tokens(head) + estimate_tokens(body) + 1
+            truncated += 1
+        else:
+            dropped += 1
+    return chosen, {"truncated": truncated, "dropped": dropped}
+
+def assemble(docs: list[str], metas: list[dict], budget: int, reserved: int = 0) -> tuple[list[tuple[dict, str]], dict]:
+    """merge() + pack(). Retorna as passagens escolhidas e os contadores da requisição."""
+    passages = merge(docs, metas)
+    chosen, info = pack(passages, budget, reserved)
+    info.update(chunks=len(docs), passages=len(passages), merged=len(docs) - len(passages),
+                overlap_chars=max(0, sum(map(len, docs)) - sum(len(p["text"]) for p in passages)))
+    return chosen, info
+
+def record(usage: dict) -> None:
+    """Contabiliza uma requisição (agregado + histograma por endpoint/cliente)."""
+    metrics.observe_tokens(usage["prompt_tokens"])
+    with _stats_lock:
+        _stats["requests"] += 1
+        for key in ("prompt_tokens", "verbatim_tokens", "chunks", "passages", "merged",
+                    "overlap_chars", "truncated", "dropped"):
+            _stats[key] += usage.get(key, 0)
+
+def stats() -> dict:
+    with _stats_lock:
+        st = dict(_stats)
+    v = st["verbatim_tokens"]
+    st["saved_pct"] = round(100 * (1 - st["prompt_tokens"] / v), 1) if v else 0.0
+    return st
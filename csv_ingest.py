@@ -0,0 +1,192 @@
+# csv_ingest.py
+# CSVs de data/raw (Sheets exportados pelo smart_search_sa) no RAG, lidos em streaming:
+# as linhas viram chunks em blocos com o cabeçalho repetido no topo (cada chunk se explica
+# sozinho para o embedder) e as células numéricas vão para uma tabela lateral em SQLite
+# (data/derived/tables.sqlite) para consulta exata, sem depender de texto tabular embedado.
+
+from __future__ import annotations
+import argparse, csv, json, os, re, sqlite3, threading
+
+TABLES_DB = os.getenv("TABLES_DB", os.path.join("data", "derived", "tables.sqlite"))
+SNIFF_BYTES = 64 * 1024
+INSERT_BATCH = 5000
+
+_NUM = re.compile(r"^[-+]?[\d.,]+$")
+_THOUSANDS_DOT = re.compile(r"^[-+]?\d{1,3}(\.\d{3})+$")
+
+def sniff(path: str) -> tuple[str, str]:
+    """(encoding, delimitador) pelo começo do arquivo (Sheets: utf-8; exports antigos: latin-1 e ';')."""
+    with open(path, "rb") as f:
+        prefix = f.read(SNIFF_BYTES)
+    try:
+        text, enc = prefix.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError as e:
+        # corte no meio de um caractere multibyte no fim do prefixo ainda é utf-8
+        if e.start >= len(prefix) - 3:
+            text, enc = prefix[: e.start].decode("utf-8"), "utf-8"
+        else:
+            text, enc = prefix.decode("latin-1"), "latin-1"
+    if enc == "utf-8" and text.startswith("\ufeff"):
+        enc = "utf-8-sig"
+    header = text.lstrip("\ufeff").splitlines()[0] if text.strip() else ""
+    counts = {d: header.count(d) for d in (",", ";", "\t")}
+    return enc, max(counts, key=counts.get) if any(counts.values()) else ","
+
+def iter_rows(path: str):
+    """Gera as linhas do CSV (a 1ª é o cabeçalho) sem carregar o arquivo."""
+    enc, delim = sniff(path)
+    with open(path, "r", encoding=enc, errors="ignore", newline="") as f:
+        for row in csv.reader(f, delimiter=delim):
+            if any(c.strip() for c in row):
+                yield [c.strip() for c in row]
+
+def iter_row_blocks(path: str, size: int = 1200):
+    """Chunks de linhas até ~size chars, cada um com "[arquivo] linhas a-b" + cabeçalho no topo."""
+    rows = iter_rows(path)
+    header = next(rows, None)
+    if header is None:
+        return
+    name = os.path.basename(path)
+    head = " | ".join(header)
+    block, first, n = [], 1, 0
+    used = 0
+    for n, row in enumerate(rows, 1):
+        line = " | ".join(row)
+        if block and used + len(line) + 1 > size - len(head) - len(name) - 24:
+            yield f"[{name}] linhas {first}-{n - 1}\n{head}\n" + "\n".join(block)
+            block, first, used = [], n, 0
+        block.append(line)
+        used += len(line) + 1
+    if block:
+        yield f"[{name}] linhas {first}-{n}\n{head}\n" + "\n".join(block)
+
+def parse_number(s: str) -> float | None:
+    """Número de planilha: "R$ 1.234,56", "12,5%", "1,234.56", "980" -> float; texto -> None."""
+    s = s.replace("R$", "").replace("BRL", "").replace("%", "").replace(" ", "").replace("\xa0", "")
+    if not s or not _NUM.match(s) or not any(ch.isdigit() for ch in s):
+        return None
+    if "," in s and "." in s:
+        # o último separador é o decimal
+        s = s.replace(".", "").replace(",", ".") if s.rfind(",") > s.rfind(".") else s.replace(",", "")
+    elif "," in s:
+        s = s.replace(",", ".") if s.count(",") == 1 else s.replace(",", "")
+    elif _THOUSANDS_DOT.match(s):
+        s = s.replace(".", "")
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+class TableStore:
+    """
+    Tabela lateral: `sheets` (um registro por CSV, com cliente/tipo/data) e `cells`
+    (fonte, linha, chave da linha, coluna, valor) só com as células numéricas. A chave
+    da linha junta as células não numéricas (ex.: "2025-09 | Google Ads").
+    """
+
+    def __init__(self, path: str = TABLES_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS sheets (
+                source TEXT PRIMARY KEY, sha1 TEXT, client TEXT, doc_type TEXT, date TEXT,
+                columns TEXT, rows INTEGER);
+            CREATE TABLE IF NOT EXISTS cells (
+                source TEXT, row INTEGER, key TEXT, col TEXT, value REAL);
+            CREATE INDEX IF NOT EXISTS cells_by_col ON cells (col, key);
+            CREATE INDEX IF NOT EXISTS cells_by_source ON cells (source);
+        """)
+
+    def sha1_of(self, source: str) -> str | None:
+        with self._lock:
+            row = self._db.execute("SELECT sha1 FROM sheets WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, source: str, sha1: str, tags: dict) -> int:
+        """(Re)carrega o CSV se o hash mudou. Retorna o nº de células numéricas gravadas."""
+        if self.sha1_of(source) == sha1:
+            self.retag(source, tags)
+            return 0
+        rows = iter_rows(source)
+        header = next(rows, None) or []
+        n_rows = n_cells = 0
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM cells WHERE source = ?", (source,))
+            batch = []
+            for n_rows, row in enumerate(rows, 1):
+                values = [parse_number(v) for v in row]
+                key = " | ".join(v for v, x in zip(row, values) if x is None and v)
+                for i, x in enumerate(values):
+                    if x is not None:
+                        col = header[i] if i < len(header) and header[i] else f"col{i + 1}"
+                        batch.append((source, n_rows, key, col, x))
+                if len(batch) >= INSERT_BATCH:
+                    self._db.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?)", batch)
+                    n_cells += len(batch)
+                    batch = []
+            if batch:
+                self._db.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?)", batch)
+                n_cells += len(batch)
+            self._db.execute(
+                "INSERT OR REPLACE INTO sheets VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, sha1, tags.get("client", ""), tags.get("doc_type", ""), tags.get("date", ""),
+                 json.dumps(header, ensure_ascii=False), n_rows))
+        return n_cells
+
+    def retag(self, source: str, tags: dict) -> None:
+        with self._lock, self._db:
+            self._db.execute("UPDATE sheets SET client = ?, doc_type = ?, date = ? WHERE source = ?",
+                             (tags.get("client", ""), tags.get("doc_type", ""), tags.get("date", ""), source))
+
+    def sources(self) -> list[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT source FROM sheets")]
+
+    def drop(self, source: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM cells WHERE source = ?", (source,))
+            self._db.execute("DELETE FROM sheets WHERE source = ?", (source,))
+
+    def lookup(self, col: str | None = None, key: str | None = None, client: str | None = None,
+               source: str | None = None, limit: int = 50) -> list[dict]:
+        """Células numéricas por coluna/chave (LIKE, sem diferenciar maiúsculas), do cliente e da org."""
+        sql = ("SELECT c.source, c.row, c.key, c.col, c.value FROM cells c "
+               "JOIN sheets s ON s.source = c.source WHERE 1=1")
+        args: list = []
+        if col:
+            sql += " AND c.col LIKE ?"
+            args.append(f"%{col}%")
+        if key:
+            sql += " AND c.key LIKE ?"
+            args.append(f"%{key}%")
+        if client:
+            sql += " AND s.client IN (?, '')"
+            args.append(client)
+        if source:
+            sql += " AND c.source = ?"
+            args.append(source)
+        sql += " ORDER BY c.source, c.row LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [dict(zip(("source", "row", "key", "col", "value"), r)) for r in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+def main():
+    ap = argparse.ArgumentParser(description="Consulta exata na tabela lateral dos CSVs ingeridos.")
+    ap.add_argument("--col", help="Coluna (parte do nome), ex.: Custo")
+    ap.add_argument("--key", help="Chave da linha (parte), ex.: 2025-09")
+    ap.add_argument("--client", help="Cliente (slug)")
+    ap.add_argument("--limit", type=int, default=50)
+    args = ap.parse_args()
+    for r in TableStore().lookup(args.col, args.key, args.client, limit=args.limit):
+        print(f"{os.path.basename(r['source'])} | linha {r['row']} | {r['key']} | {r['col']} = {r['value']:g}")
+
+if __name__ == "__main__":
+    main()
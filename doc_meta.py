@@ -0,0 +1,114 @@
+# doc_meta.py
+# Metadados por documento para o RAG: cliente (slug), tipo (daily/weekly/...) e data.
+# Quem exporta (smart_search_sa, ads_kpis_from_csv) grava um sidecar "<arquivo>.meta.json"
+# com o que já sabe; sem sidecar, o ingest infere pelo nome do arquivo (aliases do
+# company_rules.json, tokens/sinônimos de cada tipo, data no nome) e usa o mtime como data.
+# Na consulta, where_for() vira o filtro de metadados do Chroma (busca só no corpus do cliente).
+
+from __future__ import annotations
+import json, os, re, unicodedata
+from datetime import date, datetime
+
+from client_matcher import ClientMatcher, slugify
+
+SIDECAR = ".meta.json"
+# diretório do corpus, relativo ao cwd (APP_ROOT no service): o mesmo valor para exportadores,
+# ingest (CLI, /ingest, daemon de watch) e prompt_cache
+RAW_DIR = "data/raw"
+SHARED = ""  # documento sem cliente (da org): visível para todos os clientes
+
+_YMD = re.compile(r"(?<!\d)(20\d{2})[ ._-](\d{1,2})[ ._-](\d{1,2})(?!\d)")
+_DMY = re.compile(r"(?<!\d)(\d{1,2})[ ./_-](\d{1,2})[ ./_-](20\d{2})(?!\d)")
+
+def _plain(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+
+def sidecar_path(path: str) -> str:
+    return path + SIDECAR
+
+def write_sidecar(path: str, client: str | None = None, doc_type: str | None = None,
+                  doc_date: str | None = None) -> str:
+    """Grava os metadados conhecidos de um arquivo exportado (cliente em slug, data AAAA-MM-DD)."""
+    meta = {"client": slugify(client) if client else SHARED, "doc_type": doc_type or "",
+            "date": (doc_date or "")[:10]}
+    out = sidecar_path(path)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return out
+
+def read_sidecar(path: str) -> dict:
+    try:
+        with open(sidecar_path(path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def date_from_name(name: str) -> str | None:
+    for rx, order in ((_YMD, (0, 1, 2)), (_DMY, (2, 1, 0))):
+        for m in rx.finditer(name):
+            y, mo, d = (int(m.group(i + 1)) for i in order)
+            try:
+                return date(y, mo, d).isoformat()
+            except ValueError:
+                continue
+    return None
+
+class DocTagger:
+    """Infere {client, doc_type, date} de um arquivo de data/raw (sidecar tem prioridade)."""
+
+    def __init__(self, rules_path: str = "company_rules.json"):
+        self.matcher = ClientMatcher(rules_path, check_every=1e9)
+        rules = ClientMatcher._load_rules(rules_path)
+        words: dict[str, set[str]] = {}
+        for t, nm in rules.get("naming", {}).items():
+            words[t] = {_plain(w) for w in nm.get("tokens", []) + rules.get("synonyms", {}).get(t, []) if w}
+        # token que aparece em vários tipos (ex.: "MAP") não diz nada sobre o tipo
+        shared = {w for ws in words.values() for w in ws if sum(w in o for o in words.values()) > 1}
+        self._types: list[tuple[str, re.Pattern]] = []
+        for t, ws in words.items():
+            own = sorted(ws - shared, key=len, reverse=True)
+            if own:
+                self._types.append((t, re.compile(r"(?<!\w)(?:" + "|".join(map(re.escape, own)) + r")(?!\w)")))
+
+    def doc_type(self, name: str) -> str:
+        low = _plain(name)
+        if low.startswith("ads_kpis_"):
+            return "kpis"
+        hits = [(m.start(), t) for t, rx in self._types for m in [rx.search(low)] if m]
+        return min(hits)[1] if hits else ""
+
+    def tag(self, path: str, mtime: float | None = None) -> dict:
+        name = os.path.splitext(os.path.basename(path))[0]
+        side = read_sidecar(path)
+        client = side.get("client")
+        if client is None:
+            canonical = self.matcher.search(name.replace("_", " "))
+            client = slugify(canonical) if canonical else SHARED
+        doc_date = side.get("date") or date_from_name(name)
+        if not doc_date and mtime is not None:
+            doc_date = datetime.fromtimestamp(mtime).date().isoformat()
+        doc_date = doc_date or ""
+        return {
+            "client": client,
+            "doc_type": side.get("doc_type") or self.doc_type(name),
+            "date": doc_date,
+            "date_int": int(doc_date.replace("-", "")) if doc_date else 0,  # p/ filtros $gte/$lte
+        }
+
+def where_for(client: str | None = None, doc_type: str | None = None, since: str | None = None,
+              include_shared: bool = True) -> dict | None:
+    """
+    Filtro de metadados do Chroma para a consulta: chunks do cliente (e, por padrão, os
+    compartilhados da org), opcionalmente de um tipo e a partir de uma data (AAAA-MM-DD).
+    """
+    conds = []
+    if client:
+        conds.append({"client": {"$in": [client, SHARED]}} if include_shared else {"client": client})
+    if doc_type:
+        conds.append({"doc_type": doc_type})
+    if since:
+        conds.append({"date_int": {"$gte": int(since[:10].replace("-", ""))}})
+    if not conds:
+        return None
+    return conds[0] if len(conds) == 1 else {"$and": conds}
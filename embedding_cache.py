@@ -0,0 +1,179 @@
+# embedding_cache.py
+# Cache em disco de embeddings por (modelo, hash do chunk): o mesmo texto não é embedado
+# de novo num rebuild nem quando o mesmo documento volta do Drive com outro nome.
+# Vetores numa matriz float32 memory-mapped (uma por modelo) + index.json (hash -> linha);
+# limite em bytes com despejo LRU em lote e contadores de acerto.
+
+from __future__ import annotations
+import json, os, re, threading
+
+import numpy as np
+
+CACHE_DIR = os.getenv("EMBED_CACHE_DIR") or None  # padrão: <chroma>/embed_cache
+MAX_BYTES = int(os.getenv("EMBED_CACHE_MB", "256")) * 1024 * 1024
+EVICT_FRACTION = 0.1  # ao lotar, libera 10% das linhas de uma vez
+
+def model_key(ef) -> str:
+    """Identificador estável do modelo da função de embedding (nome + model_name, se houver)."""
+    try:
+        name = ef.name()
+    except Exception:
+        name = type(ef).__name__
+    model = getattr(ef, "model_name", None) or getattr(ef, "MODEL_NAME", None) or ""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", f"{name}-{model}".strip("-")) or "default"
+
+class EmbeddingCache:
+    def __init__(self, root: str, model: str, max_bytes: int = MAX_BYTES):
+        self.dir = os.path.join(root, model)
+        self.model = model
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(self.dir, "index.json")
+        self._vec_path = os.path.join(self.dir, "vectors.f32")
+        self._mtime = None
+        self._reset()
+        self.hits = self.misses = self.evictions = 0
+
+    def _reset(self) -> None:
+        self.dim = 0
+        self.capacity = 0
+        self._tick = 0
+        self._rows: dict[str, list[int]] = {}  # hash -> [linha, último uso]
+        self._free: list[int] = []
+        self._next = 0  # 1ª linha nunca usada
+        self._mat = None
+
+    def refresh(self) -> None:
+        """Relê o índice se outro processo o regravou (chamar com o lock de ingest tomado)."""
+        try:
+            mtime = os.stat(self._index_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            self._reset()
+            self._mtime = mtime
+            if mtime is None:
+                return
+            try:
+                with open(self._index_path, "r", encoding="utf-8") as f:
+                    idx = json.load(f)
+            except (OSError, ValueError):
+                return
+            if not os.path.exists(self._vec_path):
+                return
+            self.dim, self.capacity, self._tick = idx["dim"], idx["capacity"], idx["tick"]
+            self._rows = idx["rows"]
+            used = {r for r, _ in self._rows.values()}
+            self._next = max(used) + 1 if used else 0
+            self._free = [r for r in range(self._next) if r not in used]
+            self._mat = np.memmap(self._vec_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _open(self, dim: int) -> None:
+        # capacidade fixa pelo limite de bytes; o arquivo é esparso e cresce conforme é escrito
+        os.makedirs(self.dir, exist_ok=True)
+        self.dim = dim
+        self.capacity = max(1, self.max_bytes // (dim * 4))
+        self._mat = np.memmap(self._vec_path, dtype=np.float32, mode="w+", shape=(self.capacity, dim))
+
+    def get_many(self, hashes: list[str]) -> list[np.ndarray | None]:
+        with self._lock:
+            self._tick += 1
+            out = []
+            for h in hashes:
+                item = self._rows.get(h)
+                if item is None or self._mat is None:
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                item[1] = self._tick
+                self.hits += 1
+                out.append(np.array(self._mat[item[0]]))
+            return out
+
+    def put_many(self, hashes: list[str], vectors) -> None:
+        if not hashes or self.max_bytes <= 0:
+            return
+        with self._lock:
+            vecs = np.asarray(vectors, dtype=np.float32)
+            if self._mat is None:
+                self._open(vecs.shape[1])
+            if vecs.shape[1] != self.dim:
+                return  # modelo mudou de dimensão sem mudar de nome: não mistura
+            self._tick += 1
+            for h, v in zip(hashes, vecs):
+                if h in self._rows:
+                    self._rows[h][1] = self._tick
+                    continue
+                row = self._alloc()
+                self._mat[row] = v
+                self._rows[h] = [row, self._tick]
+
+    def _alloc(self) -> int:
+        if not self._free and self._next >= self.capacity:
+            self._evict(max(1, int(self.capacity * EVICT_FRACTION)))
+        if self._free:
+            return self._free.pop()
+        self._next += 1
+        return self._next - 1
+
+    def _evict(self, n: int) -> None:
+        oldest = sorted(self._rows.items(), key=lambda kv: kv[1][1])[:n]
+        for h, (row, _) in oldest:
+            del self._rows[h]
+            self._free.append(row)
+        self.evictions += len(oldest)
+        # índice em disco sem as linhas liberadas antes de reusá-las: se o processo cair no
+        # meio do ingest, nenhum hash antigo aponta para um vetor sobrescrito
+        self._write_index()
+
+    def _write_index(self) -> None:
+        idx = {"model": self.model, "dim": self.dim, "capacity": self.capacity,
+               "tick": self._tick, "rows": self._rows}
+        tmp = f"{self._index_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(idx, f)
+        os.replace(tmp, self._index_path)
+        self._mtime = os.stat(self._index_path).st_mtime_ns
+
+    def save(self) -> None:
+        with self._lock:
+            if self._mat is None:
+                return
+            self._mat.flush()  # vetores antes do índice que aponta para eles
+            self._write_index()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "model": self.model,
+                "entries": len(self._rows),
+                "bytes": len(self._rows) * self.dim * 4,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+            }
+
+_caches: dict[tuple[str, str], EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+def get_cache(root: str, ef) -> EmbeddingCache | None:
+    """Cache compartilhado do processo para (diretório, modelo); None se desligado (EMBED_CACHE_MB=0)."""
+    if ef is None or MAX_BYTES <= 0:
+        return None
+    root = CACHE_DIR or root
+    key = (root, model_key(ef))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = EmbeddingCache(root, key[1], MAX_BYTES)
+    cache.refresh()
+    return cache
+
+def all_stats() -> dict:
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {c.model: c.stats() for c in caches}
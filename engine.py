@@ -0,0 +1,230 @@
+# engine.py
+# Execução dos estágios do pipeline dentro do processo do service (FastAPI).
+# Chroma, Gemini, pandas e o cliente Drive ficam carregados entre requisições;
+# o modo "subprocess" (RUN_MODE=subprocess) continua disponível como isolamento opcional.
+
+from __future__ import annotations
+import os, re, subprocess, sys, traceback
+from contextlib import nullcontext
+
+from admission import Overloaded
+from answer_cache import AnswerCache, cache_key
+from report_registry import get_registry, new_run_id
+from vectorstore import get_store
+
+PY = sys.executable
+ROOT = os.getenv("APP_ROOT", os.getcwd())
+MODE = os.getenv("RUN_MODE", "inprocess").strip().lower()  # "inprocess" | "subprocess"
+
+DOC_TYPES = ["daily", "weekly", "checkin", "planejamento", "replanejamento", "benchmarking"]
+
+def isolated() -> bool:
+    return MODE == "subprocess"
+
+def warmup() -> None:
+    """Importa os módulos pesados uma vez no startup (o VectorStore é aberto pelo service)."""
+    if isolated():
+        return
+    import assistant_cli  # noqa: F401  (pandas, googleapiclient, genai)
+
+def _read(path: str | None) -> str:
+    if not path:
+        return ""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception:
+        return ""
+
+# -------------------- /chat --------------------
+# cache de respostas na frente do ask() (invalidado pela versão do corpus a cada ingest)
+ANSWER_CACHE = AnswerCache.from_env()
+
+def _cache_key(q: str, take: int | None, client_slug: str) -> str:
+    return cache_key(q, client_slug, get_store().version(), take or 4)
+
+def _sources_in(reply: str) -> list[str]:
+    """Citações da linha "Fontes: [a | chunk 1] | [b | chunk 2]" que o ask() põe no fim da resposta."""
+    _, sep, tail = reply.rpartition("\n\nFontes: ")
+    return re.findall(r"\[[^\]]*\]", tail) if sep else []
+
+def _chat_uncached(q: str, take: int | None, client_slug: str) -> dict:
+    if isolated():
+        cmd = [PY, os.path.join(ROOT, "ask_with_context.py"), "--q", q]
+        if take:
+            cmd += ["--take", str(take)]
+        cmd += ["--client", client_slug]
+        proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+        reply = proc.stdout.strip() if proc.returncode == 0 else ""
+        return {"reply": reply, "stdout": proc.stdout, "stderr": proc.stderr, "sources": _sources_in(reply)}
+
+    from ask_with_context import ask
+    usage: dict = {}
+    try:
+        reply = ask(q, k=take or 4, client=client_slug, usage=usage)
+        return {"reply": reply, "stdout": reply, "stderr": "", "prompt_tokens": usage.get("prompt_tokens"),
+                "sources": usage.get("sources", [])}
+    except (Exception, SystemExit) as e:
+        return {"reply": "", "stdout": "", "stderr": f"{e}\n{traceback.format_exc()}"}
+
+def chat(q: str, take: int | None, client_slug: str) -> dict:
+    """
+    Responde a pergunta via RAG. Retorna {"reply", "stdout", "stderr", "cached", "prompt_tokens",
+    "sources"} (tokens do prompt enviado ao LLM: 0 no cache, None no modo subprocess; citações
+    usadas: no modo subprocess, lidas da linha "Fontes:"). O cache guarda as citações junto da
+    resposta, como o chat_stream, para um hit no /chat/stream não sair sem elas.
+    """
+    key = _cache_key(q, take, client_slug)
+    hit = ANSWER_CACHE.get(key)
+    if hit is not None:
+        return {"reply": hit["reply"], "stdout": hit["reply"], "stderr": "", "cached": True, "prompt_tokens": 0,
+                "sources": hit.get("sources", [])}
+
+    res = _chat_uncached(q, take, client_slug)
+    if res["reply"]:
+        ANSWER_CACHE.put(key, {"reply": res["reply"], "sources": res.get("sources", [])})
+    res["cached"] = False
+    return res
+
+def chat_stream(q: str, take: int | None, client_slug: str):
+    """Eventos (nome, payload) para o /chat/stream. No modo subprocess vem tudo num único token."""
+    key = _cache_key(q, take, client_slug)
+    hit = ANSWER_CACHE.get(key)
+    if hit is not None:
+        yield "sources", hit.get("sources", [])
+        yield "token", hit["reply"]
+        yield "done", hit["reply"]
+        return
+
+    if isolated():
+        res = _chat_uncached(q, take, client_slug)
+        if res["reply"]:
+            ANSWER_CACHE.put(key, {"reply": res["reply"], "sources": res["sources"]})
+        yield "sources", res["sources"]
+        yield "token", res["reply"]
+        yield "done", res["reply"]
+        return
+
+    from ask_with_context import ask_stream
+    sources: list[str] = []
+    for name, payload in ask_stream(q, k=take or 4, client=client_slug):
+        if name == "sources":
+            sources = payload
+        elif name == "done" and payload:
+            ANSWER_CACHE.put(key, {"reply": payload, "sources": sources})
+        yield name, payload
+
+# -------------------- /run --------------------
+def run(
+    client: str,
+    q: str,
+    take: int | None = 1,
+    doc_type: str | None = None,
+    google_csv: str | None = None,
+    meta_csv: str | None = None,
+    cli_path: str = "assistant_cli.py",
+    gate=None,
+) -> dict:
+    """
+    Roda o roteador (KPIs -> busca -> ingest -> relatório).
+    Retorna ok/run_id/cmd/report_path/markdown/timings/stdout/stderr; o relatório é exatamente
+    o que este run registrou no manifest (nunca o "mais recente" de outro run concorrente).
+    `gate(fase)` ("drive" | "llm") devolve o context manager da vaga de cada fase (admission);
+    Overloaded sobe para o service responder 429. No modo subprocess as fases não se separam:
+    o processo roda com as duas vagas.
+    """
+    run_id = new_run_id()
+    gate = gate or (lambda phase: nullcontext())
+
+    if isolated():
+        cmd = [PY, cli_path, "--client", client, "--q", q, "--take", str(take or 1), "--run-id", run_id]
+        if doc_type:
+            cmd += ["--type", doc_type]
+        if google_csv:
+            cmd += ["--google_csv", google_csv]
+        if meta_csv:
+            cmd += ["--meta_csv", meta_csv]
+        with gate("drive"), gate("llm"):
+            proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+        entry = get_registry().get(run_id) or {}
+        return {
+            "ok": proc.returncode == 0,
+            "run_id": run_id,
+            "cmd": " ".join(cmd),
+            "report_path": entry.get("path"),
+            "markdown": _read(entry.get("path")),
+            "timings": entry.get("timings", {}),
+            "stdout": proc.stdout,
+            "stderr": proc.stderr,
+        }
+
+    from assistant_cli import run_pipeline
+    lines: list[str] = []
+    cmd = f"run_pipeline(client={client!r}, type={doc_type or 'auto'!r}, take={take or 1}, run_id={run_id!r})"
+    try:
+        res = run_pipeline(client, q, take=take or 1, doc_type=doc_type,
+                           google_csv=google_csv, meta_csv=meta_csv, run_id=run_id, log=lines.append, gate=gate)
+    except Overloaded:
+        raise
+    except (Exception, SystemExit) as e:
+        return {
+            "ok": False,
+            "run_id": run_id,
+            "cmd": cmd,
+            "report_path": None,
+            "markdown": "",
+            "timings": {},
+            "stdout": "\n".join(lines),
+            "stderr": f"{e}\n{traceback.format_exc()}",
+        }
+    return {
+        "ok": True,
+        "run_id": run_id,
+        "cmd": cmd,
+        "report_path": res["report_path"],
+        "markdown": _read(res["report_path"]),
+        "timings": res["timings"],
+        "stdout": "\n".join(lines),
+        "stderr": "",
+    }
+
+# -------------------- /ingest --------------------
+def ingest(client: str, types: list[str] | None = None, export: str = "txt", job=None,
+           rebuild: bool = False) -> dict:
+    """
+    Busca/exporta cada tipo de documento do cliente no Drive e reingere data/raw.
+    Com o daemon de ingest_watch rodando, só espera a passada dele (ensure_ingested);
+    rebuild=True reindexa tudo numa coleção nova (blue/green) em vez do incremental.
+    Se `job` vier (jobs.Job), cada etapa é registrada com sua duração.
+    """
+    doc_types = types or DOC_TYPES
+    stage = job.stage if job is not None else (lambda name: nullcontext())
+    saved: list[str] = []
+
+    for t in doc_types:
+        with stage(f"smart_search:{t}"):
+            if isolated():
+                subprocess.run(
+                    [PY, "smart_search_sa.py", "--client", client, "--type", t, "--export", export],
+                    cwd=ROOT, check=True,
+                )
+            else:
+                from smart_search_sa import search_and_export
+                path = search_and_export(client, t, export=export)
+                if path:
+                    saved.append(path)
+
+    with stage("ingest_txt"):
+        if isolated():
+            cmd = ["ingest_txt.py", "--no-progress", "--rebuild"] if rebuild else ["ingest_watch.py", "--sync"]
+            subprocess.run([PY, *cmd], cwd=ROOT, check=True)
+            stats = None
+        elif rebuild:
+            from ingest_txt import ingest as ingest_raw
+            stats = ingest_raw(rebuild=True)
+        else:
+            from ingest_watch import ensure_ingested
+            stats = ensure_ingested()["ingest"]
+
+    return {"client": client, "types": doc_types, "export": export, "saved": saved, "ingest": stats,
+            "corpus_version": get_store().version()}
@@ -1,64 +1,657 @@
 from __future__ import annotations
-import os, glob, textwrap
-
-# Chroma compat
-try:
-    from chromadb import PersistentClient
-    client = PersistentClient(path=".chromadb")
-except Exception:
-    from chromadb import Client
-    from chromadb.config import Settings
-    client = Client(Settings(persist_directory=".chromadb"))
-
-COLLECTION = "workspace_knowledge"
-
-def chunk(text: str, size: int = 1200, overlap: int = 150):
-    # quebra por parágrafos e faz janela deslizante
-    parts = []
+import argparse, contextvars, glob, hashlib, io, json, multiprocessing, os, textwrap, threading, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tqdm import tqdm
+
+import metrics
+from bm25_index import BM25Index, forget as forget_bm25, index_path as bm25_path
+from csv_ingest import TableStore, iter_row_blocks
+from doc_meta import RAW_DIR, DocTagger
+from embedding_cache import get_cache
+from near_dup import DedupIndex, numbers, signature
+from vectorstore import get_store
+
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 150
+READ_BLOCK = 64 * 1024
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))  # chunks por lote de embedding/upsert
+PROCS = int(os.getenv("INGEST_PROCS", str(min(4, os.cpu_count() or 1))))
+EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "2"))
+INGEST_EXTS = (".txt", ".csv")
+STREAM_BYTES = int(os.getenv("INGEST_STREAM_MB", "16")) * 1024 * 1024  # acima disso: streaming no processo principal
+PARALLEL_MIN_BYTES = int(os.getenv("INGEST_PARALLEL_MIN_MB", "4")) * 1024 * 1024  # abaixo: subir processos não compensa
+DEDUP = os.getenv("INGEST_DEDUP", "1") == "1"  # colapsa chunks quase iguais (near_dup) num canônico
+
+def iter_paragraphs(f, max_len: int = CHUNK_SIZE, block: int = READ_BLOCK):
+    """
+    Lê o arquivo texto em blocos e gera os parágrafos (separados por linha em branco),
+    igual a text.split("\n\n") mas sem carregar o arquivo inteiro. Parágrafo maior que
+    max_len (ex.: transcrição sem linhas em branco) sai em pedaços, cortados em fim de linha.
+    """
+    buf = ""
+    while True:
+        data = f.read(block)
+        if not data:
+            break
+        buf += data
+        paras = buf.split("\n\n")
+        buf = paras.pop()
+        for para in paras:
+            yield from _cut(para, max_len)
+        while len(buf) > max_len:
+            head, buf = _split_long(buf, max_len)
+            yield head
+    yield from _cut(buf, max_len)
+
+def _split_long(text: str, max_len: int) -> tuple[str, str]:
+    cut = text.rfind("\n", 0, max_len)
+    if cut <= 0:
+        return text[:max_len], text[max_len:]
+    return text[:cut], text[cut + 1:]
+
+def _cut(para: str, max_len: int):
+    while len(para) > max_len:
+        head, para = _split_long(para, max_len)
+        yield head
+    yield para
+
+def iter_chunks(paragraphs, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    """Agrupa parágrafos em chunks de até `size` chars; cada chunk leva o fim do anterior (overlap)."""
     buf = ""
-    for para in text.split("\n\n"):
+    prev = None
+    for para in paragraphs:
         if len(buf) + len(para) + 2 <= size:
             buf += (para + "\n\n")
-        else:
-            if buf:
-                parts.append(buf.strip())
-            buf = para + "\n\n"
+            continue
+        if buf:
+            part = buf.strip()
+            yield (prev[-overlap:] + "\n" + part).strip() if overlap > 0 and prev is not None else part
+            prev = part
+        buf = para + "\n\n"
     if buf:
-        parts.append(buf.strip())
-    # aplica overlap simples se necessário
-    if not parts: 
-        return []
-    if overlap > 0 and len(parts) > 1:
-        with_overlap = []
-        for i, p in enumerate(parts):
-            prev_tail = parts[i-1][-overlap:] if i > 0 else ""
-            with_overlap.append((prev_tail + "\n" + p).strip())
-        parts = with_overlap
-    return parts
-
-# recria coleção para evitar duplicados
-try:
-    client.delete_collection(COLLECTION)
-except Exception:
-    pass
-col = client.get_or_create_collection(COLLECTION)
-
-os.makedirs("data/raw", exist_ok=True)
-paths = glob.glob("data/raw/*.txt")
-
-docs, ids, metas = [], [], []
-for p in paths:
-    base_id = os.path.splitext(os.path.basename(p))[0]
-    with open(p, "r", encoding="utf-8", errors="ignore") as f:
-        txt = f.read()
-    chunks = chunk(txt)
+        part = buf.strip()
+        yield (prev[-overlap:] + "\n" + part).strip() if overlap > 0 and prev is not None else part
+
+def chunk(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
+    # quebra por parágrafos e faz janela deslizante (versão em lista, p/ textos já em memória)
+    return list(iter_chunks(iter_paragraphs(io.StringIO(text), size), size, overlap))
+
+MANIFEST = "ingest_manifest.json"
+
+def manifest_for(store, name: str) -> str:
+    """Manifest de uma coleção (o da coleção base mantém o nome antigo)."""
+    if name == store.base:
+        return os.path.join(store.path, MANIFEST)
+    return os.path.join(store.path, f"ingest_manifest.{name}.json")
+
+def dedup_for(manifest_path: str) -> str:
+    """Índice de quase-duplicatas que acompanha o manifest."""
+    return os.path.splitext(manifest_path)[0] + ".dedup.npz"
+
+def sha1(data: bytes | str) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+def file_sha1(path: str, block: int = 1024 * 1024) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(block), b""):
+            h.update(data)
+    return h.hexdigest()
+
+def file_chunks(path: str, old_chunks: dict):
+    """Gera (cid, idx, texto, hash) do arquivo; texto=None quando o chunk não mudou."""
+    if path.lower().endswith(".csv"):
+        # blocos de linhas com cabeçalho; o id leva a extensão para não colidir com um .txt homônimo
+        base_id = os.path.basename(path)
+        yield from _hashed(base_id, iter_row_blocks(path), old_chunks)
+        return
+    base_id = os.path.splitext(os.path.basename(path))[0]
+    # modo texto = newlines universais; lido em blocos, chunk a chunk
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        yield from _hashed(base_id, iter_chunks(iter_paragraphs(f)), old_chunks)
+
+def _hashed(base_id: str, chunks, old_chunks: dict):
     for idx, ck in enumerate(chunks):
-        docs.append(ck)
-        ids.append(f"{base_id}::chunk-{idx:03d}")
-        metas.append({"source": p, "chunk": idx})
-
-if docs:
-    col.add(documents=docs, ids=ids, metadatas=metas)
-    print(f"Ingeridos {len(docs)} chunks a partir de {len(paths)} arquivo(s).")
-else:
-    print("Nenhum .txt em data/raw para ingerir.")
+        cid = f"{base_id}::chunk-{idx:03d}"
+        h = sha1(ck)
+        yield cid, idx, (None if old_chunks.get(cid) == h else ck), h
+
+def scan_file(path: str, entry: dict | None, lazy: bool = False) -> dict:
+    """
+    Hash + chunking de um arquivo (roda no pool de processos). Se o hash bate com o manifest
+    não há "chunks"; senão "chunks" é a lista (ou, com lazy=True, o gerador) de file_chunks.
+    """
+    res = {"path": path, "sha1": file_sha1(path)}
+    if entry and entry.get("sha1") == res["sha1"]:
+        return res
+    gen = file_chunks(path, (entry or {}).get("chunks", {}))
+    res["chunks"] = gen if lazy else list(gen)
+    return res
+
+def _scan_all(todo: list[tuple[str, dict | None]], procs: int):
+    """
+    Aplica scan_file em paralelo (processos, janela limitada) preservando a ordem. Arquivos
+    grandes são fatiados em streaming no processo principal para não trafegarem inteiros.
+    """
+    sizes = [os.path.getsize(p) for p, _ in todo if os.path.getsize(p) <= STREAM_BYTES]
+    if procs <= 1 or len(sizes) <= 1 or sum(sizes) < PARALLEL_MIN_BYTES:
+        for p, e in todo:
+            yield scan_file(p, e, lazy=True)
+        return
+    # spawn: o service tem threads (Chroma, pool de jobs) e fork com threads é arriscado
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(procs, len(sizes)), mp_context=ctx) as ex:
+        pending = deque()
+        for p, e in todo:
+            if os.path.getsize(p) > STREAM_BYTES:
+                pending.append((p, e, None))
+            else:
+                pending.append((p, e, ex.submit(scan_file, p, e)))
+            while len(pending) > procs * 2:
+                yield _scan_result(*pending.popleft())
+        while pending:
+            yield _scan_result(*pending.popleft())
+
+def _scan_result(path: str, entry: dict | None, fut):
+    return fut.result() if fut is not None else scan_file(path, entry, lazy=True)
+
+def _sync_tables(csv_paths: list[str], files: dict, tags: dict) -> int:
+    """Tabela lateral dos CSVs: recarrega os que mudaram, retagueia e tira os removidos."""
+    tables = TableStore()
+    try:
+        cells = sum(tables.load(p, files[p]["sha1"], tags[p]) for p in csv_paths if p in files)
+        present = set(csv_paths)
+        for src in tables.sources():
+            if src not in present:
+                tables.drop(src)
+        return cells
+    finally:
+        tables.close()
+
+def _chunk_meta(path: str, idx: int, tags: dict) -> dict:
+    return {"source": path, "chunk": idx, **tags}
+
+def _scope(tags: dict) -> str:
+    return f"{tags['client']}|{tags['doc_type']}"
+
+def _register(dedup, batch, cid: str, text: str, meta: dict, path: str) -> bool:
+    """Põe o chunk no índice; True se é duplicata. Se ele toma o lugar de um canônico mais velho, tira aquele do Chroma."""
+    canon, demoted = dedup.add(cid, signature(text), _scope(meta), path, meta["date_int"], numbers(text))
+    if demoted is not None:
+        batch.retract([demoted])
+    return canon is not None
+
+def _collapse(dedup, batch, orphans: list, path: str, cid: str, text: str, meta: dict, stored: bool) -> bool:
+    """Chunk com texto novo: True se é cópia de um canônico (fica só no índice, não no Chroma)."""
+    was_dup, lost = dedup.remove(cid)
+    orphans.extend(lost)
+    if not _register(dedup, batch, cid, text, meta, path):
+        return False
+    if stored and not was_dup:
+        batch.delete([cid])  # a versão anterior era canônica e está no Chroma
+    return True
+
+def _forget(dedup, orphans: list, cids) -> list[str]:
+    """Chunks que saíram do corpus: ids a apagar do Chroma (duplicatas nunca foram para lá)."""
+    if dedup is None:
+        return list(cids)
+    out = []
+    for cid in cids:
+        was_dup, lost = dedup.remove(cid)
+        orphans.extend(lost)
+        if not was_dup:
+            out.append(cid)
+    return out
+
+def _retag_ids(dedup, orphans: list, cids, tags: dict) -> list[str]:
+    """Metadados novos: ids a atualizar no Chroma (duplicatas só mudam no índice)."""
+    if dedup is None:
+        return list(cids)
+    out = []
+    for cid in cids:
+        if not dedup.is_dup(cid):
+            out.append(cid)
+        orphans.extend(dedup.retag(cid, _scope(tags), tags["date_int"]))
+    return out
+
+def _rescue(dedup, batch, files: dict, tags: dict, orphans: list) -> int:
+    """
+    Duplicatas cujo canônico saiu (ou mudou de cliente/tipo): relê o texto delas no arquivo e
+    registra de novo; a mais nova de cada grupo vira o canônico e vai para o Chroma.
+    """
+    by_path: dict[str, set] = {}
+    for cid, p in orphans:
+        entry = files.get(p)
+        if entry and cid in entry.get("chunks", {}) and cid not in dedup:
+            by_path.setdefault(p, set()).add(cid)
+    n = 0
+    for p, cids in by_path.items():
+        others = {c: h for c, h in files[p]["chunks"].items() if c not in cids}
+        for cid, idx, text, h in file_chunks(p, others):
+            if cid not in cids or text is None:
+                continue
+            meta = _chunk_meta(p, idx, tags[p])
+            if not _register(dedup, batch, cid, text, meta, p):
+                batch.add(cid, text, meta, h)
+            n += 1
+    return n
+
+class _Batcher:
+    """
+    Acumula upserts/deletes e descarrega no Chroma em lotes: cada lote é embedado numa
+    thread do pool (até `workers` em paralelo) e gravado em fatias <= max_batch (limite
+    do Chroma). Memória limitada a ~2 x workers lotes em voo. Com `cache`, só os chunks
+    cujo hash não está no cache de embeddings passam pelo modelo. Com `lex`, o índice BM25
+    recebe as mesmas gravações, na mesma ordem.
+    """
+
+    def __init__(self, col, size: int = BATCH_SIZE, workers: int = EMBED_WORKERS,
+                 max_batch: int = 5000, embed=None, bar=None, cache=None, dedup=None, lex=None):
+        self.col = col
+        self.dedup = dedup
+        self.lex = lex
+        self.size = max(1, min(size, max_batch))
+        self.max_batch = max_batch
+        self.embed = embed
+        self.bar = bar
+        self.cache = cache
+        self.docs, self.ids, self.metas, self.hashes, self.stale = [], [], [], [], []
+        self.retags: list[tuple[str, dict]] = []
+        self.added: set[str] = set()  # ids gravados nesta passada: um delete não pode apagá-los
+        self.retracted: list[str] = []  # canônicos rebaixados: apagados depois dos upserts em voo
+        self.upserted = self.deleted = self.retagged = 0
+        self.seconds = 0.0  # tempo que o chamador ficou bloqueado aqui (descontado do span de chunking)
+        self._write = threading.Lock()  # embedding em paralelo, escrita no Chroma serializada
+        self._slots = threading.Semaphore(max(1, workers) * 2)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed")
+        self._futs = []
+
+    def add(self, cid: str, doc: str, meta: dict, h: str) -> None:
+        self.added.add(cid)
+        self.ids.append(cid)
+        self.docs.append(doc)
+        self.metas.append(self._adjust(cid, meta))
+        self.hashes.append(h)
+        if len(self.ids) >= self.size:
+            self._submit()
+
+    def delete(self, ids) -> None:
+        """Ids a apagar; os que esta passada regravou (add) ficam: o upsert pode estar em voo."""
+        self.stale.extend(ids)
+        if len(self.stale) >= self.size:
+            self._delete()
+
+    def retract(self, ids) -> None:
+        """Ids que viraram duplicata nesta passada: saem do lote pendente e do Chroma (no flush)."""
+        for cid in ids:
+            self.added.discard(cid)
+            if cid in self.ids:
+                i = self.ids.index(cid)
+                del self.ids[i], self.docs[i], self.metas[i], self.hashes[i]
+            self.retracted.append(cid)
+
+    def retag(self, path: str, cids, tags: dict) -> None:
+        """Só metadados mudaram (sidecar novo, regras): update sem reembedar."""
+        for cid in cids:
+            self.retags.append((cid, self._adjust(cid, _chunk_meta(path, int(cid.rsplit("-", 1)[1]), tags))))
+        if len(self.retags) >= self.size:
+            self._update()
+
+    def _adjust(self, cid: str, meta: dict) -> dict:
+        return self.dedup.adjust(cid, meta) if self.dedup is not None else meta
+
+    def flush(self) -> None:
+        """Descarrega o que falta e espera os lotes em voo (propaga o 1º erro)."""
+        t0 = time.perf_counter()
+        self._submit()
+        self._delete()
+        self._update()
+        for f in self._futs:
+            f.result()
+        if self.retracted:
+            # só depois dos upserts em voo: um lote já enviado pode conter o id rebaixado
+            self.stale.extend(c for c in self.retracted if c not in self.added)
+            self.retracted = []
+            self._delete()
+        self.seconds += time.perf_counter() - t0
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def _submit(self) -> None:
+        failed = [f for f in self._futs if f.done() and f.exception() is not None]
+        if failed:
+            raise failed[0].exception()  # lote anterior falhou: não adianta seguir lendo
+        self._futs = [f for f in self._futs if not f.done()]
+        if not self.ids:
+            return
+        t0 = time.perf_counter()
+        self._slots.acquire()  # backpressure: o leitor não corre na frente do embedding
+        self.seconds += time.perf_counter() - t0
+        batch = (self.docs, self.ids, self.metas, self.hashes)
+        self.docs, self.ids, self.metas, self.hashes = [], [], [], []
+        # copia o contexto para os spans saírem com o endpoint/cliente do job
+        self._futs.append(self._pool.submit(contextvars.copy_context().run, self._upsert, *batch))
+
+    def _embed(self, docs: list, hashes: list) -> list:
+        if self.cache is None:
+            with metrics.span("embed"):
+                return list(self.embed(docs))
+        embs = self.cache.get_many(hashes)
+        miss = [i for i, e in enumerate(embs) if e is None]
+        if miss:
+            with metrics.span("embed"):
+                fresh = self.embed([docs[i] for i in miss])
+            for i, e in zip(miss, fresh):
+                embs[i] = e
+            self.cache.put_many([hashes[i] for i in miss], fresh)
+        return embs
+
+    def _upsert(self, docs: list, ids: list, metas: list, hashes: list) -> None:
+        try:
+            embs = self._embed(docs, hashes) if self.embed is not None else None
+            with self._write:
+                for i in range(0, len(ids), self.max_batch):
+                    j = i + self.max_batch
+                    with metrics.span("chroma_add"):
+                        if embs is None:
+                            self.col.upsert(documents=docs[i:j], ids=ids[i:j], metadatas=metas[i:j])
+                        else:
+                            self.col.upsert(documents=docs[i:j], ids=ids[i:j], metadatas=metas[i:j],
+                                            embeddings=embs[i:j])
+                if self.lex is not None:
+                    with metrics.span("bm25_add"):
+                        self.lex.upsert(ids, docs, metas)
+                self.upserted += len(ids)
+                if self.bar is not None:
+                    self.bar.update(len(ids))
+        finally:
+            self._slots.release()
+
+    def _update(self) -> None:
+        if not self.retags:
+            return
+        t0 = time.perf_counter()
+        with self._write:
+            for i in range(0, len(self.retags), self.max_batch):
+                part = self.retags[i:i + self.max_batch]
+                with metrics.span("chroma_update"):
+                    self.col.update(ids=[c for c, _ in part], metadatas=[m for _, m in part])
+                if self.lex is not None:
+                    self.lex.retag([c for c, _ in part], [m for _, m in part])
+            self.retagged += len(self.retags)
+        self.seconds += time.perf_counter() - t0
+        self.retags = []
+
+    def _delete(self) -> None:
+        self.stale = [c for c in self.stale if c not in self.added]
+        if not self.stale:
+            return
+        t0 = time.perf_counter()
+        with self._write:
+            for i in range(0, len(self.stale), self.max_batch):
+                with metrics.span("chroma_delete"):
+                    self.col.delete(ids=self.stale[i:i + self.max_batch])
+            if self.lex is not None:
+                self.lex.delete(self.stale)
+            self.deleted += len(self.stale)
+        self.seconds += time.perf_counter() - t0
+        self.stale = []
+
+def load_manifest(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+def save_manifest(path: str, manifest: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _name(path: str, raw_dir: str) -> str:
+    """
+    Chave do arquivo no manifest: caminho relativo a raw_dir, a mesma para qualquer grafia de
+    raw_dir (relativa, absoluta, "./x//", symlink). Os ids dos chunks usam só o nome do arquivo,
+    então a chave não pode depender de como o chamador escreveu o diretório.
+    """
+    head, tail = os.path.split(os.path.abspath(path))
+    return os.path.relpath(os.path.join(os.path.realpath(head), tail), os.path.realpath(raw_dir))
+
+def _files_by_path(manifest: dict, raw_dir: str) -> dict:
+    """
+    Entradas do manifest por caminho na grafia desta passada (os.path.join(raw_dir, nome)).
+    Manifests antigos, com o caminho do glob como chave, são migrados aqui.
+    """
+    files = manifest.get("files", {})
+    if manifest.get("keys") != "relative":
+        files = {_name(p, raw_dir): e for p, e in files.items()}
+    return {os.path.join(raw_dir, n): e for n, e in files.items()}
+
+def ingest(store=None, raw_dir: str = RAW_DIR, rebuild: bool = False, log=print,
+           procs: int = PROCS, embed_workers: int = EMBED_WORKERS, batch_size: int = BATCH_SIZE,
+           progress: bool = False) -> dict:
+    """
+    Ingestão incremental dos .txt e .csv de raw_dir: um manifest com o hash de cada arquivo e de
+    cada chunk decide o que mudou; só chunks novos/alterados são (re)embedados via upsert,
+    chunks de arquivos removidos (ou que encolheram) são apagados e o resto fica intocado.
+    O manifest identifica o arquivo pelo caminho relativo a raw_dir (ver _name), então
+    "data/raw" e o mesmo diretório em caminho absoluto são o mesmo corpus.
+    rebuild=True reindexa tudo numa coleção versionada nova e só então troca o ponteiro
+    (blue/green): as consultas seguem na coleção anterior até a troca.
+    Hash/chunking rodam em `procs` processos e o embedding em lotes de `batch_size` chunks
+    em `embed_workers` threads; progress=True mostra barras do tqdm (chunks/s, MB/s).
+    Ingests concorrentes (threads ou processos) esperam no lock de arquivo.
+    Cada chunk leva {source, chunk, client, doc_type, date, date_int} (ver doc_meta); se só os
+    metadados de um arquivo mudam, os chunks são atualizados sem reembedar.
+    Com INGEST_DEDUP=1 (padrão), chunk praticamente idêntico (near_dup.INGEST_THRESHOLD, mesmos
+    números) a outro do mesmo cliente/tipo não vai para o Chroma: fica no índice de near_dup
+    apontando para o canônico, que é o texto mais novo do grupo e ganha "dups" (nº de cópias).
+    Chunks indexados antes disso só entram no índice num --rebuild.
+    O índice BM25 da coleção (bm25_index) recebe as mesmas gravações; se ainda não existe, é
+    preenchido a partir do que já está no Chroma.
+    Retorna {"files", "changed_files", "upserted", "deleted", "unchanged", "retagged", "collection",
+    "seconds", "chunks_per_s", "mb_per_s", "dedup"}.
+    """
+    store = store or get_store()
+    opts = {"procs": procs, "embed_workers": embed_workers, "batch_size": batch_size, "progress": progress}
+    with store.ingest_lock():
+        if rebuild:
+            return _rebuild(store, raw_dir, log, opts)
+        with store.update() as col:
+            stats = _ingest(store, col, manifest_for(store, store.name), raw_dir, log, **opts)
+            stats["collection"] = store.name
+        if stats["upserted"] or stats["deleted"] or stats["retagged"]:
+            store.bump_version()
+        return stats
+
+def _rebuild(store, raw_dir: str, log, opts: dict) -> dict:
+    name, col = store.create_version()
+    manifest_path = manifest_for(store, name)
+    try:
+        stats = _ingest(store, col, manifest_path, raw_dir, log, **opts)
+    except BaseException:
+        # versão incompleta nunca vira ativa
+        try:
+            store.client.delete_collection(name)
+        except Exception:
+            pass
+        _remove_sidecars(store, name)
+        raise
+    dropped = store.swap(name)
+    for old in dropped:
+        _remove_sidecars(store, old)
+    stats["collection"] = name
+    log(f"Coleção ativa: {name}" + (f" (apagadas: {', '.join(dropped)})" if dropped else ""))
+    return stats
+
+def _remove_sidecars(store, name: str) -> None:
+    """Manifest, índice de duplicatas e índice BM25 de uma coleção descartada."""
+    manifest = manifest_for(store, name)
+    lex = bm25_path(store, name)
+    forget_bm25(lex)
+    for path in (manifest, dedup_for(manifest), lex, f"{lex}-wal", f"{lex}-shm"):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass  # Windows: handle aberto em outro processo; o arquivo órfão não é lido
+
+def _backfill_bm25(col, lex, page: int = 1000) -> int:
+    """Coleção indexada antes do BM25: copia documentos e metadados do Chroma para o índice."""
+    n = 0
+    while True:
+        got = col.get(limit=page, offset=n, include=["documents", "metadatas"])
+        if not got["ids"]:
+            return n
+        lex.upsert(got["ids"], got["documents"], got["metadatas"])
+        n += len(got["ids"])
+
+def _ingest(store, col, manifest_path: str, raw_dir: str, log, procs: int = PROCS,
+            embed_workers: int = EMBED_WORKERS, batch_size: int = BATCH_SIZE, progress: bool = False) -> dict:
+    os.makedirs(raw_dir, exist_ok=True)
+    paths = sorted(p for ext in INGEST_EXTS for p in glob.glob(os.path.join(raw_dir, f"*{ext}")))
+    manifest = load_manifest(manifest_path)
+    files = _files_by_path(manifest, raw_dir)
+    stats = {"files": len(paths), "changed_files": 0, "upserted": 0, "deleted": 0, "unchanged": 0}
+    tagger = DocTagger()
+    tags: dict[str, dict] = {}
+    retag: list[tuple[str, dict]] = []  # arquivos inalterados cujos metadados mudaram
+
+    # atalho: tamanho e mtime iguais -> nem abre o arquivo
+    todo, stamps = [], {}
+    for p in paths:
+        st = os.stat(p)
+        entry = files.get(p)
+        tags[p] = tagger.tag(p, st.st_mtime)
+        if entry and entry.get("size") == st.st_size and entry.get("mtime") == st.st_mtime:
+            stats["unchanged"] += len(entry.get("chunks", {}))
+            if entry.get("meta") != tags[p]:
+                retag.append((p, entry))
+            continue
+        todo.append((p, entry))
+        stamps[p] = (st.st_size, st.st_mtime)
+    total_bytes = sum(size for size, _ in stamps.values())
+
+    t0 = time.perf_counter()
+    read_bar = tqdm(total=total_bytes, unit="B", unit_scale=True, desc="lido", disable=not progress)
+    chunk_bar = tqdm(unit="chunk", desc="embedado", disable=not progress)
+    embed = store.embedder(col)
+    cache = get_cache(os.path.join(store.path, "embed_cache"), embed)
+    dedup = DedupIndex(dedup_for(manifest_path)) if DEDUP else None
+    orphans: list[tuple[str, str]] = []  # duplicatas que perderam o canônico nesta passada
+    lex = BM25Index(bm25_path(store, col.name))
+    if not lex.count() and col.count():
+        log(f"Índice BM25: {_backfill_bm25(col, lex)} chunk(s) copiados da coleção existente.")
+    batch = _Batcher(col, batch_size, embed_workers, store.max_batch_size(), embed, chunk_bar, cache, dedup, lex)
+    before = cache.stats() if cache is not None else None
+    try:
+        # arquivos que sumiram de raw_dir: apaga os chunks deles antes de qualquer upsert
+        present = set(paths)
+        for p in [p for p in files if p not in present]:
+            batch.delete(_forget(dedup, orphans, files.pop(p).get("chunks", {})))
+        for p, entry in retag:
+            batch.retag(p, _retag_ids(dedup, orphans, entry.get("chunks", {}), tags[p]), tags[p])
+            entry["meta"] = tags[p]
+        for res in _scan_all(todo, procs):
+            p = res["path"]
+            size, mtime = stamps[p]
+            entry = files.get(p)
+            if "chunks" not in res:  # conteúdo igual (só mudou o mtime)
+                entry.update(size=size, mtime=mtime)
+                stats["unchanged"] += len(entry.get("chunks", {}))
+                if entry.get("meta") != tags[p]:
+                    batch.retag(p, _retag_ids(dedup, orphans, entry.get("chunks", {}), tags[p]), tags[p])
+                    entry["meta"] = tags[p]
+                read_bar.update(size)
+                continue
+            stats["changed_files"] += 1
+            old_chunks = (entry or {}).get("chunks", {})
+            new_chunks, kept = {}, []
+            for cid, idx, text, h in res["chunks"]:
+                new_chunks[cid] = h
+                if text is None:
+                    stats["unchanged"] += 1
+                    kept.append(cid)
+                    continue
+                meta = _chunk_meta(p, idx, tags[p])
+                if dedup is not None and _collapse(dedup, batch, orphans, p, cid, text, meta, cid in old_chunks):
+                    continue
+                batch.add(cid, text, meta, h)
+            if kept and (entry or {}).get("meta") != tags[p]:
+                batch.retag(p, _retag_ids(dedup, orphans, kept, tags[p]), tags[p])
+            batch.delete(_forget(dedup, orphans, [cid for cid in old_chunks if cid not in new_chunks]))
+            files[p] = {"sha1": res["sha1"], "size": size, "mtime": mtime, "chunks": new_chunks, "meta": tags[p]}
+            read_bar.update(size)
+        if dedup is not None:
+            # o índice guarda a fonte na grafia da passada que a gravou
+            orphans = [(cid, os.path.join(raw_dir, _name(src, raw_dir))) for cid, src in orphans]
+            rescued = _rescue(dedup, batch, files, tags, orphans)
+            batch.flush()  # canônicos novos já gravados antes de atualizar os metadados deles
+            for cid, src in dedup.pop_touched():
+                src = os.path.join(raw_dir, _name(src, raw_dir))
+                if src in files:
+                    batch.retag(src, [cid], tags[src])
+        batch.flush()
+        stats["table_cells"] = _sync_tables([p for p in paths if p.lower().endswith(".csv")], files, tags)
+    finally:
+        batch.close()
+        lex.close()
+        if cache is not None:
+            cache.save()
+        read_bar.close()
+        chunk_bar.close()
+    elapsed = time.perf_counter() - t0
+    metrics.observe("chunk", max(0.0, elapsed - batch.seconds))
+
+    stats["upserted"], stats["deleted"], stats["retagged"] = batch.upserted, batch.deleted, batch.retagged
+    stats["seconds"] = round(elapsed, 3)
+    stats["chunks_per_s"] = round(batch.upserted / elapsed, 1) if elapsed else 0.0
+    stats["mb_per_s"] = round(total_bytes / 1048576 / elapsed, 2) if elapsed else 0.0
+    if cache is not None:
+        after = cache.stats()
+        hits, misses = after["hits"] - before["hits"], after["misses"] - before["misses"]
+        stats["embed_cache"] = {"hits": hits, "misses": misses,
+                                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                                "entries": after["entries"], "evictions": after["evictions"] - before["evictions"]}
+    if dedup is not None:
+        stats["dedup"] = {**dedup.stats(), "collapsed": dedup.collapsed, "rescued": rescued}
+        dedup.save()
+    manifest.update(keys="relative", files={_name(p, raw_dir): e for p, e in files.items()})
+    save_manifest(manifest_path, manifest)
+
+    if not paths:
+        log("Nenhum .txt/.csv em data/raw para ingerir.")
+    log(f"Ingestão: {stats['upserted']} chunk(s) novos/alterados, {stats['deleted']} removido(s), "
+        f"{stats['unchanged']} inalterado(s) em {len(paths)} arquivo(s) "
+        f"[{stats['seconds']}s, {stats['chunks_per_s']} chunks/s, {stats['mb_per_s']} MB/s].")
+    if stats["table_cells"]:
+        log(f"Tabela lateral dos CSVs: {stats['table_cells']} célula(s) numérica(s) gravadas.")
+    if stats["retagged"]:
+        log(f"Metadados (cliente/tipo/data) atualizados em {stats['retagged']} chunk(s).")
+    if stats.get("embed_cache", {}).get("hits") or stats.get("embed_cache", {}).get("misses"):
+        ec = stats["embed_cache"]
+        log(f"Cache de embeddings: {ec['hits']} acerto(s), {ec['misses']} falta(s) (hit rate {ec['hit_rate']:.0%}).")
+    if stats.get("dedup", {}).get("duplicates"):
+        dd = stats["dedup"]
+        log(f"Quase-duplicatas: {dd['collapsed']} colapsada(s) nesta passada; índice com {dd['canonical']} de "
+            f"{dd['chunks']} chunk(s) ({dd['index_saved_pct']}% a menos).")
+    return stats
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Ingestão incremental de data/raw/*.txt e *.csv no Chroma.")
+    ap.add_argument("--raw", default=RAW_DIR, help="Diretório dos .txt/.csv")
+    ap.add_argument("--rebuild", action="store_true", help="Reindexa tudo numa coleção nova e troca o ponteiro (blue/green)")
+    ap.add_argument("--procs", type=int, default=PROCS, help="Processos para hash/chunking")
+    ap.add_argument("--embed-workers", type=int, default=EMBED_WORKERS, help="Threads de embedding")
+    ap.add_argument("--batch", type=int, default=BATCH_SIZE, help="Chunks por lote de embedding/upsert")
+    ap.add_argument("--no-progress", action="store_true", help="Sem barras de progresso")
+    args = ap.parse_args()
+    ingest(raw_dir=args.raw, rebuild=args.rebuild, procs=args.procs, embed_workers=args.embed_workers,
+           batch_size=args.batch, progress=not args.no_progress)
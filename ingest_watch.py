@@ -0,0 +1,246 @@
+# ingest_watch.py
+# Ingestão contínua de data/raw: observa o diretório (inotify via watchdog, se instalado;
+# senão varredura periódica de tamanho/mtime), agrupa rajadas de eventos (debounce) e roda
+# a ingestão incremental, que só reembeda o que mudou. Quem produz arquivos não precisa
+# mais rodar o ingest: chama ensure_ingested() (ou espera "versão do corpus >= N").
+#   python ingest_watch.py            # daemon
+#   python ingest_watch.py --sync     # barreira: espera o daemon (ou ingere na hora, sem daemon)
+
+from __future__ import annotations
+import argparse, glob, json, os, threading, time
+
+from ingest_txt import INGEST_EXTS, ingest
+from doc_meta import RAW_DIR, SIDECAR
+from vectorstore import get_store
+
+DEBOUNCE = float(os.getenv("INGEST_WATCH_DEBOUNCE", "1.5"))   # silêncio antes de ingerir
+MAX_DELAY = float(os.getenv("INGEST_WATCH_MAX_DELAY", "15"))  # rajada longa: ingere mesmo assim
+POLL = float(os.getenv("INGEST_WATCH_POLL", "2"))             # intervalo da varredura (fallback)
+TICK = 0.5
+HEARTBEAT_EVERY = 5.0
+STALE_AFTER = 20.0  # sem heartbeat há mais que isso: daemon considerado morto
+STATUS_FILE = "watch_status.json"
+REQUEST_FILE = "watch_request"
+
+def _relevant(path: str) -> bool:
+    return path.endswith(SIDECAR) or path.lower().endswith(INGEST_EXTS)
+
+def _write_json(path: str, data: dict) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def read_status(store=None) -> dict:
+    store = store or get_store()
+    try:
+        with open(os.path.join(store.path, STATUS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def daemon_alive(status: dict) -> bool:
+    return bool(status) and not status.get("stopped") and time.time() - status.get("heartbeat", 0) < STALE_AFTER
+
+class Watcher:
+    def __init__(self, raw_dir: str = RAW_DIR, store=None, debounce: float = DEBOUNCE,
+                 max_delay: float = MAX_DELAY, poll: float = POLL, log=print):
+        self.raw_dir = raw_dir
+        self.store = store or get_store()
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll = poll
+        self.log = log
+        self._cond = threading.Condition()
+        self._first_event: float | None = None
+        self._last_event = 0.0
+        self._stop = False
+        self._thread: threading.Thread | None = None
+        self._observer = None
+        self._request_seen = 0.0
+        self._status_lock = threading.Lock()
+        self.status = {"pid": os.getpid(), "raw_dir": raw_dir, "passes": 0, "last_started": 0.0,
+                       "last_finished": 0.0, "version": self.store.version(), "backend": "", "error": None}
+
+    # -------- eventos --------
+    def notify(self, path: str | None = None) -> None:
+        if path is not None and not _relevant(path):
+            return
+        now = time.monotonic()
+        with self._cond:
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+            self._cond.notify_all()
+
+    def _start_source(self) -> None:
+        os.makedirs(self.raw_dir, exist_ok=True)
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            threading.Thread(target=self._poll_loop, name="ingest-poll", daemon=True).start()
+            self.status["backend"] = "polling"
+            return
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not event.is_directory:
+                    for p in (event.src_path, getattr(event, "dest_path", "")):  # rename: o destino conta
+                        if p:
+                            watcher.notify(p)
+
+        self._observer = Observer()
+        self._observer.schedule(_Handler(), self.raw_dir, recursive=False)
+        self._observer.start()
+        self.status["backend"] = "watchdog"
+
+    def _snapshot(self) -> dict:
+        snap = {}
+        for p in glob.glob(os.path.join(self.raw_dir, "*")):
+            if _relevant(p):
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                snap[p] = (st.st_size, st.st_mtime_ns)
+        return snap
+
+    def _poll_loop(self) -> None:
+        prev = self._snapshot()
+        while not self._stop:
+            time.sleep(self.poll)
+            cur = self._snapshot()
+            if cur != prev:
+                self.notify()
+            prev = cur
+
+    def _check_request(self) -> None:
+        # ensure_ingested() de outro processo pede uma passada mesmo sem evento de arquivo
+        try:
+            mtime = os.stat(os.path.join(self.store.path, REQUEST_FILE)).st_mtime
+        except OSError:
+            return
+        if mtime > self._request_seen:
+            self._request_seen = mtime
+            self.notify()
+
+    # -------- laço principal --------
+    def start(self) -> "Watcher":
+        self._start_source()
+        self._thread = threading.Thread(target=self._run, name="ingest-watch", daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._beat_loop, name="ingest-watch-beat", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+        self.status["stopped"] = True
+        self._publish()
+
+    def _publish(self) -> None:
+        with self._status_lock:
+            self.status["heartbeat"] = time.time()
+            os.makedirs(self.store.path, exist_ok=True)
+            _write_json(os.path.join(self.store.path, STATUS_FILE), self.status)
+
+    def _beat_loop(self) -> None:
+        # heartbeat em thread própria: uma passada longa não faz o daemon parecer morto
+        while not self._stop:
+            self._publish()
+            time.sleep(HEARTBEAT_EVERY)
+
+    def _due(self) -> bool:
+        if self._first_event is None:
+            return False
+        now = time.monotonic()
+        return now - self._last_event >= self.debounce or now - self._first_event >= self.max_delay
+
+    def _run(self) -> None:
+        self.notify()  # passada inicial: pega o que mudou com o daemon parado
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                if not self._due():
+                    self._cond.wait(TICK)
+                    due = False
+                else:
+                    self._first_event = None
+                    due = True
+            if due:
+                self._pass()
+            self._check_request()
+
+    def _pass(self) -> None:
+        self.status["last_started"] = time.time()
+        self._publish()
+        try:
+            stats = ingest(store=self.store, raw_dir=self.raw_dir, log=self.log)
+            self.status["error"] = None
+            self.status["last_stats"] = {k: v for k, v in stats.items() if isinstance(v, (int, float, str))}
+        except Exception as e:  # o daemon não morre por causa de um arquivo ruim
+            self.status["error"] = str(e)
+            self.log(f"[watch] falha na ingestão: {e}")
+        self.status["passes"] += 1
+        self.status["version"] = self.store.version()
+        self.status["last_finished"] = time.time()
+        self._publish()
+
+def ensure_ingested(store=None, raw_dir: str = RAW_DIR, timeout: float = 300.0, log=print) -> dict:
+    """
+    Barreira para quem acabou de gravar em data/raw: com o daemon vivo, pede uma passada e
+    espera ela terminar (sem rodar ingest aqui); sem daemon, ingere na hora. Retorna
+    {"mode": "watch"|"inline", "version": N, ...}: quem consulta depois pode exigir versão >= N.
+    """
+    store = store or get_store()
+    if not daemon_alive(read_status(store)):
+        stats = ingest(store=store, raw_dir=raw_dir, log=log)
+        return {"mode": "inline", "version": store.version(), "ingest": stats}
+
+    asked = time.time()
+    with open(os.path.join(store.path, REQUEST_FILE), "w", encoding="utf-8") as f:
+        f.write(str(asked))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        st = read_status(store)
+        if st.get("last_started", 0) >= asked and st.get("last_finished", 0) >= st["last_started"]:
+            if st.get("error"):
+                raise RuntimeError(f"ingestão do daemon falhou: {st['error']}")
+            return {"mode": "watch", "version": st.get("version", store.version()), "ingest": st.get("last_stats")}
+        if not daemon_alive(st):
+            stats = ingest(store=store, raw_dir=raw_dir, log=log)
+            return {"mode": "inline", "version": store.version(), "ingest": stats}
+        time.sleep(0.2)
+    raise TimeoutError(f"daemon de ingestão não concluiu em {timeout:.0f}s")
+
+def main():
+    ap = argparse.ArgumentParser(description="Ingestão contínua de data/raw (watch) ou barreira de ingestão (--sync).")
+    ap.add_argument("--raw", default=RAW_DIR, help="Diretório observado")
+    ap.add_argument("--sync", action="store_true", help="Não observa: garante que data/raw está ingerido e sai")
+    ap.add_argument("--timeout", type=float, default=300.0, help="Limite de espera do --sync")
+    args = ap.parse_args()
+
+    if args.sync:
+        res = ensure_ingested(raw_dir=args.raw, timeout=args.timeout)
+        print(f"Corpus na versão {res['version']} ({res['mode']}).")
+        return
+
+    w = Watcher(args.raw).start()
+    print(f"Observando {args.raw} ({w.status['backend']}); Ctrl+C para sair.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        w.stop()
+
+if __name__ == "__main__":
+    main()
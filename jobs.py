@@ -0,0 +1,117 @@
+# jobs.py
+# Fila de jobs em background para o service: cada job ganha um ID, roda num pool
+# limitado de threads e registra status, tempo por etapa e erro para consulta em /jobs/{id}.
+
+from __future__ import annotations
+import threading, time, traceback, uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+class Job:
+    def __init__(self, kind: str, key: str, params: dict | None = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.params = params or {}
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.stages: list[dict] = []
+        self.result = None
+        self.error: str | None = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """Marca uma etapa do job (ex.: 'smart_search:daily') e mede sua duração."""
+        st = {"name": name, "status": RUNNING, "seconds": None}
+        self.stages.append(st)
+        t0 = time.perf_counter()
+        try:
+            yield st
+            st["status"] = DONE
+        except BaseException:
+            st["status"] = ERROR
+            raise
+        finally:
+            st["seconds"] = round(time.perf_counter() - t0, 3)
+
+    def to_dict(self) -> dict:
+        done = sum(1 for s in self.stages if s["status"] == DONE)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "key": self.key,
+            "params": self.params,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": {"done": done, "total": self.params.get("total_stages")},
+            "stages": list(self.stages),
+            "result": self.result,
+            "error": self.error,
+        }
+
+class JobQueue:
+    """
+    Pool de `workers` threads. Jobs com a mesma `key` são deduplicados enquanto
+    um deles estiver na fila ou rodando; os finalizados ficam no histórico (limitado a `keep`).
+    """
+
+    def __init__(self, workers: int = 2, keep: int = 200):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: dict[str, str] = {}  # key -> job id
+        self._keep = keep
+
+    def submit(self, kind: str, key: str, fn, params: dict | None = None) -> tuple[Job, bool]:
+        """Enfileira fn(job). Retorna (job, deduplicado?)."""
+        with self._lock:
+            jid = self._active.get(key)
+            if jid and self._jobs[jid].status in (QUEUED, RUNNING):
+                return self._jobs[jid], True
+            job = Job(kind, key, params)
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+            self._trim()
+        self._pool.submit(self._run, job, fn)
+        return job, False
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {QUEUED: 0, RUNNING: 0, DONE: 0, ERROR: 0}
+            for j in self._jobs.values():
+                out[j.status] += 1
+            return out
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: Job, fn) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(job)
+            job.status = DONE
+        except BaseException as e:  # SystemExit dos scripts também vira erro do job
+            job.error = f"{e}\n{traceback.format_exc()}"
+            job.status = ERROR
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.key) == job.id:
+                    del self._active[job.key]
+
+    def _trim(self) -> None:
+        finished = [jid for jid, j in self._jobs.items() if j.status in (DONE, ERROR)]
+        for jid in finished[: max(0, len(self._jobs) - self._keep)]:
+            del self._jobs[jid]
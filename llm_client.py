@@ -0,0 +1,366 @@
+# llm_client.py
+# Camada de LLM: um backend "quente" (Gemini, ou um stub local determinístico) atrás de um
+# cliente que impõe prazo por tentativa e por chamada, repete falhas transitórias (timeout,
+# 429, 5xx) com backoff exponencial + jitter, opcionalmente dispara uma segunda requisição
+# igual (hedge) quando a primeira passa do p95 recente e guarda tokens/latência.
+# LLM_BACKEND=stub roda o pipeline inteiro sem rede (teste de carga).
+
+from __future__ import annotations
+import hashlib, os, queue, random, re, threading, time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+from dotenv import load_dotenv
+
+import metrics
+from near_dup import estimate_tokens
+
+load_dotenv()
+
+BACKEND = os.getenv("LLM_BACKEND", "gemini").strip().lower()  # "gemini" | "stub"
+MODEL_NAME = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))    # prazo de cada tentativa (s); no stream, até o 1º pedaço e entre pedaços
+DEADLINE = float(os.getenv("LLM_DEADLINE", "90"))  # prazo da chamada inteira, tentativas e esperas incluídas
+RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+BACKOFF, BACKOFF_MAX = 0.5, 8.0                    # espera antes da tentativa n: uniforme em [0, min(MAX, BACKOFF * 2^n)]
+HEDGE = os.getenv("LLM_HEDGE", "").strip().lower() # "" desliga; "p95" = após o p95 recente; número = após N ms
+HEDGE_MIN_SAMPLES = 20                             # com menos amostras o p95 não vale: sem hedge
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+WINDOW = 512
+# mínimo de tokens de um CachedContent por família de modelo (o prefixo mais longo vence)
+MIN_CACHE_TOKENS = {"gemini-1.5": 32768, "gemini-2.5-flash": 1024}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+
+def min_cache_tokens(model: str) -> int:
+    best = max((p for p in MIN_CACHE_TOKENS if model.startswith(p)), key=len, default=None)
+    return MIN_CACHE_TOKENS[best] if best else DEFAULT_MIN_CACHE_TOKENS
+
+def cache_model(model: str) -> str:
+    """Nome aceito pelo CachedContent: o 1.5 exige versão fixa (gemini-1.5-flash -> gemini-1.5-flash-001)."""
+    override = os.getenv("LLM_CACHE_MODEL", "").strip()
+    if override:
+        return override
+    if re.fullmatch(r"gemini-1\.5-(flash|flash-8b|pro)", model):
+        return f"{model}-001"
+    return model
+
+def retryable(e: BaseException) -> bool:
+    """Timeout, queda de conexão ou código HTTP/gRPC transitório (google.api_core expõe .code)."""
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        return int(getattr(e, "code", 0) or 0) in RETRYABLE_CODES
+    except (TypeError, ValueError):
+        return False
+
+# -------------------- backends --------------------
+class GeminiBackend:
+    """
+    google.generativeai configurado uma vez; o mesmo GenerativeModel atende todas as chamadas.
+    Cache de contexto (prompt_cache): o prefixo vira um CachedContent e as chamadas com
+    `cache` usam um GenerativeModel ligado a ele. O cache é criado no modelo com versão fixa
+    (cache_model; LLM_CACHE_MODEL sobrepõe) e só a partir de min_cache_tokens.
+    """
+
+    def __init__(self, model: str = MODEL_NAME):
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise SystemExit("Defina GOOGLE_API_KEY no .env")
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self.model = model
+        self.min_cache_tokens = min_cache_tokens(model)
+        self._model = genai.GenerativeModel(model)
+        self._cached: dict[str, object] = {}  # nome do CachedContent -> GenerativeModel
+        self._cached_lock = threading.Lock()
+
+    def create_cache(self, prefix: str, ttl: int):
+        from datetime import timedelta
+        from google.generativeai import caching
+        return caching.CachedContent.create(model=f"models/{cache_model(self.model)}", contents=[prefix],
+                                            ttl=timedelta(seconds=ttl))
+
+    def delete_cache(self, cache) -> None:
+        with self._cached_lock:
+            self._cached.pop(cache.name, None)
+        cache.delete()
+
+    def _model_for(self, cache):
+        if cache is None:
+            return self._model
+        with self._cached_lock:
+            m = self._cached.get(cache.name)
+            if m is None:
+                m = self._cached[cache.name] = self._genai.GenerativeModel.from_cached_content(cached_content=cache)
+        return m
+
+    def generate(self, prompt: str, timeout: float, cache=None) -> tuple[str, int | None, int | None, int | None]:
+        """(texto, tokens do prompt, tokens da resposta, tokens vindos do cache); None se a API não informar."""
+        resp = self._model_for(cache).generate_content(prompt, request_options={"timeout": timeout})
+        usage = getattr(resp, "usage_metadata", None)
+        return (resp.text, getattr(usage, "prompt_token_count", None),
+                getattr(usage, "candidates_token_count", None), getattr(usage, "cached_content_token_count", None))
+
+    def stream(self, prompt: str, timeout: float, cache=None):
+        for piece in self._model_for(cache).generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+            text = getattr(piece, "text", "")
+            if text:
+                yield text
+
+class StubBackend:
+    """
+    Resposta local determinística (mesmo prompt, mesmo texto e mesma latência), sem rede.
+    `latency` em segundos com jitter fixo por prompt (±50%), mais `ms_per_1k` por 1000 tokens
+    de prompt fora do cache (custo de prefill); `error_rate` injeta falhas transitórias (503)
+    numa sequência reproduzível, para exercitar retry/hedge. Simula também o cache de contexto.
+    """
+
+    model = MODEL_NAME  # simula o modelo configurado (mesmo orçamento de contexto)
+    min_cache_tokens = 0  # sem o mínimo do provedor: exercita o caminho do cache com qualquer prefixo
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0, ms_per_1k: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.ms_per_1k = ms_per_1k
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def create_cache(self, prefix: str, ttl: int) -> dict:
+        return {"name": "stub/" + hashlib.blake2b(prefix.encode("utf-8"), digest_size=8).hexdigest(), "prefix": prefix}
+
+    def delete_cache(self, cache) -> None:
+        pass
+
+    def _answer(self, prompt: str, cache=None) -> tuple[str, float]:
+        fresh = estimate_tokens(prompt)
+        prompt = cache["prefix"] + prompt if cache else prompt
+        h = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest()
+        m = re.search(r"Pergunta:\s*(.*?)\s*Responda:", prompt, re.S)
+        question = (m.group(1) if m else prompt[-200:]).strip()
+        n = len(re.findall(r"^\[[^\]\n]+ \| chunks? [^\]\n]+\]$", prompt, re.M))
+        text = (f"[stub {h.hex()[:8]}] Resposta simulada para: {question}\n"
+                f"Baseada em {n} trecho(s) de contexto ({estimate_tokens(prompt)} tokens de prompt).")
+        jitter = 0.5 + int.from_bytes(h[:2], "little") / 65535  # 0.5x a 1.5x
+        return text, self.latency * jitter + self.ms_per_1k * fresh / 1e6
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate:
+            with self._rng_lock:
+                fail = self._rng.random() < self.error_rate
+            if fail:
+                err = ConnectionError("stub: falha simulada")
+                err.code = 503
+                raise err
+
+    def generate(self, prompt: str, timeout: float, cache=None) -> tuple[str, int | None, int | None, int | None]:
+        text, delay = self._answer(prompt, cache)
+        time.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise TimeoutError("stub: prazo esgotado")
+        self._maybe_fail()
+        cached = estimate_tokens(cache["prefix"]) if cache else 0
+        return text, estimate_tokens(prompt) + cached, estimate_tokens(text), cached
+
+    def stream(self, prompt: str, timeout: float, cache=None):
+        text, delay = self._answer(prompt, cache)
+        words = text.split(" ")
+        self._maybe_fail()
+        for i, w in enumerate(words):
+            time.sleep(delay / len(words))
+            yield w if i == 0 else " " + w
+
+def make_backend(name: str = BACKEND):
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "stub":
+        return StubBackend(latency=float(os.getenv("LLM_STUB_LATENCY_MS", "0")) / 1000,
+                           error_rate=float(os.getenv("LLM_STUB_ERROR_RATE", "0")),
+                           ms_per_1k=float(os.getenv("LLM_STUB_MS_PER_1K_TOKENS", "0")))
+    raise SystemExit(f"LLM_BACKEND desconhecido: {name}")
+
+# -------------------- cliente --------------------
+class LLMClient:
+    """
+    generate(prompt) -> {"text", "prompt_tokens", "output_tokens", "cached_tokens", "seconds", "attempts",
+    "hedge_won"} e stream(prompt) -> pedaços de texto, com prazo, retry com jitter e hedge (só no
+    generate). Com `cache` (handle do backend, ver prompt_cache), `prompt` é só o sufixo.
+    Tentativas que estouram o prazo são abandonadas (o backend recebe o mesmo timeout e
+    encerra a requisição por conta própria).
+    """
+
+    def __init__(self, backend, timeout: float = TIMEOUT, deadline: float = DEADLINE, retries: int = RETRIES,
+                 hedge: str = HEDGE, workers: int = 32):
+        self.backend = backend
+        self.model = getattr(backend, "model", MODEL_NAME)
+        self.timeout, self.deadline, self.retries, self.hedge = timeout, deadline, retries, hedge
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._lat: deque = deque(maxlen=WINDOW)
+        self._stats = {"calls": 0, "ok": 0, "errors": 0, "attempts": 0, "retries": 0, "timeouts": 0,
+                       "hedges": 0, "hedge_wins": 0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+
+    def _count(self, **inc) -> None:
+        with self._lock:
+            for k, v in inc.items():
+                self._stats[k] += v
+
+    def hedge_after(self) -> float | None:
+        """Segundos até disparar a requisição duplicada (None: sem hedge)."""
+        if not self.hedge:
+            return None
+        if self.hedge != "p95":
+            return float(self.hedge) / 1000
+        with self._lock:
+            lat = sorted(self._lat)
+        if len(lat) < HEDGE_MIN_SAMPLES:
+            return None
+        return lat[min(len(lat) - 1, int(0.95 * len(lat)))]
+
+    def _backoff(self, attempt: int, until: float) -> None:
+        time.sleep(min(random.uniform(0, min(BACKOFF_MAX, BACKOFF * 2 ** attempt)), max(0.0, until - time.monotonic())))
+
+    def _attempt(self, prompt: str, timeout: float, cache=None) -> tuple[tuple, bool]:
+        """Uma tentativa (com a cópia do hedge, se disparar). Retorna (resultado do backend, hedge venceu)."""
+        start = time.monotonic()
+        end = start + timeout
+        hedge = self.hedge_after()
+        call = partial(self.backend.generate, prompt, cache=cache) if cache is not None else partial(self.backend.generate, prompt)
+        futures = [self._pool.submit(call, timeout)]
+        self._count(attempts=1)
+        while True:
+            now = time.monotonic()
+            until = end if hedge is None or len(futures) > 1 else min(end, start + hedge)
+            done, _ = wait([f for f in futures if not f.done()] or futures, timeout=max(0.0, until - now),
+                           return_when=FIRST_COMPLETED)
+            for f in futures:
+                if f.done() and (f.exception() is None or all(g.done() for g in futures)):
+                    return f.result(), f is not futures[0]
+            if time.monotonic() >= end:
+                self._count(timeouts=1)
+                raise TimeoutError(f"LLM sem resposta em {timeout:.1f}s")
+            if hedge is not None and len(futures) == 1 and not done:
+                # passou do p95 sem resposta: uma cópia da requisição; vale a que chegar primeiro
+                futures.append(self._pool.submit(call, max(0.0, end - time.monotonic())))
+                self._count(attempts=1, hedges=1)
+
+    def generate(self, prompt: str, cache=None) -> dict:
+        t0 = time.monotonic()
+        deadline = t0 + self.deadline
+        self._count(calls=1)
+        for attempt in range(self.retries + 1):
+            left = deadline - time.monotonic()
+            try:
+                if left <= 0:
+                    raise TimeoutError(f"LLM sem resposta em {self.deadline:.1f}s (prazo total)")
+                started = time.monotonic()
+                (text, pt, ot, *rest), hedged = self._attempt(prompt, min(self.timeout, left), cache)
+            except Exception as e:
+                if attempt == self.retries or not retryable(e) or deadline - time.monotonic() <= 0:
+                    self._count(errors=1)
+                    raise
+                self._count(retries=1)
+                self._backoff(attempt, deadline)
+                continue
+            seconds = time.monotonic() - t0
+            pt = pt if pt is not None else estimate_tokens(prompt)
+            ot = ot if ot is not None else estimate_tokens(text)
+            ct = (rest[0] if rest else None) or 0
+            with self._lock:
+                self._lat.append(time.monotonic() - started)  # latência da tentativa que respondeu (base do p95)
+            self._count(ok=1, prompt_tokens=pt, output_tokens=ot, cached_tokens=ct, hedge_wins=int(hedged))
+            metrics.observe("llm", seconds)
+            return {"text": text, "prompt_tokens": pt, "output_tokens": ot,
+                    "cached_tokens": ct, "seconds": seconds,
+                    "attempts": attempt + 1, "hedge_won": hedged}
+
+    def stream(self, prompt: str, cache=None):
+        """
+        Pedaços do texto conforme o backend produz. Repete só até o 1º pedaço (depois disso o
+        texto já foi entregue); o prazo por tentativa vale para o 1º pedaço e entre pedaços.
+        """
+        t0 = time.monotonic()
+        deadline = t0 + self.deadline
+        self._count(calls=1)
+        for attempt in range(self.retries + 1):
+            timeout = min(self.timeout, deadline - time.monotonic())
+            pieces: queue.Queue = queue.Queue()
+            stop = threading.Event()
+
+            def pump(pieces, stop, timeout):
+                try:
+                    it = (self.backend.stream(prompt, timeout, cache=cache) if cache is not None
+                          else self.backend.stream(prompt, timeout))
+                    for piece in it:
+                        if stop.is_set():
+                            return
+                        pieces.put(("piece", piece))
+                    pieces.put(("end", None))
+                except Exception as e:
+                    pieces.put(("error", e))
+
+            parts: list[str] = []
+            try:
+                if timeout <= 0:
+                    raise TimeoutError(f"LLM sem resposta em {self.deadline:.1f}s (prazo total)")
+                self._pool.submit(pump, pieces, stop, timeout)
+                self._count(attempts=1)
+                while True:
+                    try:
+                        kind, val = pieces.get(timeout=timeout)
+                    except queue.Empty:
+                        self._count(timeouts=1)
+                        raise TimeoutError(f"LLM sem resposta em {timeout:.1f}s") from None
+                    if kind == "error":
+                        raise val
+                    if kind == "end":
+                        break
+                    if not parts:
+                        metrics.observe("llm_first_token", time.monotonic() - t0)
+                    parts.append(val)
+                    yield val
+            except Exception as e:
+                if parts or attempt == self.retries or not retryable(e) or deadline - time.monotonic() <= 0:
+                    self._count(errors=1)
+                    raise
+                self._count(retries=1)
+                self._backoff(attempt, deadline)
+                continue
+            finally:
+                stop.set()
+            seconds = time.monotonic() - t0
+            self._count(ok=1, prompt_tokens=estimate_tokens(prompt), output_tokens=estimate_tokens("".join(parts)))
+            metrics.observe("llm", seconds)
+            return
+
+    def stats(self) -> dict:
+        """Contadores + p50/p95/p99 (ms) das tentativas que responderam no generate()."""
+        with self._lock:
+            st = dict(self._stats)
+            lat = sorted(self._lat)
+        for q in (0.5, 0.95, 0.99):
+            st[f"p{int(q * 100)}_ms"] = round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 1) if lat else 0.0
+        return st
+
+# Cliente do processo: backend aquecido uma vez e reaproveitado em cada ask()
+_client_lock = threading.Lock()
+_client: LLMClient | None = None
+
+def get_client() -> LLMClient:
+    """Cria (uma vez) o cliente do backend de LLM_BACKEND e devolve o compartilhado."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(make_backend())
+    return _client
+
+def set_client(client: LLMClient | None) -> None:
+    """Troca o cliente do processo (benchmarks / teste de carga com outro backend)."""
+    global _client
+    with _client_lock:
+        _client = client
+
+def stats() -> dict:
+    return _client.stats() if _client is not None else {}
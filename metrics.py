@@ -0,0 +1,175 @@
+# metrics.py
+# Spans de latência por etapa (download de CSV, busca/export no Drive, chunking, Chroma,
+# LLM, escrita do markdown) agregados por endpoint e cliente, expostos em /metrics no
+# formato texto do Prometheus: histogramas com buckets + p50/p95/p99 de uma janela recente.
+# Também o tamanho do prompt (tokens) de cada chamada ao LLM.
+
+from __future__ import annotations
+import contextvars, math, threading, time
+from collections import deque
+from contextlib import contextmanager
+
+PREFIX = "assistente"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, math.inf)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, math.inf)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# rótulos da requisição atual (o service define; nos CLIs ficam "cli"/"")
+_endpoint = contextvars.ContextVar("metrics_endpoint", default="cli")
+_client = contextvars.ContextVar("metrics_client", default="")
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v))
+
+def _esc(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...],
+                 buckets: tuple[float, ...] = BUCKETS, window: int = 1024):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = buckets
+        self.window = window
+        self._lock = threading.Lock()
+        self._series: dict[tuple, dict] = {}
+
+    def observe(self, value: float, *labelvalues) -> None:
+        with self._lock:
+            s = self._series.get(labelvalues)
+            if s is None:
+                s = self._series[labelvalues] = {
+                    "counts": [0] * len(self.buckets), "sum": 0.0, "count": 0,
+                    "recent": deque(maxlen=self.window),
+                }
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s["counts"][i] += 1
+                    break
+            s["sum"] += value
+            s["count"] += 1
+            s["recent"].append(value)
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        qs = [f"# HELP {self.name}_quantile {self.help} (p50/p95/p99 das últimas {self.window} amostras)",
+              f"# TYPE {self.name}_quantile gauge"]
+        with self._lock:
+            items = [(k, list(v["counts"]), v["sum"], v["count"], sorted(v["recent"]))
+                     for k, v in self._series.items()]
+        for lv, counts, total, n, recent in items:
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                le = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, lv, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, lv)} {total}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, lv)} {n}")
+            for q in QUANTILES:
+                if recent:
+                    v = recent[min(len(recent) - 1, int(q * len(recent)))]
+                    ql = 'quantile="%s"' % q
+                    qs.append(f"{self.name}_quantile{_labels(self.labelnames, lv, ql)} {v}")
+        return out + qs
+
+STAGE_SECONDS = Histogram(
+    f"{PREFIX}_stage_seconds", "Duração das etapas do pipeline em segundos.", ("stage", "endpoint", "client"))
+REQUEST_SECONDS = Histogram(
+    f"{PREFIX}_request_seconds", "Duração total das requisições em segundos.", ("endpoint", "client", "status"))
+PROMPT_TOKENS = Histogram(
+    f"{PREFIX}_prompt_tokens", "Tokens (estimados) do prompt enviado ao LLM por requisição.", ("endpoint", "client"),
+    buckets=TOKEN_BUCKETS)
+
+_gauges: dict[str, tuple[str, object]] = {}
+
+def register_gauges(name: str, help: str, fn) -> None:
+    """fn() -> {rótulo_valor: número} ou número; exportado como gauge {PREFIX}_{name}."""
+    _gauges[name] = (help, fn)
+
+@contextmanager
+def labels(endpoint: str | None = None, client: str | None = None):
+    """Define endpoint/cliente dos spans dentro do bloco."""
+    tokens = []
+    if endpoint is not None:
+        tokens.append((_endpoint, _endpoint.set(endpoint)))
+    if client is not None:
+        tokens.append((_client, _client.set(client)))
+    try:
+        yield
+    finally:
+        for var, tok in reversed(tokens):
+            var.reset(tok)
+
+def observe(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage, _endpoint.get(), _client.get())
+
+def observe_tokens(n: int) -> None:
+    PROMPT_TOKENS.observe(n, _endpoint.get(), _client.get())
+
+@contextmanager
+def span(stage: str):
+    """Mede a etapa e registra no histograma com os rótulos da requisição atual."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+
+@contextmanager
+def request(endpoint: str, client: str = ""):
+    """Rótulos + latência total de uma requisição (status ok/error)."""
+    t0 = time.perf_counter()
+    status = "ok"
+    with labels(endpoint, client):
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint, client, status)
+
+def labeled_iter(it, endpoint: str, client: str = ""):
+    """
+    Consome um gerador aplicando os rótulos a cada passo (StreamingResponse avança o
+    gerador em threads diferentes, então um `with labels()` por fora não valeria lá dentro).
+    Registra a latência total como uma requisição.
+    """
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        while True:
+            with labels(endpoint, client):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint, client, status)
+
+def render() -> str:
+    lines = REQUEST_SECONDS.render() + STAGE_SECONDS.render() + PROMPT_TOKENS.render()
+    for name, (help, fn) in sorted(_gauges.items()):
+        metric = f"{PREFIX}_{name}"
+        try:
+            val = fn()
+        except Exception:
+            continue
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} gauge"]
+        if isinstance(val, dict):
+            for k, v in val.items():
+                lines.append(f'{metric}{{key="{_esc(k)}"}} {v}')
+        else:
+            lines.append(f"{metric} {val}")
+    return "\n".join(lines) + "\n"
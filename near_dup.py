@@ -0,0 +1,272 @@
+# near_dup.py
+# Detecção de trechos quase iguais (MinHash + LSH). Dailies/weeklies repetem blocos inteiros
+# de boilerplate e o overlap do chunking duplica ainda mais texto: no ingest, um chunk
+# praticamente idêntico a outro do mesmo cliente/tipo (INGEST_THRESHOLD e os MESMOS números)
+# não vai para o Chroma (vira referência ao canônico, que é sempre o texto mais novo) e, na
+# consulta, dedupe() tira do contexto os trechos que repetem o que já foi escolhido. Dois
+# relatórios que só diferem nos valores (CPL, gasto) nunca colapsam: os números são o conteúdo.
+
+from __future__ import annotations
+import os, re, threading, zlib
+
+import numpy as np
+
+NUM_PERM = 64
+BANDS, ROWS = 16, 4  # 16 x 4 = NUM_PERM; candidatos a partir de ~0.5 de Jaccard, confirmados por THRESHOLD
+SHINGLE = 5          # palavras por shingle
+THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))                # consulta (dedupe do contexto)
+INGEST_THRESHOLD = float(os.getenv("DEDUP_INGEST_THRESHOLD", "0.98"))  # ingest: só cópia/boilerplate
+_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(1729)  # permutações fixas: assinaturas persistidas continuam comparáveis
+_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_WORD = re.compile(r"\w+")
+_NUM = re.compile(r"(?<!\w)\d[\d.,]*")  # 12,40 / 3.100 / 2025-02-10 (não pega "dia5")
+
+def signature(text: str) -> np.ndarray:
+    """Assinatura MinHash (NUM_PERM x uint64) dos shingles de SHINGLE palavras do texto."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= SHINGLE:
+        grams = {" ".join(words)}
+    else:
+        grams = {" ".join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)}
+    x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+    # a, x < 2^32: a*x + b cabe em uint64 sem estourar
+    return ((np.outer(_A, x) + _B[:, None]) % _PRIME).min(axis=1)
+
+def numbers(text: str) -> str:
+    """Impressão dos números do texto, em ordem: trechos com valores diferentes nunca colapsam."""
+    nums = "|".join(n.rstrip(".,") for n in _NUM.findall(text))
+    return f"{zlib.crc32(nums.encode('utf-8')):08x}"
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard estimado entre duas assinaturas."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4  # ~4 caracteres por token (pt-BR, Gemini)
+
+class DedupIndex:
+    """
+    Índice LSH persistido ao lado do manifest de cada coleção. Cada chunk visto no ingest
+    guarda assinatura, escopo (cliente|tipo: só colapsa o que os filtros da busca tratam
+    igual), fonte, data, impressão dos números e, se for duplicata, o id do canônico. Só
+    canônicos ficam nos baldes.
+    """
+
+    def __init__(self, path: str, threshold: float = INGEST_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._entries: dict[str, list] = {}      # cid -> [sig, escopo, fonte, date_int, dup_of, números]
+        self._refs: dict[str, set[str]] = {}     # canônico -> duplicatas
+        self._buckets: dict[tuple, set[str]] = {}
+        self.touched: set[str] = set()           # canônicos cujo grupo mudou (metadados a atualizar)
+        self.collapsed = 0                       # duplicatas novas desde a abertura
+        self._load()
+
+    # -------- persistência --------
+    def _load(self) -> None:
+        try:
+            data = np.load(self.path, allow_pickle=False)
+        except (OSError, ValueError):
+            return
+        with data:
+            # índice anterior à impressão dos números: "" não casa com nada (só vale o que já colapsou)
+            nums = data["nums"] if "nums" in data.files else [""] * len(data["ids"])
+            for cid, scope, src, d, dup, sig, n in zip(data["ids"], data["scopes"], data["sources"],
+                                                       data["dates"], data["dup_of"], data["sigs"], nums):
+                self._put(str(cid), sig, str(scope), str(src), int(d), str(dup) or None, str(n))
+
+    def save(self) -> None:
+        ids = list(self._entries)
+        ent = [self._entries[c] for c in ids]
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, ids=np.array(ids, dtype=str), scopes=np.array([e[1] for e in ent], dtype=str),
+                     sources=np.array([e[2] for e in ent], dtype=str),
+                     dates=np.array([e[3] for e in ent], dtype=np.int64),
+                     dup_of=np.array([e[4] or "" for e in ent], dtype=str),
+                     nums=np.array([e[5] for e in ent], dtype=str),
+                     sigs=np.array([e[0] for e in ent], dtype=np.uint64).reshape(len(ent), NUM_PERM))
+        os.replace(tmp, self.path)
+
+    # -------- consulta --------
+    def __contains__(self, cid: str) -> bool:
+        return cid in self._entries
+
+    def is_dup(self, cid: str) -> bool:
+        e = self._entries.get(cid)
+        return e is not None and e[4] is not None
+
+    def refs(self, cid: str) -> list[tuple[str, str]]:
+        """Duplicatas (id, fonte) colapsadas num canônico."""
+        return [(d, self._entries[d][2]) for d in sorted(self._refs.get(cid, ()))]
+
+    def match(self, sig: np.ndarray, scope: str, nums: str) -> str | None:
+        """Canônico mais parecido no escopo, se passar do limiar e tiver os mesmos números."""
+        best, best_sim = None, self.threshold
+        seen = set()
+        for key in self._keys(sig, scope):
+            for cid in self._buckets.get(key, ()):
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                if not nums or self._entries[cid][5] != nums:
+                    continue
+                sim = similarity(sig, self._entries[cid][0])
+                if sim >= best_sim:
+                    best, best_sim = cid, sim
+        return best
+
+    def adjust(self, cid: str, meta: dict) -> dict:
+        """
+        Metadados do canônico: nº de duplicatas. A data fica a do próprio texto (o canônico já
+        é o mais novo do grupo ao entrar; a data de outro texto nunca é copiada para ele).
+        """
+        if cid not in self._entries or self.is_dup(cid):
+            return meta
+        meta["dups"] = len(self._refs.get(cid, ()))
+        return meta
+
+    # -------- alteração --------
+    def add(self, cid: str, sig: np.ndarray, scope: str, source: str, date_int: int,
+            nums: str) -> tuple[str | None, str | None]:
+        """
+        Registra um chunk (novo ou com texto novo). Retorna (canônico, rebaixado): canônico se
+        ele é duplicata; se ele é mais novo que o canônico que casou, ele assume o grupo e
+        "rebaixado" é o canônico antigo, que vira duplicata e deve sair do Chroma.
+        """
+        canon = self.match(sig, scope, nums)
+        if canon is not None and date_int > self._entries[canon][3]:
+            self._put(cid, sig, scope, source, date_int, None, nums)
+            self._demote(canon, cid)
+            self.collapsed += 1
+            self.touched.add(cid)
+            return None, canon
+        self._put(cid, sig, scope, source, date_int, canon, nums)
+        if canon is not None:
+            self.collapsed += 1
+            self.touched.add(canon)
+        return canon, None
+
+    def _demote(self, old: str, new: str) -> None:
+        """O canônico `old` e as duplicatas dele passam a apontar para `new`."""
+        e = self._entries[old]
+        for key in self._keys(e[0], e[1]):
+            b = self._buckets.get(key)
+            if b is not None:
+                b.discard(old)
+                if not b:
+                    del self._buckets[key]
+        refs = self._refs.setdefault(new, set())
+        for d in self._refs.pop(old, ()):
+            self._entries[d][4] = new
+            refs.add(d)
+        e[4] = new
+        refs.add(old)
+        self.touched.discard(old)
+
+    def remove(self, cid: str) -> tuple[bool, list[tuple[str, str]]]:
+        """
+        Tira o chunk do índice. Retorna (era duplicata, órfãos): se era canônico, as duplicatas
+        dele saem também e voltam como órfãos (id, fonte) para o ingest reprocessar.
+        """
+        e = self._entries.pop(cid, None)
+        if e is None:
+            return False, []
+        if e[4] is not None:
+            self._refs.get(e[4], set()).discard(cid)
+            self.touched.add(e[4])
+            return True, []
+        for key in self._keys(e[0], e[1]):
+            b = self._buckets.get(key)
+            if b is not None:
+                b.discard(cid)
+                if not b:
+                    del self._buckets[key]
+        self.touched.discard(cid)
+        orphans = [(d, self._entries.pop(d)[2]) for d in sorted(self._refs.pop(cid, ()))]
+        return False, orphans
+
+    def retag(self, cid: str, scope: str, date_int: int) -> list[tuple[str, str]]:
+        """Metadados do arquivo mudaram: atualiza data/escopo. Retorna os chunks a reprocessar."""
+        e = self._entries.get(cid)
+        if e is None:
+            return []
+        if e[1] == scope:
+            e[3] = date_int
+            self.touched.add(e[4] or cid)
+            return []
+        if e[4] is not None:  # duplicata mudou de escopo: precisa de um canônico no escopo novo
+            self.remove(cid)
+            return [(cid, e[2])]
+        sig, src, nums = e[0], e[2], e[5]
+        _, orphans = self.remove(cid)
+        self._put(cid, sig, scope, src, date_int, None, nums)
+        self.touched.add(cid)
+        return orphans
+
+    def pop_touched(self) -> list[tuple[str, str]]:
+        """Canônicos (id, fonte) cujo grupo mudou desde a última chamada."""
+        out = [(c, self._entries[c][2]) for c in sorted(self.touched) if c in self._entries and not self.is_dup(c)]
+        self.touched = set()
+        return out
+
+    def stats(self) -> dict:
+        dups = sum(len(r) for r in self._refs.values())
+        total = len(self._entries)
+        return {"chunks": total, "canonical": total - dups, "duplicates": dups,
+                "index_saved_pct": round(100 * dups / total, 1) if total else 0.0}
+
+    def _put(self, cid, sig, scope, source, date_int, dup_of, nums) -> None:
+        self._entries[cid] = [np.asarray(sig, dtype=np.uint64), scope, source, date_int, dup_of, nums]
+        if dup_of is not None:
+            self._refs.setdefault(dup_of, set()).add(cid)
+            return
+        for key in self._keys(sig, scope):
+            self._buckets.setdefault(key, set()).add(cid)
+
+    @staticmethod
+    def _keys(sig: np.ndarray, scope: str):
+        for i in range(BANDS):
+            yield scope, i, sig[i * ROWS:(i + 1) * ROWS].tobytes()
+
+# -------- consulta: dedupe do contexto --------
+_stats_lock = threading.Lock()
+_query = {"queries": 0, "candidates": 0, "dropped": 0, "tokens_before": 0, "tokens_after": 0,
+          "redundant_tokens": 0}
+
+def dedupe(docs: list[str], metas: list[dict], k: int, threshold: float = THRESHOLD) -> tuple[list[str], list[dict]]:
+    """
+    Percorre os resultados em ordem de relevância e descarta os quase iguais a um já
+    escolhido com os mesmos números (relatórios que só mudam os valores ficam os dois); para em k (com busca ampliada, as vagas liberadas vão para trechos novos).
+    Contabiliza os tokens do top-k sem dedupe, com dedupe e os redundantes (query_stats()).
+    """
+    kept_docs, kept_metas, sigs = [], [], []
+    dropped = redundant = 0
+    for i, (d, m) in enumerate(zip(docs, metas)):
+        if len(kept_docs) >= k:
+            break
+        s, n = signature(d), numbers(d)
+        if any(n == on and similarity(s, o) >= threshold for o, on in sigs):
+            dropped += 1
+            if i < k:
+                redundant += estimate_tokens(d)
+            continue
+        kept_docs.append(d)
+        kept_metas.append(m)
+        sigs.append((s, n))
+    with _stats_lock:
+        _query["queries"] += 1
+        _query["candidates"] += len(docs)
+        _query["dropped"] += dropped
+        _query["tokens_before"] += sum(estimate_tokens(d) for d in docs[:k])
+        _query["tokens_after"] += sum(estimate_tokens(d) for d in kept_docs)
+        _query["redundant_tokens"] += redundant
+    return kept_docs, kept_metas
+
+def query_stats() -> dict:
+    with _stats_lock:
+        st = dict(_query)
+    st["redundant_pct"] = round(100 * st["redundant_tokens"] / st["tokens_before"], 1) if st["tokens_before"] else 0.0
+    return st
@@ -7,8 +7,11 @@ import re
 import shutil
 import subprocess
 import sys
+import time
 from datetime import datetime
 
+from report_registry import get_registry, new_run_id
+
 PY = sys.executable
 
 def ensure_dir(d: str):
@@ -50,7 +53,9 @@ def main():
     # opcionais: processar Ads CSV no mesmo fluxo (se quiser)
     ap.add_argument("--google_csv")
     ap.add_argument("--meta_csv")
+    ap.add_argument("--run-id", dest="run_id", help="ID do run registrado no manifest de relatórios")
     args = ap.parse_args()
+    run_id = args.run_id or new_run_id()
 
     ensure_dir("logs")
     ts = datetime.now().strftime("%Y%m%d-%H%M%S")
@@ -61,9 +66,17 @@ def main():
     client_dir  = os.path.join("reports", client_slug)
     ensure_dir(client_dir)
     ts_report   = datetime.now().strftime("%Y%m%d-%H%M")
-    out_ts_path = os.path.join(client_dir, f"relatorio-{ts_report}.md")
+    out_ts_path = os.path.join(client_dir, f"relatorio-{ts_report}-{run_id}.md")
     out_latest  = os.path.join(client_dir, "relatorio.md")
 
+    timings: dict[str, float] = {}
+    t_start = time.perf_counter()
+
+    def step(name: str, cmd: list[str], logf):
+        t0 = time.perf_counter()
+        run_and_log(cmd, logf)
+        timings[name] = round(time.perf_counter() - t0, 3)
+
     with open(log_path, "w", encoding="utf-8") as logf:
         logf.write(f"Pipeline start: {ts}\n")
 
@@ -72,23 +85,26 @@ def main():
             cmd_ads = [PY, "ads_kpis_from_csv.py", "--client", args.client]
             if args.google_csv: cmd_ads += ["--google_csv", args.google_csv]
             if args.meta_csv:   cmd_ads += ["--meta_csv", args.meta_csv]
-            run_and_log(cmd_ads, logf)
+            step("ads_kpis", cmd_ads, logf)
 
         # 1) Busca inteligente + export (txt/csv cai em data/raw)
-        run_and_log([PY, "smart_search_sa.py", "--client", args.client, "--type", args.type,
-                     "--export", "txt", "--take", str(args.take), "--rules", args.rules], logf)
+        step("search", [PY, "smart_search_sa.py", "--client", args.client, "--type", args.type,
+                        "--export", "txt", "--take", str(args.take), "--rules", args.rules], logf)
 
-        # 2) Ingestão do que caiu em data/raw
-        run_and_log([PY, "ingest_txt.py"], logf)
+        # 2) Ingestão do que caiu em data/raw (espera o daemon de ingest_watch, se houver)
+        step("ingest", [PY, "ingest_watch.py", "--sync"], logf)
 
         # 3) Relatório executivo -> salva por cliente (com timestamp) e copia como latest
-        run_and_log([PY, "report_exec.py", "--q", args.q, "--out", out_ts_path], logf)
+        step("report", [PY, "report_exec.py", "--q", args.q, "--out", out_ts_path, "--client", client_slug], logf)
 
         try:
             shutil.copyfile(out_ts_path, out_latest)
         except Exception as e:
             logf.write(f"[warn] copy latest failed: {e}\n")
 
+        timings["total"] = round(time.perf_counter() - t_start, 3)
+        get_registry().record(client_slug, out_ts_path, args.q, run_id=run_id, timings=timings,
+                              type=args.type, latest_path=out_latest, log=log_path)
         logf.write("Pipeline OK\n")
 
     print("OK! Pipeline concluído. Veja:")
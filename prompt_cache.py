@@ -0,0 +1,275 @@
+# prompt_cache.py
+# Prompt em duas partes: um prefixo estático por cliente (instruções, regras da empresa e o
+# resumo de KPIs de Ads de data/raw/ads_kpis_<cliente>.txt) e o sufixo de cada pergunta
+# (contexto recuperado + pergunta). O prefixo vai para o cache de contexto do provedor
+# (Gemini context caching) quando o backend suporta e ele passa do mínimo de tokens; senão,
+# o fallback local só contabiliza os bytes/tokens que deixariam de ser reenviados. Entradas
+# expiram com a versão do corpus (ingest novo = KPIs/regras possivelmente novos) ou pelo TTL.
+# O prefixo tem orçamento próprio (PROMPT_PREFIX_BUDGET; KPIs além dele são cortados) e não
+# consome o do contexto recuperado (context_packer). Com o modelo padrão (gemini-1.5-flash,
+# mínimo de 32768 tokens) e o orçamento padrão, o cache do provedor NÃO é criado: só o
+# fallback local roda. Ele vale para modelos de mínimo menor (gemini-2.5-flash: 1024) ou com
+# PROMPT_PREFIX_BUDGET acima do mínimo do modelo.
+
+from __future__ import annotations
+import hashlib, json, os, re, threading, time
+
+from client_matcher import slugify
+from doc_meta import RAW_DIR
+from near_dup import estimate_tokens
+from vectorstore import get_store
+
+ROOT = os.getenv("APP_ROOT", os.getcwd())
+RULES_PATH = os.getenv("COMPANY_RULES", os.path.join(ROOT, "company_rules.json"))
+MODE = os.getenv("PROMPT_CACHE", "auto").strip().lower()  # "auto" (provedor se der) | "local" | "off"
+TTL = int(os.getenv("PROMPT_CACHE_TTL", "3600"))          # s; o cache do provedor é criado com este TTL
+MIN_TOKENS = os.getenv("PROMPT_CACHE_MIN_TOKENS")          # sobrepõe o mínimo do backend (llm_client.min_cache_tokens)
+PREFIX_BUDGET = int(os.getenv("PROMPT_PREFIX_BUDGET", "4000"))  # tokens estimados do prefixo (instruções+regras+KPIs)
+_KPIS = re.compile(r"^ads_kpis_(.+)\.txt$", re.I)
+
+INSTRUCTIONS = """Responda de forma objetiva usando apenas as informações deste prompt (regras, KPIs e contexto).
+Se a resposta não estiver nelas, diga que não há informação suficiente.
+Mostre no final as fontes entre colchetes.
+"""
+
+# -------------------- prefixo estático --------------------
+_files_lock = threading.Lock()
+_files: dict[str, tuple[float, object]] = {}  # caminho -> (mtime, conteúdo lido / KPIs de data/raw por cliente)
+
+def _cached_read(path: str, parse):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _files_lock:
+        hit = _files.get(path)
+        if hit is not None and hit[0] == mtime:
+            return hit[1]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            val = parse(f)
+    except (OSError, ValueError):
+        val = None
+    with _files_lock:
+        _files[path] = (mtime, val)
+    return val
+
+def kpis_path(client: str | None) -> str | None:
+    """ads_kpis_<cliente>.txt do cliente (slug); o nome do arquivo usa o nome com "_" e caixa livre."""
+    if not client:
+        return None
+    try:
+        mtime = os.path.getmtime(RAW_DIR)
+    except OSError:
+        return None
+    with _files_lock:
+        hit = _files.get(RAW_DIR)
+    if hit is None or hit[0] != mtime:
+        # listagem de data/raw só quando o diretório muda (arquivo criado/removido)
+        found = {}
+        for n in sorted(os.listdir(RAW_DIR)):
+            m = _KPIS.match(n)
+            if m:
+                found.setdefault(slugify(m.group(1)), os.path.join(RAW_DIR, n))
+        hit = (mtime, found)
+        with _files_lock:
+            _files[RAW_DIR] = hit
+    return hit[1].get(client)
+
+def company_rules(client: str | None) -> list[str]:
+    """Regras de texto do company_rules.json: "prompt_rules": {"*": [...], "<Cliente>": [...]}."""
+    rules = _cached_read(RULES_PATH, json.load) or {}
+    by_client = rules.get("prompt_rules") or {}
+    if isinstance(by_client, list):
+        return [str(r) for r in by_client]
+    out = [str(r) for r in by_client.get("*", [])]
+    for name, items in by_client.items():
+        if name != "*" and client and slugify(name) == client:
+            out += [str(r) for r in items]
+    return out
+
+def _fit(text: str, budget: int) -> tuple[str, bool]:
+    """Linhas do início de `text` até `budget` tokens. Retorna (texto, coube inteiro)."""
+    if estimate_tokens(text) <= budget:
+        return text, True
+    lines, used = [], 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line + "\n")
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines), False
+
+def static_prefix(client: str | None, budget: int = PREFIX_BUDGET) -> tuple[str, str | None]:
+    """
+    (prefixo do cliente, caminho do arquivo de KPIs que entrou nele inteiro ou None). KPIs que
+    passam de `budget` são cortados por linha; aí o arquivo não sai do contexto recuperado.
+    """
+    parts = [INSTRUCTIONS]
+    rules = company_rules(client)
+    if rules:
+        parts.append("Regras da empresa:\n" + "\n".join(f"- {r}" for r in rules) + "\n")
+    path = kpis_path(client)
+    kpis = _cached_read(path, lambda f: f.read().strip()) if path else None
+    head = f"KPIs de mídia do cliente [{os.path.basename(path)}]:\n" if kpis else ""
+    room = budget - estimate_tokens("\n".join(parts) + "\n" + head + "\n[...]\n")
+    if kpis and room > 0:
+        kpis, whole = _fit(kpis, room)
+        parts.append(head + kpis + ("\n" if whole else "\n[...]\n"))
+        path = path if whole else None
+    else:
+        path = None
+    return "\n".join(parts) + "\n", path
+
+# -------------------- cache do prefixo --------------------
+class PrefixCache:
+    """
+    Uma entrada por (modelo, cliente): hash do prefixo, versão do corpus, validade e o handle
+    do cache do provedor (None no modo local). Prefixo, versão ou TTL diferentes = entrada nova
+    (e o cache antigo do provedor é apagado).
+    """
+
+    def __init__(self, mode: str = MODE, ttl: int = TTL):
+        self.mode, self.ttl = mode, ttl
+        self._lock = threading.Lock()
+        self._create_lock = threading.Lock()
+        self._entries: dict[tuple[str, str], dict] = {}
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "expired": 0, "provider_created": 0,
+                       "provider_errors": 0, "local_bytes_saved": 0, "local_tokens_saved": 0,
+                       "cached_tokens": 0, "prompt_tokens": 0, "calls_cached": 0, "calls_uncached": 0,
+                       "llm_s_cached": 0.0, "llm_s_uncached": 0.0}
+
+    def _min_tokens(self, llm) -> int:
+        if MIN_TOKENS:
+            return int(MIN_TOKENS)
+        return getattr(llm.backend, "min_cache_tokens", 0)
+
+    def _hit(self, key: tuple, digest: str, version: int, prefix: str):
+        """(True, handle) se a entrada vale; (False, None) se falta/expirou (com o lock)."""
+        e = self._entries.get(key)
+        if e is None or e["digest"] != digest or e["version"] != version or e["expires"] <= time.time():
+            return False, None
+        self._stats["hits"] += 1
+        if e["handle"] is None:
+            self._stats["local_bytes_saved"] += len(prefix.encode("utf-8"))
+            self._stats["local_tokens_saved"] += e["tokens"]
+        return True, e["handle"]
+
+    def lookup(self, llm, client: str | None, prefix: str):
+        """Handle do cache do provedor para o prefixo (None: manda o prompt inteiro)."""
+        if self.mode == "off":
+            return None
+        key = (llm.model, client or "")
+        digest = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+        version = get_store().version()
+        with self._lock:
+            self._stats["lookups"] += 1
+            ok, handle = self._hit(key, digest, version, prefix)
+        if ok:
+            return handle
+        # criação serializada: requisições simultâneas do mesmo cliente não criam dois caches
+        with self._create_lock:
+            with self._lock:
+                ok, handle = self._hit(key, digest, version, prefix)
+                if not ok:
+                    self._stats["misses"] += 1
+                    self._stats["expired"] += int(key in self._entries)
+            if ok:
+                return handle
+            tokens = estimate_tokens(prefix)
+            create = getattr(llm.backend, "create_cache", None)
+            if self.mode == "auto" and create is not None and tokens >= self._min_tokens(llm):
+                try:
+                    handle = create(prefix, self.ttl)
+                    self._count(provider_created=1)
+                except Exception:
+                    self._count(provider_errors=1)  # modelo sem suporte, cota...: segue sem cache do provedor
+            with self._lock:
+                old = self._entries.get(key)
+                self._entries[key] = {"digest": digest, "version": version, "tokens": tokens, "handle": handle,
+                                      "expires": time.time() + self.ttl * 0.95}  # o do provedor expira depois
+        if old is not None:
+            self._drop(llm, old)
+        return handle
+
+    def invalidate(self, llm, client: str | None) -> None:
+        """Esquece a entrada (ex.: o provedor não achou mais o cache)."""
+        with self._lock:
+            e = self._entries.pop((llm.model, client or ""), None)
+        if e is not None:
+            self._drop(llm, e)
+
+    @staticmethod
+    def _drop(llm, entry: dict) -> None:
+        delete = getattr(llm.backend, "delete_cache", None)
+        if entry["handle"] is not None and delete is not None:
+            try:
+                delete(entry["handle"])
+            except Exception:
+                pass  # já expirou do lado do provedor
+
+    def _count(self, **inc) -> None:
+        with self._lock:
+            for k, v in inc.items():
+                self._stats[k] += v
+
+    def observe(self, result: dict, cached: bool) -> None:
+        """Tokens e latência de uma chamada (com ou sem o prefixo em cache no provedor)."""
+        kind = "cached" if cached else "uncached"
+        self._count(**{"cached_tokens": result.get("cached_tokens") or 0, "prompt_tokens": result["prompt_tokens"],
+                       f"calls_{kind}": 1, f"llm_s_{kind}": result["seconds"]})
+
+    def stats(self) -> dict:
+        with self._lock:
+            st = dict(self._stats)
+            st["entries"] = len(self._entries)
+        for kind in ("cached", "uncached"):
+            n, total = st[f"calls_{kind}"], st.pop(f"llm_s_{kind}")
+            st[f"llm_ms_{kind}_avg"] = round(1000 * total / n, 1) if n else 0.0
+        st["cached_tokens_pct"] = round(100 * st["cached_tokens"] / st["prompt_tokens"], 1) if st["prompt_tokens"] else 0.0
+        return st
+
+CACHE = PrefixCache()
+
+def _cache_miss(e: Exception) -> bool:
+    # cache apagado/expirado no provedor antes da nossa validade
+    return int(getattr(e, "code", 0) or 0) in (403, 404)
+
+def generate(llm, prompt: str, prefix: str, client: str | None) -> dict:
+    """llm.generate() com o prefixo (início de `prompt`) servido do cache do provedor quando houver."""
+    handle = CACHE.lookup(llm, client, prefix) if prefix else None
+    if handle is not None:
+        try:
+            res = llm.generate(prompt[len(prefix):], cache=handle)
+            CACHE.observe(res, True)
+            return res
+        except Exception as e:
+            if not _cache_miss(e):
+                raise
+            CACHE.invalidate(llm, client)
+    res = llm.generate(prompt)
+    CACHE.observe(res, False)
+    return res
+
+def stream(llm, prompt: str, prefix: str, client: str | None):
+    """llm.stream() com o prefixo em cache quando houver (sem tokens exatos: só latência/contagem)."""
+    handle = CACHE.lookup(llm, client, prefix) if prefix else None
+    t0 = time.monotonic()
+    if handle is not None:
+        started = False
+        try:
+            for piece in llm.stream(prompt[len(prefix):], cache=handle):
+                started = True
+                yield piece
+            CACHE.observe({"prompt_tokens": estimate_tokens(prompt), "seconds": time.monotonic() - t0}, True)
+            return
+        except Exception as e:
+            if started or not _cache_miss(e):
+                raise
+            CACHE.invalidate(llm, client)
+    yield from llm.stream(prompt)
+    CACHE.observe({"prompt_tokens": estimate_tokens(prompt), "seconds": time.monotonic() - t0}, False)
+
+def stats() -> dict:
+    return CACHE.stats()
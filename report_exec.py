@@ -2,25 +2,14 @@
 from __future__ import annotations
 import argparse
 import os
-import subprocess
 import sys
 from datetime import datetime
 
-PY = sys.executable
+import metrics
+from ask_with_context import BATCH_CONCURRENCY, ask, ask_many, read_batch
 
 HEADER = "# Relatório Executivo\n\n"
 
-def run_capture(cmd: list[str]) -> str:
-    """Roda um comando e retorna o stdout (como string)."""
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    out_lines = []
-    for line in proc.stdout:
-        out_lines.append(line)
-    proc.wait()
-    if proc.returncode != 0:
-        raise SystemExit(f"Comando falhou: {' '.join(cmd)} (code {proc.returncode})")
-    return "".join(out_lines).strip()
-
 def build_markdown(question: str, body: str) -> str:
     ts = datetime.now().strftime("%Y-%m-%d %H:%M")
     md = []
@@ -32,27 +21,61 @@ def build_markdown(question: str, body: str) -> str:
     md.append("\n")
     return "\n".join(md)
 
+def write_report(question: str, out_path: str = "reports/relatorio.md", client: str | None = None) -> str:
+    """Gera o relatório em processo (RAG + Markdown, contexto só do cliente) e devolve o caminho salvo."""
+    # 1) Corpo da resposta via RAG (mesmo processo, coleção/modelo já aquecidos)
+    body = ask(question, client=client)
+
+    # 2) Monta o markdown com cabeçalho padrão e salva
+    return _save(out_path, question, body)
+
+def _save(out_path: str, question: str, body: str) -> str:
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    markdown = build_markdown(question, body)
+    with metrics.span("markdown_write"):
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(markdown)
+    return out_path
+
+def write_reports(batch_path: str, concurrency: int = BATCH_CONCURRENCY, out_dir: str = "reports",
+                  log=print) -> dict:
+    """
+    Modo lote: JSONL com {client, question, out} por linha. Uma busca vetorizada para todas
+    as perguntas e o LLM em paralelo (até `concurrency`); cada relatório é gravado assim que
+    a resposta chega. Sem "out", vai para out_dir/relatorio-<cliente>-<linha>.md.
+    Retorna {"ok": [caminhos], "failed": [(linha, erro)]}.
+    """
+    items = read_batch(batch_path)
+    for n, it in enumerate(items, 1):
+        it["out"] = it.get("out") or os.path.join(out_dir, f"relatorio-{it.get('client') or 'geral'}-{n}.md")
+    ok, failed = [], []
+    for i, body, usage in ask_many(items, concurrency=concurrency):
+        it = items[i]
+        if isinstance(body, Exception):
+            failed.append((i + 1, str(body)))
+            log(f"[ERRO] linha {i + 1} ({it.get('client') or '-'}): {body}")
+            continue
+        ok.append(_save(it["out"], it["q"], body))
+        log(f"[{len(ok) + len(failed)}/{len(items)}] Relatório salvo em: {it['out']} "
+            f"({usage['prompt_tokens']} tokens de prompt)")
+    return {"ok": ok, "failed": failed}
+
 def main():
     ap = argparse.ArgumentParser(description="Gera relatório executivo em Markdown com base no RAG.")
-    ap.add_argument("--q", required=True, help="Pergunta / instrução para o relatório")
+    mode = ap.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--q", help="Pergunta / instrução para o relatório")
+    mode.add_argument("--batch", help="JSONL com {client, question, out} por linha (um processo para todos)")
     ap.add_argument("--out", default="reports/relatorio.md", help="Caminho do arquivo de saída .md")
+    ap.add_argument("--client", help="Cliente (slug) para filtrar o contexto")
+    ap.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Chamadas ao LLM em paralelo (--batch)")
     args = ap.parse_args()
 
-    out_path = args.out or "reports/relatorio.md"
-    out_dir = os.path.dirname(out_path) or "."
-    os.makedirs(out_dir, exist_ok=True)
-
-    # 1) Pede o corpo da resposta ao seu script de pergunta com contexto
-    #    (mantemos sua lógica atual de RAG sem mexer no core).
-    body = run_capture([PY, "ask_with_context.py", "--q", args.q])
-
-    # 2) Monta o markdown com cabeçalho padrão
-    markdown = build_markdown(args.q, body)
-
-    # 3) Salva
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write(markdown)
+    if args.batch:
+        res = write_reports(args.batch, args.concurrency)
+        print(f"{len(res['ok'])} relatório(s) salvo(s), {len(res['failed'])} falha(s)")
+        sys.exit(1 if res["failed"] else 0)
 
+    out_path = write_report(args.q, args.out or "reports/relatorio.md", client=args.client)
     print(f"Relatório salvo em: {out_path}")
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+# report_registry.py
+# Registro dos relatórios gerados (reports/manifest.jsonl, append-only).
+# Quem escreve um relatório registra (cliente, caminho, pergunta, tempos, tamanho) com o
+# run_id do job; o service busca pelo próprio run_id em O(1), sem glob/mtime em reports/.
+
+from __future__ import annotations
+import json, os, threading, time, uuid
+
+MANIFEST = os.path.join("reports", "manifest.jsonl")
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+class ReportRegistry:
+    def __init__(self, path: str = MANIFEST):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_id: dict[str, dict] = {}
+        self._latest: dict[str, dict] = {}
+        self._offset = 0  # até onde o manifest já foi lido (outros processos também anexam)
+
+    def record(
+        self,
+        client: str,
+        path: str,
+        question: str,
+        run_id: str | None = None,
+        timings: dict | None = None,
+        **extra,
+    ) -> dict:
+        """Anexa uma entrada ao manifest e devolve-a."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        entry = {
+            "id": run_id or new_run_id(),
+            "client": client,
+            "path": path,
+            "question": question,
+            "created_at": time.time(),
+            "size": size,
+            "timings": timings or {},
+            **extra,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # uma única escrita em modo append: linhas de processos concorrentes não se misturam
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self._index(entry)
+        return entry
+
+    def get(self, run_id: str) -> dict | None:
+        with self._lock:
+            if run_id not in self._by_id:
+                self._refresh()
+            return self._by_id.get(run_id)
+
+    def latest(self, client: str) -> dict | None:
+        with self._lock:
+            self._refresh()
+            return self._latest.get(client)
+
+    def _index(self, entry: dict) -> None:
+        self._by_id[entry["id"]] = entry
+        self._latest[entry["client"]] = entry
+
+    def _refresh(self) -> None:
+        """Lê só o que foi anexado desde a última leitura."""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except OSError:
+            return
+        end = data.rfind(b"\n") + 1  # ignora uma linha ainda incompleta
+        for raw in data[:end].splitlines():
+            try:
+                self._index(json.loads(raw))
+            except ValueError:
+                continue
+        self._offset += end
+
+_registry: ReportRegistry | None = None
+
+def get_registry() -> ReportRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ReportRegistry(os.path.join(os.getenv("APP_ROOT", os.getcwd()), MANIFEST))
+    return _registry
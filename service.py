@@ -3,21 +3,30 @@ from __future__ import annotations
 # FastAPI e utilidades
 from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+from contextlib import ExitStack
 
-import subprocess
 import sys
 import os
-import re
-import tempfile
-import urllib.request
-import shutil
-import glob
 import json
 
+import admission
+import ads_stream
+import context_packer
+import embedding_cache
+import engine
+import llm_client
+import metrics
+import near_dup
+import prompt_cache
+from client_matcher import get_matcher, slugify
+from jobs import JobQueue
+from vectorstore import get_store
+
 # --- Configurações globais ---
-PY = sys.executable
 API_KEY = os.getenv("SERVICE_API_KEY", "")  # defina uma chave no Render
 ROOT = os.getenv("APP_ROOT", os.getcwd())   # normalmente '/app' no Render
 
@@ -33,6 +42,21 @@ def _resolve_cli_path() -> str:
 
 CLI = _resolve_cli_path()
 
+# --- Vector store do processo (aberto no startup, compartilhado por chat/run/ingest) ---
+STORE = get_store()
+
+# --- Daemon de ingestão (INGEST_WATCH=1): observa data/raw e reingere o que mudar ---
+WATCH = os.getenv("INGEST_WATCH", "0") == "1"
+WATCH_WAIT = float(os.getenv("INGEST_WATCH_WAIT", "30"))  # espera máx. por min_version no /chat
+_WATCHER = None
+
+# --- Pool de threads dos handlers síncronos (AnyIO); admissão de LLM/Drive usa no máximo metade ---
+THREADS = int(os.getenv("SERVICE_THREADS", "64"))
+
+# --- Fila de jobs em background (/ingest) ---
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+JOBS = JobQueue(workers=INGEST_WORKERS)
+
 # --- Inicialização do app + CORS ---
 app = FastAPI(title="Assistente de Dados Runner", version="1.0.0")
 app.add_middleware(
@@ -43,59 +67,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Admissão: excesso de carga em LLM/Drive vira 429 com Retry-After ---
+@app.exception_handler(admission.Overloaded)
+def _overloaded(request, exc: admission.Overloaded):
+    return JSONResponse(
+        {"ok": False, "detail": "servidor ocupado, tente novamente", "limiter": exc.limiter, "reason": exc.reason},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # --- Servir arquivos estáticos (opcional) ---
 STATIC_DIR = os.path.join(ROOT, "web")
 if os.path.isdir(STATIC_DIR):
     app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
-# --- Funções utilitárias ---
-def slugify(s: str) -> str:
-    return re.sub(r"\W+", "_", s, flags=re.UNICODE).strip("_").lower() or "cliente"
-
-def download_to_tmp(url: str) -> str:
-    tf = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-    with urllib.request.urlopen(url) as r, open(tf.name, "wb") as f:
-        shutil.copyfileobj(r, f)
-    return tf.name
-
-def latest_md_for(client_slug: str) -> tuple[str | None, str]:
-    rep_dir = os.path.join(ROOT, "reports", client_slug)
-    if not os.path.isdir(rep_dir):
-        return None, ""
-    candidates = glob.glob(os.path.join(rep_dir, "*.md"))
-    if not candidates:
-        return None, ""
-    newest = max(candidates, key=os.path.getmtime)
-    try:
-        with open(newest, "r", encoding="utf-8") as f:
-            return newest, f.read()
-    except Exception:
-        return newest, ""
-
 # --- Resolver de cliente (auto/aliases/fallback) ---
-def _load_rules():
-    try:
-        with open("company_rules.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {"org_name": "Start TI", "clients": {}}
-
-_RULES = _load_rules()
-_CLIENT_ALIASES = {k: [k] + v for k, v in _RULES.get("clients", {}).items()}
-_ALIASES_FLAT = {alias.lower(): k for k, arr in _CLIENT_ALIASES.items() for alias in arr}
+# regex única pré-compilada para todos os aliases; recarrega quando company_rules.json muda
+_MATCHER = get_matcher(os.path.join(ROOT, "company_rules.json"))
 
 def resolve_client(raw_client: str | None, query: str) -> str:
     if raw_client:
-        lc = raw_client.strip().lower()
-        if lc in _ALIASES_FLAT:
-            return _ALIASES_FLAT[lc]
-        if lc not in ("auto", "ai_studio"):
-            return raw_client
-    q = (query or "").lower()
-    for alias, canonical in _ALIASES_FLAT.items():
-        if re.search(rf"\b{re.escape(alias)}\b", q):
+        canonical = _MATCHER.lookup(raw_client)
+        if canonical:
             return canonical
-    return next(iter(_CLIENT_ALIASES.keys()), _RULES.get("org_name", "Start TI"))
+        if raw_client.strip().lower() not in ("auto", "ai_studio"):
+            return raw_client
+    return _MATCHER.search(query or "") or _MATCHER.default()
 
 # --- Modelos de requisição ---
 class RunReq(BaseModel):
@@ -110,16 +107,56 @@ class ChatReq(BaseModel):
     client: str | None = None   # "auto" permitido
     q: str
     take: int | None = 6
+    min_version: int | None = None  # exige corpus na versão >= N (ex.: corpus_version devolvido pelo /ingest)
 
 class IngestReq(BaseModel):
     client: str
     types: list[str] | None = None   # ["daily","weekly",...]
     export: str | None = "txt"       # "txt" | "csv"
+    rebuild: bool = False            # reindexação completa blue/green
+
+# --- Startup: tamanho do pool de threads (no loop do servidor; /healthz, /metrics e /jobs
+# sempre acham thread livre mesmo com LLM e Drive lotados, vagas + fila) ---
+@app.on_event("startup")
+async def _threadpool():
+    import anyio.to_thread
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADS
+    if admission.threads_needed() > THREADS // 2:
+        print(f"[warn] LLM/Drive podem prender {admission.threads_needed()} threads de {THREADS} "
+              "(reduza *_MAX_QUEUE/*_MAX_CONCURRENCY ou aumente SERVICE_THREADS)", file=sys.stderr)
+
+# --- Startup: abre o Chroma e aquece o engine em processo (Chroma/Gemini/pandas carregados uma vez) ---
+@app.on_event("startup")
+def _warmup():
+    try:
+        STORE.open()
+    except Exception as e:
+        print(f"[warn] não consegui abrir o vector store: {e}", file=sys.stderr)
+    try:
+        engine.warmup()
+    except (Exception, SystemExit) as e:
+        print(f"[warn] warmup do engine falhou: {e}", file=sys.stderr)
+    if WATCH:
+        global _WATCHER
+        from ingest_watch import RAW_DIR, Watcher
+        _WATCHER = Watcher(RAW_DIR, store=STORE).start()
+
+@app.on_event("shutdown")
+def _close_store():
+    if _WATCHER is not None:
+        _WATCHER.stop()
+    STORE.close()
+    try:
+        engine.ANSWER_CACHE.save()
+    except Exception as e:
+        print(f"[warn] não consegui persistir o cache de respostas: {e}", file=sys.stderr)
 
 # --- Rotas básicas ---
 @app.get("/healthz")
 def healthz():
-    return {"ok": True}
+    vs = STORE.health()
+    body = {"ok": vs["ok"], "vector_store": vs}
+    return body if vs["ok"] else JSONResponse(body, status_code=503)
 
 @app.get("/")
 def root():
@@ -129,7 +166,7 @@ def root():
         "docs": "Para conversar, acesse /static/chat.html (se configurado) ou use o endpoint /chat",
     }
 
-# --- /run (relatório executivo via assistant_cli.py) ---
+# --- /run (relatório executivo via engine.run; o modo RUN_MODE=subprocess é tratado lá) ---
 @app.post("/run")
 def run(req: RunReq, x_api_key: str | None = Header(None)):
     if API_KEY and x_api_key != API_KEY:
@@ -140,41 +177,46 @@ def run(req: RunReq, x_api_key: str | None = Header(None)):
     if not q:
         raise HTTPException(status_code=400, detail="empty prompt")
 
-    tmp_g = tmp_m = None
-    try:
-        if req.google_csv_url:
-            tmp_g = download_to_tmp(req.google_csv_url)
-        if req.meta_csv_url:
-            tmp_m = download_to_tmp(req.meta_csv_url)
-
-        cmd = [PY, CLI, "--client", client, "--q", q, "--take", str(req.take or 1)]
-        if req.type:
-            cmd += ["--type", req.type.strip().lower()]
-        if tmp_g:
-            cmd += ["--google_csv", tmp_g]
-        if tmp_m:
-            cmd += ["--meta_csv", tmp_m]
-
-        proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
-        md_path, md_content = latest_md_for(client)
-
+    # vagas por fase: a do Drive é devolvida antes da do LLM ser pedida (uma geração lenta
+    # não segura a vaga de Drive do cliente, que é 1)
+    limiters = {"drive": admission.DRIVE, "llm": admission.LLM}
+    with metrics.request("/run", client):
+        # CSVs de Ads: baixados em paralelo e agregados direto do stream (sem arquivo temporário)
+        if req.google_csv_url or req.meta_csv_url:
+            try:
+                with admission.DRIVE.slot(client):
+                    ads_stream.build_kpis_from_urls(client, req.google_csv_url, req.meta_csv_url)
+            except ads_stream.CsvTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            except ads_stream.CsvFetchError as e:
+                raise HTTPException(status_code=502, detail=f"falha ao baixar CSV de Ads: {e}")
+            except SystemExit as e:
+                raise HTTPException(status_code=422, detail=str(e))
+
+        res = engine.run(
+            client, q,
+            take=req.take or 1,
+            doc_type=req.type.strip().lower() if req.type else None,
+            cli_path=CLI,
+            gate=lambda phase: limiters[phase].slot(client),
+        )
         return {
-            "ok": proc.returncode == 0,
+            "ok": res["ok"],
             "client": client,
             "type_used": (req.type or "auto"),
-            "cmd": " ".join(cmd),
-            "report_path": md_path,
-            "markdown": md_content,
-            "stdout": proc.stdout,
-            "stderr": proc.stderr,
+            "run_id": res["run_id"],
+            "cmd": res["cmd"],
+            "report_path": res["report_path"],
+            "markdown": res["markdown"],
+            "timings": res["timings"],
+            "stdout": res["stdout"],
+            "stderr": res["stderr"],
         }
-    finally:
-        for p in [tmp_g, tmp_m]:
-            if p and os.path.exists(p):
-                try:
-                    os.remove(p)
-                except Exception:
-                    pass
+
+def _wait_corpus(min_version: int | None) -> None:
+    if min_version and not STORE.wait_version(min_version, timeout=WATCH_WAIT):
+        raise HTTPException(status_code=503, detail=f"corpus ainda na versão {STORE.version()} (< {min_version})",
+                            headers={"Retry-After": "5"})
 
 # --- /chat (conversa normal com detecção de cliente) ---
 @app.post("/chat")
@@ -187,43 +229,135 @@ def chat(req: ChatReq, x_api_key: str | None = Header(None)):
         return {"reply": "Pergunta vazia."}
 
     client_resolved = resolve_client(getattr(req, "client", None), q)
+    _wait_corpus(req.min_version)
 
-    script_path = os.path.join(ROOT, "ask_with_context.py")
-    cmd = [PY, script_path, "--q", q]
-    if req.take:
-        cmd += ["--take", str(req.take)]
-    # passa o cliente resolvido (se o script aceitar, filtra; se ignorar, não quebra)
-    cmd += ["--client", slugify(client_resolved)]
-
-    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
-    answer = proc.stdout.strip() or "Não há resposta disponível."
+    slug = slugify(client_resolved)
+    with metrics.request("/chat", slug), admission.LLM.slot(slug):
+        res = engine.chat(q, req.take, slug)
+    answer = res["reply"].strip() or "Não há resposta disponível."
     return {
         "client": client_resolved,
         "query": q,
         "reply": answer,
-        "stdout": proc.stdout,
-        "stderr": proc.stderr,
+        "cached": res.get("cached", False),
+        "prompt_tokens": res.get("prompt_tokens"),
+        "sources": res.get("sources", []),
+        "stdout": res["stdout"],
+        "stderr": res["stderr"],
     }
 
-# --- /ingest (pipeline Drive -> txt -> Chroma) ---
-@app.post("/ingest")
+@app.get("/cache/stats")
+def cache_stats(x_api_key: str | None = Header(None)):
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="invalid api key")
+    return {"answer_cache": engine.ANSWER_CACHE.stats(), "corpus_version": STORE.version()}
+
+# --- /metrics (Prometheus: latência por endpoint/cliente/etapa + cache, jobs e corpus) ---
+metrics.register_gauges("answer_cache", "Contadores do cache de respostas do /chat.", lambda: engine.ANSWER_CACHE.stats())
+metrics.register_gauges("jobs", "Jobs em background por status.", lambda: JOBS.stats())
+metrics.register_gauges("admission_llm", "Fila/concorrência do limitador de LLM.", lambda: admission.LLM.stats())
+metrics.register_gauges("admission_drive", "Fila/concorrência do limitador de Drive.", lambda: admission.DRIVE.stats())
+metrics.register_gauges("embed_cache", "Contadores do cache de embeddings do ingest (por modelo).",
+                        lambda: {f"{m}:{k}": v for m, st in embedding_cache.all_stats().items()
+                                 for k, v in st.items() if k != "model"})
+metrics.register_gauges("retrieve_dedup", "Dedupe de contexto na consulta (tokens antes/depois, redundantes).",
+                        lambda: near_dup.query_stats())
+metrics.register_gauges("context_packer", "Contexto do prompt: tokens enviados x chunks na íntegra, fusões e cortes.",
+                        lambda: context_packer.stats())
+metrics.register_gauges("llm", "Chamadas ao LLM: tentativas, retries, timeouts, hedges, tokens e latência (ms).",
+                        lambda: llm_client.stats())
+metrics.register_gauges("prompt_cache", "Cache do prefixo fixo por cliente: hits, tokens em cache/economizados, latência (ms).",
+                        lambda: prompt_cache.stats())
+metrics.register_gauges("corpus_version", "Versão atual do corpus no vector store.", lambda: STORE.version())
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint(x_api_key: str | None = Header(None)):
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="invalid api key")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# --- /chat/stream (mesma conversa, via Server-Sent Events) ---
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+def chat_stream(req: ChatReq, x_api_key: str | None = Header(None)):
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="invalid api key")
+
+    q = (req.q or "").strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="empty prompt")
+
+    client_resolved = resolve_client(getattr(req, "client", None), q)
+    slug = slugify(client_resolved)
+    _wait_corpus(req.min_version)
+
+    # a vaga é obtida antes de responder (para poder devolver 429) e liberada ao fim do stream
+    slot = ExitStack()
+    slot.enter_context(admission.LLM.slot(slug))
+
+    def events():
+        # fontes primeiro (latência da busca), depois os tokens conforme o modelo gera
+        try:
+            stream = engine.chat_stream(q, req.take, slug)
+            for name, payload in metrics.labeled_iter(stream, "/chat/stream", slug):
+                if name == "sources":
+                    yield _sse("sources", {"client": client_resolved, "query": q, "sources": payload})
+                elif name == "token":
+                    yield _sse("token", {"text": payload})
+                else:
+                    yield _sse("done", {"reply": payload or "Não há resposta disponível."})
+        except (Exception, SystemExit) as e:
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            slot.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # garante a liberação mesmo se o gerador nunca chegar a rodar (cliente desconectou)
+        background=BackgroundTask(slot.close),
+    )
+
+# --- /ingest (pipeline Drive -> txt -> Chroma, em background) ---
+@app.post("/ingest", status_code=202)
 def ingest(req: IngestReq, x_api_key: str | None = Header(default=None)):
     if API_KEY and x_api_key != API_KEY:
         raise HTTPException(status_code=401, detail="invalid api key")
 
-    doc_types = req.types or [
-        "daily",
-        "weekly",
-        "checkin",
-        "planejamento",
-        "replanejamento",
-        "benchmarking",
-    ]
-    for t in doc_types:
-        subprocess.run(
-            [PY, "smart_search_sa.py", "--client", req.client, "--type", t, "--export", req.export],
-            check=True,
-        )
+    doc_types = req.types or list(engine.DOC_TYPES)
+    export = req.export or "txt"
+    params = {"client": req.client, "types": doc_types, "export": export, "rebuild": req.rebuild,
+              "total_stages": len(doc_types) + 1}
+
+    def work(job):
+        # roda numa thread do pool: os rótulos das métricas são definidos aqui dentro
+        # na fila de jobs não há quem receba um 429: espera a vaga do Drive sem timeout
+        with metrics.request("/ingest", slugify(req.client)), admission.DRIVE.slot(slugify(req.client), block=True):
+            return engine.ingest(req.client, doc_types, export, job=job, rebuild=req.rebuild)
+
+    job, deduplicated = JOBS.submit("ingest", f"ingest:{slugify(req.client)}", work, params=params)
+    return {
+        "ok": True,
+        "job_id": job.id,
+        "status": job.status,
+        "deduplicated": deduplicated,
+        "client": req.client,
+        "types": job.params.get("types", doc_types),
+        "export": job.params.get("export", export),
+    }
 
-    subprocess.run([PY, "ingest_txt.py"], check=True)
-    return {"ok": True, "client": req.client, "types": doc_types, "export": req.export}
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str, x_api_key: str | None = Header(default=None)):
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="invalid api key")
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.to_dict()
+
+@app.on_event("shutdown")
+def _stop_jobs():
+    JOBS.shutdown(wait=False)
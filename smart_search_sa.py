@@ -4,13 +4,17 @@
 # Exporta o 1º resultado (opcional) como txt/csv/pdf e salva em data/raw (txt/csv) ou data/downloads (binários).
 
 from __future__ import annotations
-import os, json, re, io, argparse
+import os, json, re, io, argparse, threading
 from typing import List, Dict
 
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 from google.oauth2.service_account import Credentials
 
+import metrics
+from client_matcher import get_matcher
+from doc_meta import RAW_DIR, date_from_name, write_sidecar
+
 # -------------------- auth --------------------
 SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
 
@@ -20,6 +24,15 @@ def service_sa():
     creds = Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
     return build("drive", "v3", credentials=creds)
 
+# httplib2 não é thread-safe: um cliente "quente" por thread de trabalho
+_local = threading.local()
+
+def get_service():
+    """Cliente Drive reaproveitado na thread atual (evita refazer auth/discovery a cada busca)."""
+    if getattr(_local, "service", None) is None:
+        _local.service = service_sa()
+    return _local.service
+
 # -------------------- utils --------------------
 def esc(s: str) -> str:
     """Escapa aspas simples para usar em queries do Drive."""
@@ -162,6 +175,47 @@ def export_or_download(service, file_id: str, mime_type: str, kind: str = "txt")
         _, done = dl.next_chunk()
     return buf.getvalue(), ext
 
+def search_and_export(
+    client: str,
+    type_key: str,
+    take: int = 3,
+    export: str = "none",
+    rules_path: str = "company_rules.json",
+    service=None,
+    log=print,
+) -> str | None:
+    """Busca pelos passes de regras, lista o top `take` e exporta o 1º resultado. Retorna o caminho salvo."""
+    rules = load_rules(rules_path)
+    service = service or get_service()
+
+    with metrics.span("drive_search"):
+        files = search_passes(service, client, type_key, rules)
+    if not files:
+        log("Nada encontrado com as regras. Ajuste tokens/pastas no arquivo de regras.")
+        return None
+
+    log("Top resultados (ordenados por modifiedTime desc):")
+    for i, f in enumerate(files[: take], 1):
+        log(f"{i}. {f['name']} | {f['mimeType']} | {f['id']} | {f.get('modifiedTime')}")
+
+    if export == "none":
+        return None
+    f0 = files[0]
+    with metrics.span("drive_export"):
+        content, ext = export_or_download(service, f0["id"], f0["mimeType"], kind=export)
+    subdir = RAW_DIR if ext in {"txt", "csv"} else "data/downloads"
+    os.makedirs(subdir, exist_ok=True)
+    out_path = os.path.join(subdir, f"{sanitize(f0['name'])}.{ext}")
+    with open(out_path, "wb") as fp:
+        fp.write(content)
+    log(f"Salvo: {out_path}")
+    if ext in {"txt", "csv"}:
+        # cliente/tipo/data já conhecidos aqui: o ingest grava nos metadados dos chunks
+        canonical = get_matcher(rules_path).lookup(client) or client
+        write_sidecar(out_path, canonical, type_key,
+                      date_from_name(f0["name"]) or (f0.get("modifiedTime") or "")[:10])
+    return out_path
+
 # -------------------- CLI --------------------
 def main():
     ap = argparse.ArgumentParser(description="Busca inteligente no Drive com SA + regras por arquivo.")
@@ -187,29 +241,7 @@ def main():
     )
     args = ap.parse_args()
 
-    rules = load_rules(args.rules)
-    service = service_sa()
-
-    files = search_passes(service, args.client, args.type, rules)
-    if not files:
-        print("Nada encontrado com as regras. Ajuste tokens/pastas no arquivo de regras.")
-        return
-
-    print("Top resultados (ordenados por modifiedTime desc):")
-    for i, f in enumerate(files[: args.take], 1):
-        print(f"{i}. {f['name']} | {f['mimeType']} | {f['id']} | {f.get('modifiedTime')}")
-
-    if args.export != "none":
-        f0 = files[0]
-        content, ext = export_or_download(service, f0["id"], f0["mimeType"], kind=args.export)
-        subdir = "data/raw" if ext in {"txt", "csv"} else "data/downloads"
-        os.makedirs(subdir, exist_ok=True)
-        out_path = os.path.join(subdir, f"{sanitize(f0['name'])}.{ext}")
-        with open(out_path, "wb") as fp:
-            fp.write(content)
-        print("Salvo:", out_path)
-        if ext in {"txt", "csv"}:
-            print("Dica: rode  python .\\ingest_txt.py  para o RAG ver esse conteúdo.")
+    search_and_export(args.client, args.type, take=args.take, export=args.export, rules_path=args.rules)
 
 if __name__ == "__main__":
     main()
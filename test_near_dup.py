@@ -0,0 +1,83 @@
+# test_near_dup.py
+# Quase-duplicatas no ingest: relatórios que só diferem nos números não podem colapsar
+# (os valores de fevereiro têm de chegar ao Chroma e à busca); cópias de verdade colapsam
+# no texto mais novo, sem herdar a data de outro texto.
+#   python -m pytest -q test_near_dup.py
+
+from __future__ import annotations
+import os, sys, tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+_tmp = tempfile.mkdtemp()
+os.environ.update(TABLES_DB=os.path.join(_tmp, "tables.sqlite"), EMBED_CACHE_DIR="", INGEST_DEDUP="1")
+
+from near_dup import DedupIndex, dedupe, numbers, signature, similarity
+
+BODY = """MAP Daily - acompanhamento de mídia paga
+
+Resumo do dia: as campanhas de captação seguiram estáveis no Google e na Meta, com os mesmos
+criativos da semana anterior e sem alteração de público. O time manteve a verba distribuída
+entre pesquisa, remarketing e prospecção, conforme o planejamento aprovado com o cliente.
+
+Indicadores: CPL de R$ {cpl} no consolidado, gasto de R$ {gasto} no período, leads dentro da
+meta diária e taxa de conversão da landing page sem variação relevante. Próximos passos:
+revisar termos negativos, testar um novo título no anúncio principal e reavaliar lances."""
+
+JAN = BODY.format(cpl="12,40", gasto="3.100")
+FEB = BODY.format(cpl="15,90", gasto="4.250")
+
+def test_numbers_block_collapse():
+    assert similarity(signature(JAN), signature(FEB)) >= 0.85  # o texto é quase igual...
+    assert numbers(JAN) != numbers(FEB)                        # ...mas os valores não
+    idx = DedupIndex(os.path.join(_tmp, "unit.npz"))
+    assert idx.add("jan::chunk-000", signature(JAN), "map|daily", "jan.txt", 20250110, numbers(JAN)) == (None, None)
+    assert idx.add("feb::chunk-000", signature(FEB), "map|daily", "feb.txt", 20250210, numbers(FEB)) == (None, None)
+    docs, _ = dedupe([JAN, FEB], [{}, {}], 2)
+    assert docs == [JAN, FEB]
+
+def test_copy_collapses_into_newest():
+    idx = DedupIndex(os.path.join(_tmp, "copy.npz"))
+    sig, nums = signature(JAN), numbers(JAN)
+    assert idx.add("old::chunk-000", sig, "map|daily", "old.txt", 20250110, nums) == (None, None)
+    # cópia mais nova: assume o grupo e o canônico antigo vira duplicata dela
+    assert idx.add("new::chunk-000", sig, "map|daily", "new.txt", 20250210, nums) == (None, "old::chunk-000")
+    assert idx.is_dup("old::chunk-000") and not idx.is_dup("new::chunk-000")
+    # cópia mais velha: só referência; a data do canônico continua a dele
+    assert idx.add("older::chunk-000", sig, "map|daily", "older.txt", 20250101, nums) == ("new::chunk-000", None)
+    meta = idx.adjust("new::chunk-000", {"date": "2025-02-10", "date_int": 20250210})
+    assert meta == {"date": "2025-02-10", "date_int": 20250210, "dups": 2}
+
+def test_ingest_keeps_both_reports():
+    import vectorstore
+    from ask_with_context import retrieve
+    from bench_ingest import make_embedder
+    from doc_meta import write_sidecar
+    from ingest_txt import ingest
+
+    raw = os.path.join(_tmp, "raw")
+    os.makedirs(raw)
+    for name, text, day in (("MAP Daily 2025-01-10.txt", JAN, "2025-01-10"), ("MAP Daily 2025-02-10.txt", FEB, "2025-02-10")):
+        path = os.path.join(raw, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        write_sidecar(path, "MAP", "daily", day)
+    store = vectorstore.VectorStore(os.path.join(_tmp, "chroma"), embedding_function=make_embedder("stub"))
+    vectorstore._store = store
+    ingest(store, raw_dir=raw, log=lambda *a: None)
+
+    with store.read() as col:
+        got = col.get(include=["documents", "metadatas"])
+    stored = {m["date"]: d for d, m in zip(got["documents"], got["metadatas"])}
+    assert "R$ 12,40" in stored["2025-01-10"] and "R$ 3.100" in stored["2025-01-10"]
+    assert "R$ 15,90" in stored["2025-02-10"] and "R$ 4.250" in stored["2025-02-10"]
+
+    docs, metas = retrieve("CPL e gasto do MAP Daily", 4, "map")
+    text = "\n".join(docs)
+    assert "R$ 12,40" in text and "R$ 15,90" in text
+    assert {m["date"] for m in metas} == {"2025-01-10", "2025-02-10"}
+
+if __name__ == "__main__":
+    for fn in (test_numbers_block_collapse, test_copy_collapses_into_newest, test_ingest_keeps_both_reports):
+        fn()
+    print("ok")
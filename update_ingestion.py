@@ -26,7 +26,7 @@ def main() -> None:
 
     It runs smart_search_sa.py for each document type defined in company_rules.json,
     exporting the results as plain text, and then ingests all exported text files
-    into the Chroma DB collection using ingest_txt.py.
+    into the Chroma DB collection via ingest_watch.py --sync.
     Usage:
         python update_ingestion.py [client_name]
     If client_name is omitted, defaults to 'Start TI'.
@@ -43,8 +43,8 @@ def main() -> None:
     ]
     for t in doc_types:
         run_smart_search(client, t)
-    # After exporting, ingest all .txt files from data/raw into Chroma DB
-    subprocess.run([sys.executable, "ingest_txt.py"], check=True)
+    # After exporting, wait for the watch daemon's pass over data/raw (or ingest inline without it)
+    subprocess.run([sys.executable, "ingest_watch.py", "--sync"], check=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,271 @@
+# vectorstore.py
+# Handle único do Chroma por processo: o cliente e a coleção são abertos uma vez
+# e compartilhados por chat, run e ingest. Consultas entram como leitoras (em paralelo).
+# Reindexação completa é blue/green: grava numa coleção versionada nova e troca de forma
+# atômica o ponteiro (arquivo `active_collection`) que os leitores resolvem; versões
+# antigas ficam guardadas e as excedentes são apagadas. Um lock de arquivo enfileira
+# ingests concorrentes (inclusive de outros processos/CLI).
+
+from __future__ import annotations
+import json, os, threading, time
+from contextlib import contextmanager
+
+from filelock import FileLock
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", ".chromadb")
+COLLECTION = "workspace_knowledge"
+VERSION_FILE = "corpus_version"
+POINTER_FILE = "active_collection"
+LOCK_FILE = "ingest.lock"
+KEEP_VERSIONS = int(os.getenv("CHROMA_KEEP_VERSIONS", "2"))  # versões antigas retidas após a troca
+
+class RWLock:
+    """Lock leitores/escritor com prioridade para o escritor (o ingest não morre de fome)."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+class VectorStore:
+    def __init__(self, path: str = CHROMA_PATH, collection: str = COLLECTION, embedding_function=None):
+        self.path = path
+        self.base = collection
+        self.embedding_function = embedding_function  # None: a padrão do Chroma
+        self.name = collection  # coleção ativa (resolvida pelo ponteiro ao abrir)
+        self._open_lock = threading.Lock()
+        self._rw = RWLock()
+        self._updaters = threading.Lock()
+        self._client = None
+        self._col = None
+        self._pointer_mtime = None
+
+    def _open_client(self):
+        # Chroma compat
+        try:
+            from chromadb import PersistentClient
+            return PersistentClient(path=self.path)
+        except Exception:
+            from chromadb import Client
+            from chromadb.config import Settings
+            return Client(Settings(persist_directory=self.path))
+
+    def _get_collection(self, name: str):
+        if self.embedding_function is None:
+            return self._client.get_or_create_collection(name)
+        return self._client.get_or_create_collection(name, embedding_function=self.embedding_function)
+
+    # -------- ponteiro da coleção ativa --------
+    def _pointer_path(self) -> str:
+        return os.path.join(self.path, POINTER_FILE)
+
+    def _pointer_stat(self):
+        try:
+            return os.stat(self._pointer_path()).st_mtime_ns
+        except OSError:
+            return None
+
+    def active_name(self) -> str:
+        """Nome da coleção ativa; sem ponteiro (índice legado) é a coleção base."""
+        try:
+            with open(self._pointer_path(), "r", encoding="utf-8") as f:
+                return json.load(f)["active"]
+        except (OSError, ValueError, KeyError):
+            return self.base
+
+    def _write_pointer(self, name: str) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        final = self._pointer_path()
+        tmp = f"{final}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"active": name, "swapped_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f)
+        os.replace(tmp, final)
+
+    def open(self) -> "VectorStore":
+        """Abre cliente e coleção ativa (idempotente; reabre se o ponteiro mudou)."""
+        mtime = self._pointer_stat()
+        if self._col is None or mtime != self._pointer_mtime:
+            with self._open_lock:
+                if self._client is None:
+                    self._client = self._open_client()
+                if self._col is None or mtime != self._pointer_mtime:
+                    name = self.active_name()
+                    self._col = self._get_collection(name)
+                    self.name, self._pointer_mtime = name, mtime
+        return self
+
+    @property
+    def client(self):
+        if self._client is None:
+            self.open()
+        return self._client
+
+    def collection(self):
+        # um stat por consulta: pega a troca feita por outro processo (ex.: ingest pela CLI)
+        self.open()
+        return self._col
+
+    @contextmanager
+    def read(self):
+        """Acesso de leitura compartilhado: `with store.read() as col: col.query(...)`."""
+        with self._rw.read():
+            yield self.collection()
+
+    @contextmanager
+    def update(self):
+        """
+        Escrita incremental (upsert/delete de chunks): um atualizador por vez, mas as consultas
+        seguem em paralelo. Quem altera algo chama bump_version() para invalidar caches.
+        """
+        with self._updaters, self._rw.read():
+            yield self.collection()
+
+    def max_batch_size(self) -> int:
+        """Maior lote aceito num add/upsert (Chroma compat: método nas versões novas, atributo nas antigas)."""
+        c = self.client
+        try:
+            return int(c.get_max_batch_size())
+        except Exception:
+            return int(getattr(c, "max_batch_size", 0) or 5000)
+
+    @staticmethod
+    def embedder(col):
+        """Função de embedding da coleção (None: deixa o Chroma embedar no add/upsert)."""
+        return getattr(col, "_embedding_function", None)
+
+    def ingest_lock(self, timeout: float = -1) -> FileLock:
+        """Lock de arquivo no diretório do Chroma: ingests concorrentes esperam a vez."""
+        os.makedirs(self.path, exist_ok=True)
+        return FileLock(os.path.join(self.path, LOCK_FILE), timeout=timeout)
+
+    # -------- blue/green --------
+    def new_version_name(self) -> str:
+        t = time.time()  # AAAAMMDDHHMMSS + microssegundos: ordem lexicográfica = cronológica
+        return f"{self.base}__v{time.strftime('%Y%m%d%H%M%S', time.localtime(t))}{int(t * 1e6) % 1000000:06d}"
+
+    def _collection_names(self) -> list[str]:
+        # Chroma compat: list_collections() devolve nomes (>=0.6) ou objetos (<0.6)
+        return [getattr(c, "name", c) for c in self.client.list_collections()]
+
+    def versions(self) -> list[str]:
+        """Coleções versionadas desta base, da mais antiga para a mais nova."""
+        prefix = f"{self.base}__v"
+        return sorted(n for n in self._collection_names() if n.startswith(prefix))
+
+    def create_version(self):
+        """Cria uma coleção versionada vazia (ainda invisível para os leitores)."""
+        name = self.new_version_name()
+        self.open()
+        return name, self._get_collection(name)
+
+    def swap(self, name: str, keep: int = KEEP_VERSIONS) -> list[str]:
+        """
+        Aponta os leitores para `name` (troca atômica do arquivo ponteiro), incrementa a versão
+        do corpus e apaga as versões além das `keep` anteriores. Retorna as coleções apagadas.
+        """
+        self._write_pointer(name)
+        self.bump_version()
+        self.open()
+        old = [n for n in self.versions() if n != name]
+        if self.base in self._collection_names():
+            old.insert(0, self.base)  # índice legado sem versão é o mais antigo da fila de descarte
+        doomed = old[: max(0, len(old) - keep)]
+        if doomed:
+            # exclusivo só na hora de apagar: nenhuma consulta em voo usa um handle removido
+            with self._rw.write():
+                for n in doomed:
+                    try:
+                        self.client.delete_collection(n)
+                    except Exception:
+                        pass
+        return doomed
+
+    # -------- versão do corpus (arquivo no diretório do Chroma, visível entre processos) --------
+    def version(self) -> int:
+        try:
+            with open(os.path.join(self.path, VERSION_FILE), "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump_version(self) -> int:
+        v = self.version() + 1
+        os.makedirs(self.path, exist_ok=True)
+        final = os.path.join(self.path, VERSION_FILE)
+        tmp = f"{final}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(v))
+        os.replace(tmp, final)
+        return v
+
+    def wait_version(self, n: int, timeout: float = 30.0, interval: float = 0.2) -> bool:
+        """Barreira "corpus na versão >= n" (ex.: n devolvido por ensure_ingested). False se estourar o tempo."""
+        deadline = time.monotonic() + timeout
+        while self.version() < n:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+    def query(self, **kwargs) -> dict:
+        with self.read() as col:
+            return col.query(**kwargs)
+
+    def health(self) -> dict:
+        t0 = time.perf_counter()
+        try:
+            with self.read() as col:
+                n = col.count()
+            return {"ok": True, "collection": self.name, "count": n, "version": self.version(),
+                    "versions": len(self.versions()),
+                    "latency_ms": round((time.perf_counter() - t0) * 1000, 2)}
+        except Exception as e:
+            return {"ok": False, "collection": self.name, "error": str(e)}
+
+    def close(self) -> None:
+        with self._open_lock:
+            self._col = None
+            self._client = None
+            self._pointer_mtime = None
+
+_store: VectorStore | None = None
+_store_lock = threading.Lock()
+
+def get_store() -> VectorStore:
+    """VectorStore compartilhado do processo (o service abre no startup; CLIs abrem sob demanda)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = VectorStore()
+    return _store